@@ -0,0 +1,76 @@
+"""
+Gas per job for per-job settlement vs. the batch entry points.
+
+Deploys MockVerifier + OblivionManager on an in-process dev chain
+(eth-tester) and settles N jobs three ways:
+
+  per-job: claimJob + submitResult for every job
+  submitResultBatch: claimJob per job, then one submitResultBatch
+  claimAndSubmitBatch: one transaction for everything
+
+Run from the repository root:
+    python contracts/bench_batch_gas.py [batch sizes...]
+"""
+import os
+import sys
+
+from web3 import Web3, EthereumTesterProvider
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from deploy_contracts import compile_contract
+
+BATCH_SIZES = [int(n) for n in sys.argv[1:]] or [1, 2, 4, 8, 16, 32, 64, 100]
+REWARD = Web3.to_wei(0.01, 'ether')
+UPDATE_HASH = b'\x11' * 32
+
+w3 = Web3(EthereumTesterProvider())
+requester, worker = w3.eth.accounts[0], w3.eth.accounts[1]
+
+def deploy(file_path, contract_name, *args):
+    abi, bytecode = compile_contract(file_path, contract_name)
+    tx_hash = w3.eth.contract(abi=abi, bytecode=bytecode).constructor(*args).transact({'from': requester})
+    address = w3.eth.wait_for_transaction_receipt(tx_hash).contractAddress
+    return w3.eth.contract(address=address, abi=abi)
+
+def gas_used(tx_hash) -> int:
+    receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+    assert receipt.status == 1, "transaction reverted"
+    return receipt.gasUsed
+
+def create_jobs(manager, n: int) -> list:
+    first = manager.functions.getJobCount().call()
+    for _ in range(n):
+        manager.functions.createJob(1, "model", "data").transact({'from': requester, 'value': REWARD})
+    return list(range(first, first + n))
+
+def batch_args(job_ids: list):
+    n = len(job_ids)
+    return job_ids, [UPDATE_HASH] * n, [[] for _ in range(n)], [b""] * n
+
+def main():
+    verifier = deploy("contracts/src/MockVerifier.sol", "MockVerifier")
+    manager = deploy("contracts/src/VouchManager.sol", "OblivionManager", verifier.address)
+    manager.functions.depositStake().transact({'from': worker, 'value': Web3.to_wei(100, 'ether')})
+    fn = manager.functions
+
+    print(f"{'batch':>6} {'per-job':>10} {'submitBatch':>12} {'claim+submit':>13} {'saving':>8}   (gas per job)")
+    for n in BATCH_SIZES:
+        jobs = create_jobs(manager, n)
+        single = sum(
+            gas_used(fn.claimJob(j).transact({'from': worker})) +
+            gas_used(fn.submitResult(j, UPDATE_HASH, [], b"").transact({'from': worker}))
+            for j in jobs
+        ) / n
+
+        jobs = create_jobs(manager, n)
+        claims = sum(gas_used(fn.claimJob(j).transact({'from': worker})) for j in jobs)
+        submit_batch = (claims + gas_used(fn.submitResultBatch(*batch_args(jobs)).transact({'from': worker}))) / n
+
+        jobs = create_jobs(manager, n)
+        claim_and_submit = gas_used(fn.claimAndSubmitBatch(*batch_args(jobs)).transact({'from': worker})) / n
+
+        saving = 1 - claim_and_submit / single
+        print(f"{n:>6} {single:>10.0f} {submit_batch:>12.0f} {claim_and_submit:>13.0f} {saving:>7.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 from web3 import Web3
 from dotenv import load_dotenv
@@ -24,28 +25,42 @@ if len(code) <= 2:
     print("You need to redeploy the contract.")
 else:
     print("\n✅ Contract is deployed!")
-    
+
     # Try to call a read function
     # Load ABI
     with open("web/app/lib/abi.json", "r") as f:
         abi = json.load(f)
-    
+
     contract = w3.eth.contract(address=CONTRACT_ADDRESS, abi=abi)
-    
+
     try:
         job_count = contract.functions.jobCount().call()
         print(f"Job count: {job_count}")
     except Exception as e:
         print(f"Error calling jobCount: {e}")
-    
+
     try:
         min_reward = contract.functions.minReward().call()
         print(f"Min reward: {w3.from_wei(min_reward, 'ether')} MATIC")
     except Exception as e:
         print(f"Error calling minReward: {e}")
-        
+
     try:
         min_stake = contract.functions.minStake().call()
         print(f"Min stake: {w3.from_wei(min_stake, 'ether')} MATIC")
     except Exception as e:
         print(f"Error calling minStake: {e}")
+
+    # Job state from the local event index instead of one getJob() call per job
+    try:
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "node-client"))
+        from chain_index import ChainIndex, STATUS_NAMES
+
+        index = ChainIndex(w3, contract)
+        new_events = index.sync()
+        print(f"\nIndexed events up to block {index.last_block} ({new_events} read this run)")
+        print(f"Jobs by status: {index.status_counts()}")
+        for job in index.jobs(limit=5):
+            print(f"  Job {job['job_id']}: {STATUS_NAMES[job['status']]} provider={job['provider']}")
+    except Exception as e:
+        print(f"Error reading job index: {e}")
@@ -10,19 +10,15 @@ load_dotenv(dotenv_path=".env")
 
 RPC_URL = os.environ.get("RPC_URL")
 PRIVATE_KEY = os.environ.get("PRIVATE_KEY")
+SOLC_VERSION = "0.8.17"
 
-if not RPC_URL or not PRIVATE_KEY:
-    print("Error: RPC_URL or PRIVATE_KEY not found in contracts/src/.env")
-    exit()
+# Set up in main, so compile_contract can be imported (e.g. by bench_batch_gas.py)
+w3 = None
+account = None
 
-w3 = Web3(Web3.HTTPProvider(RPC_URL))
-w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
-
-account = w3.eth.account.from_key(PRIVATE_KEY)
-
-def deploy_contract(file_path, contract_name, constructor_args=None):
-    print(f"\n[*] Compiling {contract_name}...")
-    install_solc("0.8.17")
+def compile_contract(file_path, contract_name):
+    """Compile one contract. Returns (abi, bytecode)."""
+    install_solc(SOLC_VERSION)
     
     with open(file_path, "r") as file:
         source_code = file.read()
@@ -37,11 +33,16 @@ def deploy_contract(file_path, contract_name, constructor_args=None):
                 }
             },
         },
-        solc_version="0.8.17",
+        solc_version=SOLC_VERSION,
     )
 
     bytecode = compiled_sol["contracts"][file_path][contract_name]["evm"]["bytecode"]["object"]
     abi = compiled_sol["contracts"][file_path][contract_name]["abi"]
+    return abi, bytecode
+
+def deploy_contract(file_path, contract_name, constructor_args=None):
+    print(f"\n[*] Compiling {contract_name}...")
+    abi, bytecode = compile_contract(file_path, contract_name)
 
     print(f"[*] Deploying {contract_name} to {RPC_URL}...")
     Contract = w3.eth.contract(abi=abi, bytecode=bytecode)
@@ -77,6 +78,15 @@ def deploy_contract(file_path, contract_name, constructor_args=None):
     return tx_receipt.contractAddress
 
 if __name__ == "__main__":
+    if not RPC_URL or not PRIVATE_KEY:
+        print("Error: RPC_URL or PRIVATE_KEY not found in contracts/src/.env")
+        exit()
+
+    w3 = Web3(Web3.HTTPProvider(RPC_URL))
+    w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
+
+    account = w3.eth.account.from_key(PRIVATE_KEY)
+
     try:
         # 1. Deploy MockVerifier
         verifier_address = deploy_contract("contracts/src/MockVerifier.sol", "MockVerifier")
@@ -84,6 +94,11 @@ if __name__ == "__main__":
         # 2. Deploy OblivionManager
         manager_address = deploy_contract("contracts/src/VouchManager.sol", "OblivionManager", [verifier_address])
         
+        # Workers use claimAndSubmitBatch when the deployed code has it
+        manager_abi, _ = compile_contract("contracts/src/VouchManager.sol", "OblivionManager")
+        manager = w3.eth.contract(address=manager_address, abi=manager_abi)
+        print(f"[+] Batch settlement enabled (MAX_BATCH_SIZE = {manager.functions.MAX_BATCH_SIZE().call()})")
+        
         print("\n" + "="*50)
         print(f"DEPLOYMENT SUCCESSFUL")
         print(f"Verifier: {verifier_address}")
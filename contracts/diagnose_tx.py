@@ -2,6 +2,7 @@
 OBLIVION Deep Transaction Diagnostic Tool - File Output Version
 """
 import os
+import sys
 import json
 from web3 import Web3
 from web3.middleware import ExtraDataToPOAMiddleware
@@ -81,6 +82,21 @@ try:
 except Exception as e:
     log(f"    INFO: owner() not accessible: {e}")
 
+# 5b. Indexed job state (local cache of contract events)
+log("\n[5b] Syncing Job Index...")
+try:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "node-client"))
+    from chain_index import ChainIndex, STATUS_NAMES
+
+    index = ChainIndex(w3, contract)
+    new_events = index.sync()
+    log(f"    OK: Indexed to block {index.last_block} ({new_events} events read)")
+    log(f"    Jobs by status: {index.status_counts()}")
+    for job in index.jobs(provider=account.address, limit=5):
+        log(f"    Job {job['job_id']} (ours): {STATUS_NAMES[job['status']]}")
+except Exception as e:
+    log(f"    INFO: Job index unavailable: {e}")
+
 # 6. Simulate Transaction
 log("\n[6] Simulating createJob Transaction...")
 test_model = "ipfs://test"
@@ -16,6 +16,7 @@ interface IVerifier {
  *         - Job timeout mechanism
  *         - Input validation
  *         - ZK verification for both job types
+ *         - Batched claim/submit with a single payout transfer
  */
 contract OblivionManager {
     IVerifier public verifier;
@@ -30,6 +31,9 @@ contract OblivionManager {
     uint256 public constant INFERENCE_TIMEOUT = 1 hours;
     uint256 public constant TRAINING_TIMEOUT = 24 hours;
 
+    // Upper bound on jobs per batch call, keeps batches well under the block gas limit
+    uint256 public constant MAX_BATCH_SIZE = 100;
+
     enum JobType { Inference, Training }
     enum JobStatus { Pending, Processing, Completed, Cancelled, Slashed, Expired }
 
@@ -149,21 +153,7 @@ contract OblivionManager {
     }
 
     function claimJob(uint256 _jobId) external nonReentrant validJobId(_jobId) {
-        Job storage job = jobs[_jobId];
-        require(job.status == JobStatus.Pending, "Job not pending");
-        require(msg.sender != job.requester, "Requester cannot claim own job");
-        
-        uint256 requiredStake = job.reward / 2;
-        require(workerStakes[msg.sender] >= requiredStake, "Insufficient stake (50% of reward required)");
-
-        // Effects
-        job.provider = msg.sender;
-        job.status = JobStatus.Processing;
-        job.stake = requiredStake;
-        job.claimedAt = block.timestamp;
-        workerStakes[msg.sender] -= requiredStake;
-
-        emit JobProcessing(_jobId, msg.sender);
+        _claim(_jobId);
     }
 
     function submitResult(
@@ -172,27 +162,61 @@ contract OblivionManager {
         uint256[] calldata _pubInputs,
         bytes calldata _proof
     ) external nonReentrant validJobId(_jobId) {
-        Job storage job = jobs[_jobId];
-        require(job.provider == msg.sender, "Not assigned provider");
-        require(job.status == JobStatus.Processing, "Not in processing");
-        require(!_isJobExpired(job), "Job has expired");
+        uint256 totalPayout = _complete(_jobId, _updateHash, _pubInputs, _proof);
+        
+        // Interaction
+        (bool success, ) = payable(msg.sender).call{value: totalPayout}("");
+        require(success, "Payout failed");
+    }
 
-        // Verify ZK proof for both job types (production requirement)
-        // For training jobs, proof validates correct gradient computation
-        // For inference jobs, proof validates correct model execution
-        bool proofValid = verifier.verify(_pubInputs, _proof);
-        require(proofValid, "Invalid ZK proof");
+    /**
+     * @dev Submit results for several jobs already claimed by the caller.
+     *      All-or-nothing: one invalid job reverts the whole batch.
+     *      Rewards and stakes are paid out in a single transfer.
+     */
+    function submitResultBatch(
+        uint256[] calldata _jobIds,
+        bytes32[] calldata _updateHashes,
+        uint256[][] calldata _pubInputs,
+        bytes[] calldata _proofs
+    ) external nonReentrant {
+        _checkBatch(_jobIds.length, _updateHashes.length, _pubInputs.length, _proofs.length);
+
+        uint256 totalPayout = 0;
+        for (uint256 i = 0; i < _jobIds.length; i++) {
+            require(_jobIds[i] < jobs.length, "Invalid job ID");
+            totalPayout += _complete(_jobIds[i], _updateHashes[i], _pubInputs[i], _proofs[i]);
+        }
+
+        // Interaction
+        (bool success, ) = payable(msg.sender).call{value: totalPayout}("");
+        require(success, "Payout failed");
+    }
+
+    /**
+     * @dev Claim (where still pending) and complete several jobs in one call,
+     *      for workers that finish jobs before settling them on-chain.
+     */
+    function claimAndSubmitBatch(
+        uint256[] calldata _jobIds,
+        bytes32[] calldata _updateHashes,
+        uint256[][] calldata _pubInputs,
+        bytes[] calldata _proofs
+    ) external nonReentrant {
+        _checkBatch(_jobIds.length, _updateHashes.length, _pubInputs.length, _proofs.length);
+
+        uint256 totalPayout = 0;
+        for (uint256 i = 0; i < _jobIds.length; i++) {
+            require(_jobIds[i] < jobs.length, "Invalid job ID");
+            if (jobs[_jobIds[i]].status == JobStatus.Pending) {
+                _claim(_jobIds[i]);
+            }
+            totalPayout += _complete(_jobIds[i], _updateHashes[i], _pubInputs[i], _proofs[i]);
+        }
 
-        // Effects before interactions
-        job.status = JobStatus.Completed;
-        uint256 totalPayout = job.reward + job.stake;
-        workerReputation[msg.sender] += 1;
-        
         // Interaction
         (bool success, ) = payable(msg.sender).call{value: totalPayout}("");
         require(success, "Payout failed");
-        
-        emit JobCompleted(_jobId, msg.sender, _updateHash);
     }
 
     // Legacy function name for backwards compatibility
@@ -266,6 +290,59 @@ contract OblivionManager {
 
     // ============ Internal Functions ============
 
+    function _claim(uint256 _jobId) internal {
+        Job storage job = jobs[_jobId];
+        require(job.status == JobStatus.Pending, "Job not pending");
+        require(msg.sender != job.requester, "Requester cannot claim own job");
+        
+        uint256 requiredStake = job.reward / 2;
+        require(workerStakes[msg.sender] >= requiredStake, "Insufficient stake (50% of reward required)");
+
+        // Effects
+        job.provider = msg.sender;
+        job.status = JobStatus.Processing;
+        job.stake = requiredStake;
+        job.claimedAt = block.timestamp;
+        workerStakes[msg.sender] -= requiredStake;
+
+        emit JobProcessing(_jobId, msg.sender);
+    }
+
+    /**
+     * @dev Checks and effects of completing a job. Returns the payout owed to
+     *      the caller; the transfer is left to the external function.
+     */
+    function _complete(
+        uint256 _jobId,
+        bytes32 _updateHash,
+        uint256[] calldata _pubInputs,
+        bytes calldata _proof
+    ) internal returns (uint256) {
+        Job storage job = jobs[_jobId];
+        require(job.provider == msg.sender, "Not assigned provider");
+        require(job.status == JobStatus.Processing, "Not in processing");
+        require(!_isJobExpired(job), "Job has expired");
+
+        // Verify ZK proof for both job types (production requirement)
+        // For training jobs, proof validates correct gradient computation
+        // For inference jobs, proof validates correct model execution
+        bool proofValid = verifier.verify(_pubInputs, _proof);
+        require(proofValid, "Invalid ZK proof");
+
+        // Effects before interactions
+        job.status = JobStatus.Completed;
+        workerReputation[msg.sender] += 1;
+        
+        emit JobCompleted(_jobId, msg.sender, _updateHash);
+        return job.reward + job.stake;
+    }
+
+    function _checkBatch(uint256 _jobs, uint256 _hashes, uint256 _inputs, uint256 _proofs) internal pure {
+        require(_jobs > 0, "Empty batch");
+        require(_jobs <= MAX_BATCH_SIZE, "Batch too large");
+        require(_jobs == _hashes && _jobs == _inputs && _jobs == _proofs, "Batch length mismatch");
+    }
+
     function _isJobExpired(Job storage job) internal view returns (bool) {
         if (job.status != JobStatus.Processing) return false;
         uint256 timeout = getTimeout(job.jobType);
@@ -0,0 +1,197 @@
+-- ============================================
+-- Federated Aggregation
+-- Schema used by node-client/aggregator.py
+-- ============================================
+
+-- Training samples behind each update, used to weight FedAvg
+ALTER TABLE public.worker_updates ADD COLUMN IF NOT EXISTS num_samples INTEGER;
+
+-- ============================================
+-- Aggregation State: what has already been folded into each global model
+-- ============================================
+CREATE TABLE IF NOT EXISTS public.aggregation_state (
+    job_id BIGINT PRIMARY KEY REFERENCES public.jobs(id) ON DELETE CASCADE,
+    last_update_id BIGINT NOT NULL DEFAULT 0, -- Cursor: updates up to this id are folded in or rejected
+    updates_aggregated INTEGER NOT NULL DEFAULT 0,
+    global_model_url TEXT,
+    aggregated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Online aggregation: running FedAvg sum kept in storage between updates
+ALTER TABLE public.aggregation_state ADD COLUMN IF NOT EXISTS weight_total DOUBLE PRECISION NOT NULL DEFAULT 0;
+ALTER TABLE public.aggregation_state ADD COLUMN IF NOT EXISTS state_path TEXT; -- Object in the aggregator-state bucket
+ALTER TABLE public.aggregation_state ADD COLUMN IF NOT EXISTS is_final BOOLEAN NOT NULL DEFAULT FALSE; -- Published after the job completed
+
+ALTER TABLE public.aggregation_state ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Aggregation State: Public read" ON public.aggregation_state;
+CREATE POLICY "Aggregation State: Public read" ON public.aggregation_state
+  FOR SELECT TO anon, authenticated USING (true);
+
+-- ============================================
+-- Aggregation Queue: jobs that may need (re-)aggregation
+-- Filled by triggers, drained by the aggregator, so nothing rescans job history
+-- ============================================
+CREATE TABLE IF NOT EXISTS public.aggregation_queue (
+    job_id BIGINT PRIMARY KEY REFERENCES public.jobs(id) ON DELETE CASCADE,
+    enqueued_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_aggregation_queue_enqueued ON public.aggregation_queue(enqueued_at);
+
+ALTER TABLE public.aggregation_queue ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION public.enqueue_aggregation()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+    INSERT INTO public.aggregation_queue (job_id)
+    VALUES (CASE WHEN TG_TABLE_NAME = 'worker_updates' THEN NEW.job_id ELSE NEW.id END)
+    ON CONFLICT (job_id) DO NOTHING;
+    RETURN NEW;
+END;
+$$;
+
+-- New worker update arrived
+DROP TRIGGER IF EXISTS trg_worker_updates_enqueue_aggregation ON public.worker_updates;
+CREATE TRIGGER trg_worker_updates_enqueue_aggregation
+    AFTER INSERT ON public.worker_updates
+    FOR EACH ROW
+    WHEN (NEW.job_id IS NOT NULL)
+    EXECUTE FUNCTION public.enqueue_aggregation();
+
+-- Training job finished
+DROP TRIGGER IF EXISTS trg_jobs_enqueue_aggregation ON public.jobs;
+CREATE TRIGGER trg_jobs_enqueue_aggregation
+    AFTER UPDATE OF status ON public.jobs
+    FOR EACH ROW
+    WHEN (NEW.status = 'completed' AND OLD.status IS DISTINCT FROM 'completed' AND NEW.job_type = 'training')
+    EXECUTE FUNCTION public.enqueue_aggregation();
+
+-- ============================================
+-- Dequeue up to p_limit jobs and return the training jobs with work to do:
+-- updates newer than the last aggregation, or a completion that hasn't
+-- been published as the final model yet. Jobs with nothing new are dropped;
+-- the next update or completion re-enqueues them.
+-- ============================================
+DROP FUNCTION IF EXISTS public.claim_aggregation_batch(INT);
+
+CREATE OR REPLACE FUNCTION public.claim_aggregation_batch(
+    p_limit INT DEFAULT 20
+)
+RETURNS TABLE(
+    job_id BIGINT,
+    job_status TEXT,
+    update_count BIGINT,
+    max_update_id BIGINT,
+    last_update_id BIGINT,
+    state_path TEXT
+)
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+    RETURN QUERY
+    WITH dequeued AS (
+        DELETE FROM public.aggregation_queue q
+        WHERE q.job_id IN (
+            SELECT aq.job_id
+            FROM public.aggregation_queue aq
+            ORDER BY aq.enqueued_at
+            LIMIT p_limit
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING q.job_id
+    ),
+    counts AS (
+        SELECT u.job_id, COUNT(*) AS update_count, MAX(u.id) AS max_update_id
+        FROM public.worker_updates u
+        JOIN dequeued d ON d.job_id = u.job_id
+        GROUP BY u.job_id
+    )
+    SELECT c.job_id, j.status, c.update_count, c.max_update_id,
+           COALESCE(a.last_update_id, 0), a.state_path
+    FROM counts c
+    JOIN public.jobs j ON j.id = c.job_id
+    LEFT JOIN public.aggregation_state a ON a.job_id = c.job_id
+    WHERE j.job_type = 'training'
+      AND j.status NOT IN ('failed', 'cancelled', 'expired', 'slashed')
+      AND (c.max_update_id > COALESCE(a.last_update_id, 0)
+           -- A lower id that committed late, or an update still waiting for a retry
+           OR c.update_count > COALESCE(a.updates_aggregated, 0)
+           OR (j.status = 'completed' AND NOT COALESCE(a.is_final, FALSE)));
+END;
+$$;
+
+-- ============================================
+-- Record an aggregation step. p_global_model_url is NULL when updates were
+-- only folded into the running sum without publishing a model.
+-- ============================================
+DROP FUNCTION IF EXISTS public.mark_job_aggregated(BIGINT, BIGINT, INT, TEXT);
+
+CREATE OR REPLACE FUNCTION public.mark_job_aggregated(
+    p_job_id BIGINT,
+    p_last_update_id BIGINT,
+    p_updates_aggregated INT,
+    p_global_model_url TEXT,
+    p_weight_total DOUBLE PRECISION DEFAULT 0,
+    p_state_path TEXT DEFAULT NULL,
+    p_is_final BOOLEAN DEFAULT TRUE
+)
+RETURNS VOID
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+    INSERT INTO public.aggregation_state (job_id, last_update_id, updates_aggregated, global_model_url,
+                                          weight_total, state_path, is_final, aggregated_at)
+    VALUES (p_job_id, p_last_update_id, p_updates_aggregated, p_global_model_url,
+            p_weight_total, p_state_path, p_is_final, NOW())
+    ON CONFLICT (job_id) DO UPDATE
+    SET last_update_id = EXCLUDED.last_update_id, -- Cursor; stays below updates that must be retried
+        updates_aggregated = EXCLUDED.updates_aggregated,
+        global_model_url = COALESCE(EXCLUDED.global_model_url, public.aggregation_state.global_model_url),
+        weight_total = EXCLUDED.weight_total,
+        state_path = COALESCE(EXCLUDED.state_path, public.aggregation_state.state_path),
+        is_final = EXCLUDED.is_final,
+        aggregated_at = NOW();
+    
+    IF p_global_model_url IS NOT NULL THEN
+        UPDATE public.jobs
+        SET result_url = p_global_model_url
+        WHERE id = p_job_id;
+    END IF;
+END;
+$$;
+
+-- Put a job back on the queue (e.g. after a failed aggregation)
+CREATE OR REPLACE FUNCTION public.requeue_aggregation(p_job_id BIGINT)
+RETURNS VOID
+LANGUAGE sql
+SECURITY DEFINER
+AS $$
+    INSERT INTO public.aggregation_queue (job_id) VALUES (p_job_id)
+    ON CONFLICT (job_id) DO NOTHING;
+$$;
+
+-- Aggregator only: these bypass RLS (mark_job_aggregated sets result_url on
+-- completed jobs), so the aggregator must connect with the service_role key
+REVOKE ALL ON FUNCTION public.claim_aggregation_batch(INT) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.mark_job_aggregated(BIGINT, BIGINT, INT, TEXT, DOUBLE PRECISION, TEXT, BOOLEAN) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.requeue_aggregation(BIGINT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.claim_aggregation_batch(INT) TO service_role;
+GRANT EXECUTE ON FUNCTION public.mark_job_aggregated(BIGINT, BIGINT, INT, TEXT, DOUBLE PRECISION, TEXT, BOOLEAN) TO service_role;
+GRANT EXECUTE ON FUNCTION public.requeue_aggregation(BIGINT) TO service_role;
+
+-- Backfill: queue completed training jobs that were never aggregated
+INSERT INTO public.aggregation_queue (job_id)
+SELECT j.id
+FROM public.jobs j
+WHERE j.status = 'completed'
+  AND j.job_type = 'training'
+  AND NOT EXISTS (SELECT 1 FROM public.aggregation_state a WHERE a.job_id = j.id)
+ON CONFLICT (job_id) DO NOTHING;
+
+SELECT 'Aggregation schema updated successfully' as result;
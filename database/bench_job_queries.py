@@ -0,0 +1,190 @@
+"""
+Latency of the hot job queries before and after database/job_indexes.sql.
+
+Seeds a scratch schema (`bench` by default) with the jobs and
+worker_updates tables from schema.sql and their original indexes, fills
+it server-side with generate_series (10M jobs by default, mostly
+completed, a small pending tail), times each query, applies
+job_indexes.sql to the scratch tables and times them again.
+
+Needs a Postgres you can create schemas in (a local or branch database, not
+production) and psycopg 3:
+    pip install "psycopg[binary]"
+    DATABASE_URL=postgresql://... python database/bench_job_queries.py [--rows 10000000]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import psycopg
+
+MIGRATION = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'job_indexes.sql')
+
+TABLES = """
+CREATE TABLE {s}.jobs (
+  id bigint generated by default as identity primary key,
+  created_at timestamp with time zone default now() not null,
+  requester_address text not null,
+  job_type text not null,
+  status text default 'pending',
+  provider_address text,
+  script_url text,
+  dataset_url text,
+  result_url text,
+  inference_result text
+);
+CREATE INDEX idx_jobs_status ON {s}.jobs(status);
+CREATE INDEX idx_jobs_type ON {s}.jobs(job_type);
+CREATE INDEX idx_jobs_requester ON {s}.jobs(requester_address);
+CREATE INDEX idx_jobs_provider ON {s}.jobs(provider_address);
+CREATE INDEX idx_jobs_created ON {s}.jobs(created_at desc);
+
+CREATE TABLE {s}.worker_updates (
+  id bigint generated by default as identity primary key,
+  job_id bigint references {s}.jobs(id) on delete cascade,
+  worker_address text not null,
+  update_hash text not null,
+  update_url text,
+  num_samples integer,
+  created_at timestamp with time zone default now()
+);
+CREATE INDEX idx_worker_updates_job ON {s}.worker_updates(job_id);
+CREATE INDEX idx_worker_updates_worker ON {s}.worker_updates(worker_address);
+"""
+
+# Jobs are spread over a year; the newest `pending` fraction is still pending,
+# the rest are completed/failed training and inference jobs from 200 requesters.
+SEED = ["""
+INSERT INTO {s}.jobs (created_at, requester_address, job_type, status, provider_address, script_url, dataset_url)
+SELECT now() - interval '365 days' * (1 - g::float8 / %(rows)s),
+       '0xrequester' || (g %% 200),
+       CASE WHEN g %% 4 = 0 THEN 'inference' ELSE 'training' END,
+       CASE WHEN g > %(rows)s * (1 - %(pending)s) THEN 'pending'
+            WHEN g %% 50 = 0 THEN 'failed'
+            ELSE 'completed' END,
+       CASE WHEN g > %(rows)s * (1 - %(pending)s) THEN NULL ELSE 'node-' || (g %% 500) END,
+       'https://example.com/script.py', 'https://example.com/data.csv'
+FROM generate_series(1, %(rows)s) g
+""", """
+INSERT INTO {s}.worker_updates (job_id, worker_address, update_hash, update_url, num_samples)
+SELECT j, 'node-' || (j * 7 + k) %% 500, md5(j::text || k::text), 'https://example.com/u.bin', 100
+FROM generate_series(1, %(rows)s, %(update_stride)s) j, generate_series(1, 4) k
+"""]
+
+# name -> SQL; %(...)s values are picked from the seeded data
+QUERIES = {
+    'pending head (claim)':
+        "SELECT * FROM {s}.jobs WHERE status = 'pending' ORDER BY created_at, id LIMIT 5",
+    'pending keyset page':
+        "SELECT * FROM {s}.jobs WHERE status = 'pending' AND (created_at, id) > (%(pending_at)s, %(pending_id)s) "
+        "ORDER BY created_at, id LIMIT 5",
+    'updates count by job':
+        "SELECT count(*) FROM {s}.worker_updates WHERE job_id = %(job_id)s",
+    'updates keyset by job':
+        "SELECT * FROM {s}.worker_updates WHERE job_id = %(job_id)s AND id > 0 ORDER BY id LIMIT 1000",
+    'completed training scan':
+        "SELECT id FROM {s}.jobs WHERE status = 'completed' AND job_type = 'training' AND id > %(mid_id)s ORDER BY id LIMIT 1000",
+    'dashboard newest 50':
+        "SELECT * FROM {s}.jobs ORDER BY created_at DESC, id DESC LIMIT 50",
+    'dashboard page (cursor)':
+        "SELECT * FROM {s}.jobs WHERE (created_at, id) < (%(mid_at)s, %(mid_id)s) ORDER BY created_at DESC, id DESC LIMIT 50",
+    'network view (live jobs)':
+        "SELECT id, status, provider_address FROM {s}.jobs WHERE status IN ('processing', 'pending')",
+    'requester history':
+        "SELECT * FROM {s}.jobs WHERE requester_address = '0xrequester7' ORDER BY created_at DESC LIMIT 50",
+}
+
+def time_query(conn, sql: str, params: dict, repeat: int):
+    """(median ms, top plan node) over `repeat` warm runs."""
+    with conn.cursor() as cur:
+        cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cur.fetchone()[0][0]['Plan']
+        while plan.get('Plans') and plan['Node Type'] in ('Limit', 'Aggregate', 'Sort', 'Gather', 'Gather Merge'):
+            plan = plan['Plans'][0]
+        node = plan['Node Type'] + (f" {plan['Index Name']}" if 'Index Name' in plan else '')
+        cur.execute(sql, params)  # Warm the cache
+        cur.fetchall()
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            cur.execute(sql, params)
+            cur.fetchall()
+            samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), node
+
+def run_queries(conn, schema: str, params: dict, repeat: int) -> dict:
+    return {name: time_query(conn, sql.format(s=schema), params, repeat) for name, sql in QUERIES.items()}
+
+def sql_statements(script: str) -> list:
+    """Split a migration into statements the way psql runs them (skipping psql meta-commands)."""
+    statements, current, in_body = [], [], False
+    for line in script.splitlines():
+        if not current and (line.startswith('\\') or line.startswith('--') or not line.strip()):
+            continue
+        current.append(line)
+        in_body ^= line.count('$$') % 2 == 1
+        if not in_body and line.rstrip().endswith(';'):
+            statements.append('\n'.join(current))
+            current = []
+    return statements
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=10_000_000, help='jobs to seed')
+    parser.add_argument('--pending', type=float, default=0.001, help='fraction of jobs still pending')
+    parser.add_argument('--updates-every', type=int, default=10, help='every Nth job gets 4 worker updates')
+    parser.add_argument('--repeat', type=int, default=20, help='timed runs per query')
+    parser.add_argument('--schema', default='bench')
+    parser.add_argument('--keep', action='store_true', help='leave the scratch schema in place')
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        sys.exit("Set DATABASE_URL to a scratch Postgres database")
+    s = args.schema
+
+    with psycopg.connect(dsn, autocommit=True) as conn:
+        print(f"[*] Seeding {s}.jobs with {args.rows:,} rows ({args.pending:.2%} pending)...")
+        started = time.perf_counter()
+        conn.execute(f"DROP SCHEMA IF EXISTS {s} CASCADE")
+        conn.execute(f"CREATE SCHEMA {s}")
+        conn.execute(TABLES.format(s=s))
+        seed_params = {'rows': args.rows, 'pending': args.pending, 'update_stride': args.updates_every}
+        for statement in SEED:
+            conn.execute(statement.format(s=s), seed_params)
+        conn.execute(f"VACUUM ANALYZE {s}.jobs")
+        conn.execute(f"VACUUM ANALYZE {s}.worker_updates")
+        print(f"    - Seeded in {time.perf_counter() - started:.0f}s")
+
+        row = conn.execute(f"SELECT created_at, id FROM {s}.jobs WHERE status = 'pending' "
+                           f"ORDER BY created_at, id OFFSET %s LIMIT 1",
+                           (max(0, int(args.rows * args.pending) // 2),)).fetchone()
+        mid = conn.execute(f"SELECT created_at, id FROM {s}.jobs WHERE id = %s", (args.rows // 2,)).fetchone()
+        params = {'pending_at': row[0], 'pending_id': row[1], 'mid_at': mid[0], 'mid_id': mid[1],
+                  'job_id': (args.rows // 2) // args.updates_every * args.updates_every + 1}
+
+        print("[*] Timing queries with the schema.sql indexes...")
+        before = run_queries(conn, s, params, args.repeat)
+
+        print("[*] Applying job_indexes.sql...")
+        with open(MIGRATION) as f:
+            for statement in sql_statements(f.read().replace('public.', f'{s}.')):
+                conn.execute(statement)  # One at a time: CREATE INDEX CONCURRENTLY can't share a transaction
+        conn.execute(f"VACUUM ANALYZE {s}.jobs")
+        conn.execute(f"VACUUM ANALYZE {s}.worker_updates")
+
+        print("[*] Timing queries with job_indexes.sql...")
+        after = run_queries(conn, s, params, args.repeat)
+
+        print(f"\n{'query':<28} {'before ms':>10} {'after ms':>10} {'speedup':>8}   plan after")
+        for name in QUERIES:
+            (b, _), (a, node) = before[name], after[name]
+            print(f"{name:<28} {b:>10.3f} {a:>10.3f} {b / a if a else 0:>7.1f}x   {node}")
+
+        if not args.keep:
+            conn.execute(f"DROP SCHEMA {s} CASCADE")
+
+if __name__ == '__main__':
+    main()
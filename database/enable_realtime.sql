@@ -0,0 +1,26 @@
+-- ============================================
+-- Realtime Job Dispatch
+-- Publishes job and worker update changes over Supabase Realtime so workers
+-- are woken by events instead of polling the jobs table
+-- ============================================
+
+-- Add tables to the realtime publication (skip if already a member)
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_publication_tables
+        WHERE pubname = 'supabase_realtime' AND schemaname = 'public' AND tablename = 'jobs'
+    ) THEN
+        ALTER PUBLICATION supabase_realtime ADD TABLE public.jobs;
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_publication_tables
+        WHERE pubname = 'supabase_realtime' AND schemaname = 'public' AND tablename = 'worker_updates'
+    ) THEN
+        ALTER PUBLICATION supabase_realtime ADD TABLE public.worker_updates;
+    END IF;
+END;
+$$;
+
+SELECT 'Realtime job dispatch enabled' as result;
@@ -13,10 +13,262 @@ ALTER TABLE public.nodes ADD COLUMN IF NOT EXISTS worker_type TEXT DEFAULT 'brow
 ALTER TABLE public.jobs ADD COLUMN IF NOT EXISTS assignment_attempts INTEGER DEFAULT 0;
 ALTER TABLE public.jobs ADD COLUMN IF NOT EXISTS preferred_worker TEXT;
 ALTER TABLE public.jobs ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE public.jobs ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP WITH TIME ZONE;
+
+-- Resource requirements, set by the submitter (NULL = no requirement)
+ALTER TABLE public.jobs ADD COLUMN IF NOT EXISTS est_flops DOUBLE PRECISION; -- Estimated floating point operations for the whole job
+ALTER TABLE public.jobs ADD COLUMN IF NOT EXISTS min_memory_mb INTEGER; -- Working memory the job needs
+ALTER TABLE public.jobs ADD COLUMN IF NOT EXISTS model_size_mb INTEGER; -- Size of the model weights it loads
+ALTER TABLE public.jobs ADD COLUMN IF NOT EXISTS requires_gpu BOOLEAN DEFAULT FALSE;
+ALTER TABLE public.jobs ADD COLUMN IF NOT EXISTS worker_types TEXT[]; -- Worker types allowed to run it
+
+-- Bloom hash words of the job's artifact URLs, set by trg_jobs_set_bloom_words
+ALTER TABLE public.jobs ADD COLUMN IF NOT EXISTS script_bloom_words BIGINT[];
+ALTER TABLE public.jobs ADD COLUMN IF NOT EXISTS dataset_bloom_words BIGINT[];
+ALTER TABLE public.jobs ADD COLUMN IF NOT EXISTS model_bloom_words BIGINT[];
+
+-- Capabilities, advertised by workers when they register and heartbeat (NULL = unknown)
+ALTER TABLE public.nodes ADD COLUMN IF NOT EXISTS cpu_cores INTEGER;
+ALTER TABLE public.nodes ADD COLUMN IF NOT EXISTS memory_mb INTEGER;
+ALTER TABLE public.nodes ADD COLUMN IF NOT EXISTS gflops DOUBLE PRECISION; -- Measured sustained GFLOP/s
+ALTER TABLE public.nodes ADD COLUMN IF NOT EXISTS has_gpu BOOLEAN DEFAULT FALSE;
+ALTER TABLE public.nodes ADD COLUMN IF NOT EXISTS cached_models TEXT[]; -- Model URLs the worker holds loaded
+ALTER TABLE public.nodes ADD COLUMN IF NOT EXISTS artifact_bloom BYTEA; -- Bloom filter of cached artifact URLs (node-client/bloom.py)
 
 -- Create index for efficient worker selection
 CREATE INDEX IF NOT EXISTS idx_nodes_load ON public.nodes(current_jobs, last_job_assigned);
 CREATE INDEX IF NOT EXISTS idx_jobs_claimed ON public.jobs(claimed_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_processing_provider ON public.jobs(provider_address) WHERE status = 'processing';
+CREATE INDEX IF NOT EXISTS idx_jobs_processing_lease ON public.jobs(lease_expires_at) WHERE status = 'processing';
+
+-- ============================================
+-- Job leases
+-- A claimed job holds a lease for job_lease_ttl(). Workers renew the leases
+-- of their running jobs with each heartbeat (renew_job_leases); a job whose
+-- lease runs out goes back to pending (reap_expired_leases).
+-- ============================================
+CREATE OR REPLACE FUNCTION public.job_lease_ttl()
+RETURNS INTERVAL
+LANGUAGE sql
+IMMUTABLE
+AS $$ SELECT INTERVAL '60 seconds' $$;
+
+-- Every path into 'processing' (claim RPCs, direct-update fallbacks) starts a lease;
+-- every path out of it drops the lease
+CREATE OR REPLACE FUNCTION public.set_job_lease()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF NEW.status = 'processing' THEN
+        IF TG_OP = 'INSERT' OR OLD.status IS DISTINCT FROM 'processing' THEN
+            NEW.claimed_at := COALESCE(NEW.claimed_at, NOW());
+            NEW.lease_expires_at := COALESCE(NEW.lease_expires_at, NOW() + public.job_lease_ttl());
+        END IF;
+    ELSE
+        NEW.lease_expires_at := NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_jobs_set_lease ON public.jobs;
+CREATE TRIGGER trg_jobs_set_lease
+    BEFORE INSERT OR UPDATE OF status ON public.jobs
+    FOR EACH ROW EXECUTE FUNCTION public.set_job_lease();
+
+-- Jobs already running when leases were introduced keep the old 10 minute allowance
+UPDATE public.jobs
+SET lease_expires_at = COALESCE(claimed_at, NOW()) + INTERVAL '10 minutes'
+WHERE status = 'processing' AND lease_expires_at IS NULL;
+
+-- ============================================
+-- Capability routing
+-- A worker is only handed jobs it can run: its type is allowed, the job's
+-- memory and model fit in its RAM, it has a GPU if one is required, and
+-- est_flops at its measured GFLOP/s finishes within job_max_runtime().
+-- Unknown capabilities or requirements don't exclude anything.
+--
+-- Light jobs (small inference) are left to browser workers: while a browser
+-- worker has a free slot, python/server workers skip light jobs younger than
+-- job_routing_grace(), unless they already hold the job's model.
+-- ============================================
+CREATE OR REPLACE FUNCTION public.job_max_runtime()
+RETURNS INTERVAL
+LANGUAGE sql
+IMMUTABLE
+AS $$ SELECT INTERVAL '10 minutes' $$;
+
+CREATE OR REPLACE FUNCTION public.job_routing_grace()
+RETURNS INTERVAL
+LANGUAGE sql
+IMMUTABLE
+AS $$ SELECT INTERVAL '10 seconds' $$;
+
+CREATE OR REPLACE FUNCTION public.job_fits_node(j public.jobs, n public.nodes)
+RETURNS BOOLEAN
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT (j.worker_types IS NULL OR COALESCE(n.worker_type, 'browser') = ANY(j.worker_types))
+       AND (n.memory_mb IS NULL OR GREATEST(COALESCE(j.min_memory_mb, 0), COALESCE(j.model_size_mb, 0)) <= n.memory_mb)
+       AND (NOT COALESCE(j.requires_gpu, FALSE) OR COALESCE(n.has_gpu, FALSE))
+       AND (j.est_flops IS NULL OR COALESCE(n.gflops, 0) <= 0
+            OR j.est_flops / (n.gflops * 1e9) <= EXTRACT(EPOCH FROM public.job_max_runtime()))
+$$;
+
+CREATE OR REPLACE FUNCTION public.job_is_light(j public.jobs)
+RETURNS BOOLEAN
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT j.job_type = 'inference'
+       AND NOT COALESCE(j.requires_gpu, FALSE)
+       AND COALESCE(j.model_size_mb, 0) <= 64
+       AND COALESCE(j.est_flops, 0) <= 1e10
+$$;
+
+-- Whether node `n` should pass on light jobs for now
+CREATE OR REPLACE FUNCTION public.node_defers_light_jobs(n public.nodes)
+RETURNS BOOLEAN
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT COALESCE(n.worker_type, 'browser') IN ('python', 'server')
+       AND EXISTS (
+           SELECT 1 FROM public.nodes b
+           WHERE b.worker_type = 'browser'
+             AND b.status = 'active'
+             AND b.last_seen > NOW() - INTERVAL '60 seconds'
+             AND COALESCE(b.current_jobs, 0) = 0
+       )
+$$;
+
+-- Whether node `n` may claim job `j` now (p_defer_light = node_defers_light_jobs(n), computed once per claim)
+CREATE OR REPLACE FUNCTION public.job_routes_to_node(j public.jobs, n public.nodes, p_defer_light BOOLEAN)
+RETURNS BOOLEAN
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT public.job_fits_node(j, n)
+       AND NOT (p_defer_light
+                AND public.job_is_light(j)
+                AND j.created_at > NOW() - public.job_routing_grace()
+                AND NOT COALESCE(j.model_url = ANY(n.cached_models), FALSE))
+$$;
+
+-- ============================================
+-- Cache affinity
+-- Workers publish a Bloom filter of the artifact URLs they have cached
+-- (nodes.artifact_bloom). Pending jobs are scored by how much of the job a
+-- worker already holds, and a young job whose artifacts another online
+-- worker holds is left to that worker for job_affinity_wait(); after that
+-- it goes to whoever asks, in FIFO order.
+-- ============================================
+CREATE OR REPLACE FUNCTION public.bloom_hashes()
+RETURNS INTEGER
+LANGUAGE sql
+IMMUTABLE
+AS $$ SELECT 4 $$;
+
+CREATE OR REPLACE FUNCTION public.job_affinity_wait()
+RETURNS INTERVAL
+LANGUAGE sql
+IMMUTABLE
+AS $$ SELECT INTERVAL '5 seconds' $$;
+
+-- Same hashing as node-client/bloom.py: bit positions are consecutive
+-- big-endian 32-bit words of sha256(key), modulo the filter size. The words
+-- don't depend on the filter size, so each job's are hashed once when it is
+-- written and a claim only reduces them and tests bits.
+CREATE OR REPLACE FUNCTION public.bloom_words(p_key TEXT)
+RETURNS BIGINT[]
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT CASE WHEN p_key IS NULL THEN NULL ELSE ARRAY(
+        SELECT ('x' || substr(h.digest, 8 * i + 1, 8))::BIT(32)::BIGINT
+        FROM (SELECT encode(sha256(convert_to(p_key, 'UTF8')), 'hex') AS digest) h,
+             generate_series(0, public.bloom_hashes() - 1) AS i
+        ORDER BY i
+    ) END
+$$;
+
+CREATE OR REPLACE FUNCTION public.bloom_contains_words(p_bloom BYTEA, p_words BIGINT[])
+RETURNS BOOLEAN
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT p_bloom IS NOT NULL AND length(p_bloom) > 0 AND p_words IS NOT NULL
+       AND NOT EXISTS (
+           SELECT 1 FROM unnest(p_words) AS w
+           WHERE get_bit(p_bloom, (w % (length(p_bloom) * 8))::INT) = 0
+       )
+$$;
+
+-- Ad hoc form taking the URL itself
+CREATE OR REPLACE FUNCTION public.bloom_contains(p_bloom BYTEA, p_key TEXT)
+RETURNS BOOLEAN
+LANGUAGE sql
+IMMUTABLE
+AS $$ SELECT public.bloom_contains_words(p_bloom, public.bloom_words(p_key)) $$;
+
+CREATE OR REPLACE FUNCTION public.set_job_bloom_words()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.script_bloom_words := public.bloom_words(NEW.script_url);
+    NEW.dataset_bloom_words := public.bloom_words(NEW.dataset_url);
+    NEW.model_bloom_words := public.bloom_words(NEW.model_url);
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_jobs_set_bloom_words ON public.jobs;
+CREATE TRIGGER trg_jobs_set_bloom_words
+    BEFORE INSERT OR UPDATE OF script_url, dataset_url, model_url ON public.jobs
+    FOR EACH ROW EXECUTE FUNCTION public.set_job_bloom_words();
+
+-- Only pending jobs are ever scored; finished ones keep NULL words
+UPDATE public.jobs
+SET script_bloom_words = public.bloom_words(script_url),
+    dataset_bloom_words = public.bloom_words(dataset_url),
+    model_bloom_words = public.bloom_words(model_url)
+WHERE status = 'pending' AND script_bloom_words IS NULL;
+
+-- How much of job `j` a worker with digest `p_bloom` has cached: datasets and
+-- models count double, they are the large downloads
+CREATE OR REPLACE FUNCTION public.job_affinity(j public.jobs, p_bloom BYTEA)
+RETURNS INTEGER
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT CASE WHEN p_bloom IS NULL THEN 0 ELSE
+        (CASE WHEN public.bloom_contains_words(p_bloom, j.script_bloom_words) THEN 1 ELSE 0 END)
+      + (CASE WHEN public.bloom_contains_words(p_bloom, j.dataset_bloom_words) THEN 2 ELSE 0 END)
+      + (CASE WHEN public.bloom_contains_words(p_bloom, j.model_bloom_words) THEN 2 ELSE 0 END)
+    END
+$$;
+
+-- Whether job `j` is being held for another online worker that has its artifacts cached
+CREATE OR REPLACE FUNCTION public.job_held_for_other(j public.jobs, n public.nodes)
+RETURNS BOOLEAN
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT j.created_at > NOW() - public.job_affinity_wait()
+       AND public.job_affinity(j, n.artifact_bloom) = 0
+       AND EXISTS (
+           SELECT 1 FROM public.nodes o
+           WHERE o.hardware_id IS DISTINCT FROM n.hardware_id
+             AND o.artifact_bloom IS NOT NULL
+             AND o.status = 'active'
+             AND o.last_seen > NOW() - INTERVAL '60 seconds'
+             AND public.job_fits_node(j, o)
+             AND public.job_affinity(j, o.artifact_bloom) > 0
+       )
+$$;
 
 -- ============================================
 -- Fair Job Claiming Function with Load Balancing
@@ -35,11 +287,14 @@ DECLARE
     v_worker_jobs INT;
     v_total_active_workers INT;
     v_avg_jobs NUMERIC;
+    v_node public.nodes%ROWTYPE;
+    v_job public.jobs%ROWTYPE;
 BEGIN
-    -- Get worker's current load
-    SELECT COALESCE(current_jobs, 0) INTO v_worker_jobs
+    -- Get worker's current load and capabilities
+    SELECT * INTO v_node
     FROM public.nodes
     WHERE hardware_id = p_provider_address;
+    v_worker_jobs := COALESCE(v_node.current_jobs, 0);
     
     -- Get total active workers and average load
     SELECT COUNT(*), COALESCE(AVG(current_jobs), 0)
@@ -56,16 +311,23 @@ BEGIN
     END IF;
     
     -- Lock the row and get current status
-    SELECT status INTO v_current_status
+    SELECT * INTO v_job
     FROM public.jobs
     WHERE id = p_job_id
     FOR UPDATE SKIP LOCKED;
+    v_current_status := v_job.status;
     
     -- If job not found or already locked by another transaction
     IF v_current_status IS NULL THEN
         RETURN FALSE;
     END IF;
     
+    -- Leave jobs this worker can't run (or shouldn't take yet) to others
+    IF NOT public.job_routes_to_node(v_job, v_node, public.node_defers_light_jobs(v_node))
+       OR public.job_held_for_other(v_job, v_node) THEN
+        RETURN FALSE;
+    END IF;
+    
     -- Only claim if status is 'pending'
     IF v_current_status != 'pending' THEN
         RETURN FALSE;
@@ -93,14 +355,106 @@ BEGIN
 END;
 $$;
 
+-- ============================================
+-- Batch Claiming: lease up to K pending jobs in one round trip
+-- ============================================
+CREATE OR REPLACE FUNCTION public.claim_job_fair_batch(
+    p_provider_address TEXT,
+    p_limit INT DEFAULT 1
+)
+RETURNS SETOF public.jobs
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    v_claimed_count INT;
+    v_worker_jobs INT;
+    v_total_active_workers INT;
+    v_avg_jobs NUMERIC;
+    v_node public.nodes%ROWTYPE;
+    v_defer_light BOOLEAN;
+BEGIN
+    IF p_limit IS NULL OR p_limit < 1 THEN
+        RETURN;
+    END IF;
+    
+    -- Same load check as claim_job_fair
+    SELECT * INTO v_node
+    FROM public.nodes
+    WHERE hardware_id = p_provider_address;
+    v_worker_jobs := COALESCE(v_node.current_jobs, 0);
+    v_defer_light := public.node_defers_light_jobs(v_node);
+    
+    SELECT COUNT(*), COALESCE(AVG(current_jobs), 0)
+    INTO v_total_active_workers, v_avg_jobs
+    FROM public.nodes
+    WHERE status = 'active' 
+    AND last_seen > NOW() - INTERVAL '60 seconds';
+    
+    IF v_worker_jobs >= 2 AND v_worker_jobs > v_avg_jobs + 1 AND v_total_active_workers > 1 THEN
+        -- Worker is overloaded, let others take these jobs
+        RETURN;
+    END IF;
+    
+    -- Take the oldest pending jobs this worker can run (a window at the head of
+    -- the queue), best cache affinity first, skipping rows other workers are
+    -- claiming so concurrent callers each get a disjoint batch
+    RETURN QUERY
+    WITH candidates AS (
+        SELECT p.id, p.created_at, public.job_affinity(p, v_node.artifact_bloom) AS affinity
+        FROM public.jobs p
+        WHERE p.status = 'pending'
+          AND public.job_routes_to_node(p, v_node, v_defer_light)
+        ORDER BY p.created_at ASC
+        LIMIT GREATEST(p_limit, 64)
+    ),
+    picked AS (
+        SELECT p.id
+        FROM public.jobs p
+        JOIN candidates c ON c.id = p.id
+        WHERE p.status = 'pending'
+          AND (c.affinity > 0 OR NOT public.job_held_for_other(p, v_node))
+        ORDER BY c.affinity DESC, c.created_at ASC
+        LIMIT p_limit
+        FOR UPDATE OF p SKIP LOCKED
+    )
+    UPDATE public.jobs j
+    SET status = 'processing',
+        provider_address = p_provider_address,
+        claimed_at = NOW()
+    FROM picked
+    WHERE j.id = picked.id
+    RETURNING j.*;
+    
+    GET DIAGNOSTICS v_claimed_count = ROW_COUNT;
+    
+    -- Update worker's job count once for the whole batch
+    IF v_claimed_count > 0 THEN
+        UPDATE public.nodes
+        SET current_jobs = COALESCE(current_jobs, 0) + v_claimed_count,
+            last_job_assigned = NOW()
+        WHERE hardware_id = p_provider_address;
+    END IF;
+END;
+$$;
+
 -- ============================================
 -- Function to complete a job and update worker stats
+-- Results, logs_url and the worker update are written in the same
+-- transaction, so a completed row never shows up without its result.
 -- ============================================
+DROP FUNCTION IF EXISTS public.complete_job(BIGINT, TEXT, TEXT, TEXT);
+
 CREATE OR REPLACE FUNCTION public.complete_job(
     p_job_id BIGINT,
     p_provider_address TEXT,
     p_result_url TEXT DEFAULT NULL,
-    p_status TEXT DEFAULT 'completed'
+    p_status TEXT DEFAULT 'completed',
+    p_inference_result TEXT DEFAULT NULL,
+    p_logs_url TEXT DEFAULT NULL,
+    p_update_hash TEXT DEFAULT NULL,
+    p_update_url TEXT DEFAULT NULL,
+    p_num_samples INTEGER DEFAULT NULL
 )
 RETURNS BOOLEAN
 LANGUAGE plpgsql
@@ -112,15 +466,23 @@ BEGIN
     -- Update the job
     UPDATE public.jobs
     SET status = p_status,
-        result_url = COALESCE(p_result_url, result_url)
+        result_url = COALESCE(p_result_url, result_url),
+        inference_result = COALESCE(p_inference_result, inference_result),
+        logs_url = COALESCE(p_logs_url, logs_url)
     WHERE id = p_job_id
       AND provider_address = p_provider_address
       AND status = 'processing';
     
     GET DIAGNOSTICS v_updated_count = ROW_COUNT;
     
-    -- Update worker stats
     IF v_updated_count > 0 THEN
+        -- Record the worker's update (enqueues aggregation via its trigger)
+        IF p_update_hash IS NOT NULL THEN
+            INSERT INTO public.worker_updates (job_id, worker_address, update_hash, update_url, num_samples)
+            VALUES (p_job_id, p_provider_address, p_update_hash, p_update_url, p_num_samples);
+        END IF;
+        
+        -- Update worker stats
         UPDATE public.nodes
         SET current_jobs = GREATEST(0, COALESCE(current_jobs, 0) - 1),
             total_jobs_completed = COALESCE(total_jobs_completed, 0) + CASE WHEN p_status = 'completed' THEN 1 ELSE 0 END,
@@ -132,6 +494,41 @@ BEGIN
 END;
 $$;
 
+-- ============================================
+-- Complete many jobs in one call
+-- p_completions: [{"job_id": 1, "status": "completed", "result_url": ..., "inference_result": ...,
+--                  "logs_url": ..., "update_hash": ..., "update_url": ..., "num_samples": ...}, ...]
+-- ============================================
+CREATE OR REPLACE FUNCTION public.complete_jobs_batch(
+    p_provider_address TEXT,
+    p_completions JSONB
+)
+RETURNS TABLE(job_id BIGINT, completed BOOLEAN)
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    v_item JSONB;
+BEGIN
+    FOR v_item IN SELECT * FROM jsonb_array_elements(p_completions)
+    LOOP
+        job_id := (v_item->>'job_id')::BIGINT;
+        completed := public.complete_job(
+            job_id,
+            p_provider_address,
+            v_item->>'result_url',
+            COALESCE(v_item->>'status', 'completed'),
+            v_item->>'inference_result',
+            v_item->>'logs_url',
+            v_item->>'update_hash',
+            v_item->>'update_url',
+            (v_item->>'num_samples')::INTEGER
+        );
+        RETURN NEXT;
+    END LOOP;
+END;
+$$;
+
 -- ============================================
 -- Function to get next job for a specific worker (fair assignment)
 -- ============================================
@@ -153,11 +550,13 @@ DECLARE
     v_worker_jobs INT;
     v_total_pending INT;
     v_total_workers INT;
+    v_node public.nodes%ROWTYPE;
 BEGIN
-    -- Get worker's current load
-    SELECT COALESCE(current_jobs, 0) INTO v_worker_jobs
+    -- Get worker's current load and capabilities
+    SELECT * INTO v_node
     FROM public.nodes
     WHERE hardware_id = p_provider_address;
+    v_worker_jobs := COALESCE(v_node.current_jobs, 0);
     
     -- If worker already has 2+ jobs, don't assign more unless no other workers
     SELECT COUNT(*) INTO v_total_workers
@@ -170,12 +569,14 @@ BEGIN
         RETURN; -- Return empty, let less loaded workers take jobs
     END IF;
     
-    -- Return the oldest pending job
+    -- Return the pending job this worker has most of cached, oldest first
     RETURN QUERY
     SELECT j.id, j.job_type, j.model_hash, j.dataset_url, j.script_url, j.reward
     FROM public.jobs j
     WHERE j.status = 'pending'
-    ORDER BY j.created_at ASC
+      AND public.job_routes_to_node(j, v_node, public.node_defers_light_jobs(v_node))
+      AND NOT public.job_held_for_other(j, v_node)
+    ORDER BY public.job_affinity(j, v_node.artifact_bloom) DESC, j.created_at ASC
     LIMIT 1;
 END;
 $$;
@@ -212,49 +613,135 @@ END;
 $$;
 
 -- ============================================
--- Cleanup function for stale jobs
+-- Extend the leases of a worker's running jobs (called from its heartbeat)
+-- Returns how many leases were renewed; a job missing from the count was
+-- reaped or completed and should be abandoned.
 -- ============================================
-CREATE OR REPLACE FUNCTION public.cleanup_stale_jobs()
+CREATE OR REPLACE FUNCTION public.renew_job_leases(
+    p_provider_address TEXT,
+    p_job_ids BIGINT[]
+)
 RETURNS INTEGER
 LANGUAGE plpgsql
 SECURITY DEFINER
 AS $$
 DECLARE
-    v_cleaned INT;
+    v_renewed INT;
+BEGIN
+    UPDATE public.jobs
+    SET lease_expires_at = NOW() + public.job_lease_ttl()
+    WHERE id = ANY(p_job_ids)
+      AND provider_address = p_provider_address
+      AND status = 'processing';
+    
+    GET DIAGNOSTICS v_renewed = ROW_COUNT;
+    RETURN v_renewed;
+END;
+$$;
+
+-- ============================================
+-- Return jobs with expired leases to the queue
+-- Reads only the processing rows whose lease has passed (idx_jobs_processing_lease).
+-- Scheduled with pg_cron where available; otherwise cleanup_stale_jobs runs it.
+-- ============================================
+CREATE OR REPLACE FUNCTION public.reap_expired_leases()
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    v_reaped INT;
 BEGIN
-    -- Reset jobs that have been processing for more than 10 minutes
-    -- and their worker is offline
     UPDATE public.jobs j
     SET status = 'pending',
         provider_address = NULL,
         claimed_at = NULL,
         assignment_attempts = COALESCE(assignment_attempts, 0) + 1
     WHERE j.status = 'processing'
-      AND j.claimed_at < NOW() - INTERVAL '10 minutes'
-      AND NOT EXISTS (
-          SELECT 1 FROM public.nodes n 
-          WHERE n.hardware_id = j.provider_address 
-          AND n.last_seen > NOW() - INTERVAL '60 seconds'
-      );
+      AND j.lease_expires_at < NOW();
     
-    GET DIAGNOSTICS v_cleaned = ROW_COUNT;
+    GET DIAGNOSTICS v_reaped = ROW_COUNT;
     
-    -- Also decrement the job count for offline workers
-    UPDATE public.nodes
-    SET current_jobs = 0
-    WHERE status = 'active'
-      AND last_seen < NOW() - INTERVAL '60 seconds';
+    -- Recount worker loads now that jobs were released
+    IF v_reaped > 0 THEN
+        PERFORM public.reconcile_worker_loads();
+    END IF;
+    
+    RETURN v_reaped;
+END;
+$$;
+
+-- ============================================
+-- Cleanup function for stale jobs
+-- Kept for existing callers (worker heartbeats). With pg_cron the scheduled
+-- reaper does the work and this returns immediately.
+-- ============================================
+CREATE OR REPLACE FUNCTION public.cleanup_stale_jobs()
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_cron') THEN
+        RETURN 0;
+    END IF;
+    RETURN public.reap_expired_leases();
+END;
+$$;
+
+-- ============================================
+-- Recompute nodes.current_jobs from the jobs table
+-- Claim/complete increments drift when a worker falls back to direct table
+-- writes or dies mid-job; this recounts every worker in one statement.
+-- Workers also report their own count with each heartbeat.
+-- ============================================
+CREATE OR REPLACE FUNCTION public.reconcile_worker_loads()
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    v_fixed INT;
+BEGIN
+    UPDATE public.nodes n
+    SET current_jobs = COALESCE(l.active_jobs, 0)
+    FROM public.nodes n2
+    LEFT JOIN (
+        SELECT provider_address, COUNT(*)::INT AS active_jobs
+        FROM public.jobs
+        WHERE status = 'processing'
+        GROUP BY provider_address
+    ) l ON l.provider_address = n2.hardware_id
+    WHERE n.id = n2.id
+      AND n.current_jobs IS DISTINCT FROM COALESCE(l.active_jobs, 0);
     
-    RETURN v_cleaned;
+    GET DIAGNOSTICS v_fixed = ROW_COUNT;
+    RETURN v_fixed;
 END;
 $$;
 
 -- Grant execute permissions
 GRANT EXECUTE ON FUNCTION public.claim_job_fair(BIGINT, TEXT) TO anon, authenticated;
-GRANT EXECUTE ON FUNCTION public.complete_job(BIGINT, TEXT, TEXT, TEXT) TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.claim_job_fair_batch(TEXT, INT) TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.complete_job(BIGINT, TEXT, TEXT, TEXT, TEXT, TEXT, TEXT, TEXT, INTEGER) TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.complete_jobs_batch(TEXT, JSONB) TO anon, authenticated;
 GRANT EXECUTE ON FUNCTION public.get_next_job_for_worker(TEXT) TO anon, authenticated;
 GRANT EXECUTE ON FUNCTION public.get_worker_stats() TO anon, authenticated;
 GRANT EXECUTE ON FUNCTION public.cleanup_stale_jobs() TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.reconcile_worker_loads() TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.renew_job_leases(TEXT, BIGINT[]) TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.reap_expired_leases() TO anon, authenticated;
+
+-- With pg_cron, one scheduled reaper replaces the per-worker cleanup calls
+-- ('15 seconds' schedules need pg_cron 1.5+), and loads are recounted every minute
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_cron') THEN
+        PERFORM cron.schedule('reap-expired-leases', '15 seconds', 'SELECT public.reap_expired_leases()');
+        PERFORM cron.schedule('reconcile-worker-loads', '* * * * *', 'SELECT public.reconcile_worker_loads()');
+    END IF;
+END;
+$$;
 
 -- Backward compatibility: Update original claim_job to use fair distribution
 CREATE OR REPLACE FUNCTION public.claim_job(
@@ -0,0 +1,69 @@
+-- ============================================
+-- Indexes for the hot job queries
+-- Run after schema.sql, fair_job_distribution.sql and aggregation.sql
+-- Benchmark: python database/bench_job_queries.py
+--
+-- Indexes are built CONCURRENTLY so a large jobs table keeps taking writes
+-- while they build. CONCURRENTLY can't run inside a transaction block, so
+-- run this file with psql (one statement at a time, autocommit), not as a
+-- single script in the SQL Editor:
+--     psql "$DATABASE_URL" -f database/job_indexes.sql
+-- A failed build leaves an INVALID index behind; the check below stops the
+-- run before any old index is dropped. Drop the invalid index
+-- (DROP INDEX CONCURRENTLY ...) and run the file again.
+-- ============================================
+\set ON_ERROR_STOP on
+
+-- The claim path everywhere is "WHERE status = 'pending' ORDER BY created_at LIMIT k"
+-- (claim_job_fair_batch, get_next_job_for_worker, the worker fallbacks).
+-- With only idx_jobs_status and idx_jobs_created the planner either walks
+-- created_at through millions of finished rows or sorts every pending row.
+-- The partial index holds pending rows only and is already in claim order;
+-- id breaks created_at ties so clients can page with a (created_at, id) cursor.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_jobs_pending_created ON public.jobs(created_at, id) WHERE status = 'pending';
+
+-- worker_updates by job: the aggregator's "count(*) WHERE job_id = ?" and its
+-- "WHERE job_id = ? AND id > ? ORDER BY id" pages become index-only / range scans.
+-- Replaces idx_worker_updates_job, which this covers.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_worker_updates_job_id ON public.worker_updates(job_id, id) INCLUDE (num_samples);
+
+-- Aggregator rescan (no aggregation queue): completed training jobs by id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_jobs_completed_training ON public.jobs(id) WHERE status = 'completed' AND job_type = 'training';
+
+-- Dashboard: job list newest first, paged with a (created_at, id) cursor.
+-- Replaces idx_jobs_created.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_jobs_created_id ON public.jobs(created_at DESC, id DESC);
+
+-- Dashboard: network view reads (id, status, provider_address) of live and finished jobs
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_jobs_status_provider ON public.jobs(status, provider_address) INCLUDE (id);
+
+-- Requester's own jobs, newest first. Replaces idx_jobs_requester.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_jobs_requester_created ON public.jobs(requester_address, created_at DESC);
+
+-- Only drop the indexes being replaced once every new index is valid
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM pg_index
+        WHERE NOT indisvalid
+          AND indexrelid IN (
+              to_regclass('public.idx_jobs_pending_created'),
+              to_regclass('public.idx_worker_updates_job_id'),
+              to_regclass('public.idx_jobs_completed_training'),
+              to_regclass('public.idx_jobs_created_id'),
+              to_regclass('public.idx_jobs_status_provider'),
+              to_regclass('public.idx_jobs_requester_created'))
+    ) THEN
+        RAISE EXCEPTION 'An index build failed and left an INVALID index; drop it and run job_indexes.sql again';
+    END IF;
+END;
+$$;
+
+DROP INDEX CONCURRENTLY IF EXISTS public.idx_worker_updates_job;
+DROP INDEX CONCURRENTLY IF EXISTS public.idx_jobs_created;
+DROP INDEX CONCURRENTLY IF EXISTS public.idx_jobs_requester;
+
+ANALYZE public.jobs;
+ANALYZE public.worker_updates;
+
+SELECT 'Job query indexes created successfully!' as result;
@@ -0,0 +1,202 @@
+-- ============================================
+-- Data-parallel training: split one training job into shard jobs
+-- Run after fair_job_distribution.sql and aggregation.sql
+--
+-- split_training_job turns a training job into N child jobs, each training
+-- on a byte range or row range of the same dataset. Children are ordinary
+-- pending jobs, claimed and leased like any other. Their worker updates
+-- are recorded against the parent, so the aggregator folds every shard into
+-- one FedAvg model. When the last shard finishes the parent completes,
+-- which queues its final aggregation; the merged model becomes its result_url.
+-- ============================================
+
+-- 'sharded': waiting on its shard jobs (never claimed itself)
+ALTER TABLE public.jobs DROP CONSTRAINT IF EXISTS jobs_status_check;
+ALTER TABLE public.jobs ADD CONSTRAINT jobs_status_check CHECK (status IN (
+    'pending', 'processing', 'completed', 'failed', 'challenged', 'slashed', 'cancelled', 'expired', 'sharded'));
+
+ALTER TABLE public.jobs ADD COLUMN IF NOT EXISTS parent_job_id BIGINT REFERENCES public.jobs(id) ON DELETE CASCADE;
+ALTER TABLE public.jobs ADD COLUMN IF NOT EXISTS shard_index INTEGER;
+ALTER TABLE public.jobs ADD COLUMN IF NOT EXISTS shard_count INTEGER; -- On the parent: how many shards it was split into
+ALTER TABLE public.jobs ADD COLUMN IF NOT EXISTS shard_unit TEXT CHECK (shard_unit IN ('bytes', 'rows'));
+ALTER TABLE public.jobs ADD COLUMN IF NOT EXISTS shard_start BIGINT; -- First byte / data row of the shard
+ALTER TABLE public.jobs ADD COLUMN IF NOT EXISTS shard_end BIGINT; -- One past the last byte / data row
+
+CREATE INDEX IF NOT EXISTS idx_jobs_parent ON public.jobs(parent_job_id) WHERE parent_job_id IS NOT NULL;
+
+-- The shard job that produced each update (job_id is the parent's)
+ALTER TABLE public.worker_updates ADD COLUMN IF NOT EXISTS shard_job_id BIGINT REFERENCES public.jobs(id) ON DELETE SET NULL;
+
+-- ============================================
+-- Split a training job into p_shards shard jobs over p_total bytes or data
+-- rows of its dataset (node-client/job_splitter.py measures the dataset).
+-- Allowed while the job is pending, or by the worker that has it claimed.
+-- The reward and the job's resource estimates are divided between the shards.
+-- Jobs funded on chain stay whole: the contract pays one provider per job,
+-- so only the worker that trains the whole job can settle it.
+-- ============================================
+CREATE OR REPLACE FUNCTION public.split_training_job(
+    p_job_id BIGINT,
+    p_shards INT,
+    p_unit TEXT,
+    p_total BIGINT,
+    p_provider_address TEXT DEFAULT NULL
+)
+RETURNS SETOF public.jobs
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    v_job public.jobs%ROWTYPE;
+BEGIN
+    IF p_unit NOT IN ('bytes', 'rows') THEN
+        RAISE EXCEPTION 'Unknown shard unit %', p_unit;
+    END IF;
+    IF p_shards IS NULL OR p_shards < 2 OR p_total IS NULL OR p_total < p_shards THEN
+        RAISE EXCEPTION 'Cannot split % % into % shards', p_total, p_unit, p_shards;
+    END IF;
+
+    SELECT * INTO v_job
+    FROM public.jobs
+    WHERE id = p_job_id
+    FOR UPDATE;
+
+    IF v_job.id IS NULL OR v_job.job_type != 'training' OR v_job.parent_job_id IS NOT NULL THEN
+        RAISE EXCEPTION 'Job % is not a training job that can be split', p_job_id;
+    END IF;
+    IF v_job.on_chain_id IS NOT NULL THEN
+        RAISE EXCEPTION 'Job % is funded on chain (job %) and must be settled whole', p_job_id, v_job.on_chain_id;
+    END IF;
+    IF NOT (v_job.status = 'pending'
+            OR (v_job.status = 'processing' AND v_job.provider_address = p_provider_address)) THEN
+        RETURN; -- Claimed by someone else, or already finished or split
+    END IF;
+
+    UPDATE public.jobs
+    SET status = 'sharded',
+        provider_address = NULL,
+        shard_count = p_shards
+    WHERE id = p_job_id;
+
+    RETURN QUERY
+    INSERT INTO public.jobs (
+        requester_address, job_type, status, model_id, data_hash, model_hash, script_url, dataset_url,
+        reward, expires_at, est_flops, min_memory_mb, model_size_mb, requires_gpu, worker_types,
+        parent_job_id, shard_index, shard_unit, shard_start, shard_end)
+    SELECT v_job.requester_address, 'training', 'pending', v_job.model_id, v_job.data_hash, v_job.model_hash,
+           v_job.script_url, v_job.dataset_url,
+           COALESCE(v_job.reward, 0) / p_shards, v_job.expires_at, v_job.est_flops / p_shards,
+           v_job.min_memory_mb, v_job.model_size_mb, v_job.requires_gpu, v_job.worker_types,
+           p_job_id, i, p_unit, p_total * i / p_shards, p_total * (i + 1) / p_shards
+    FROM generate_series(0, p_shards - 1) AS i
+    RETURNING *;
+END;
+$$;
+
+-- ============================================
+-- Record shard updates against the parent job
+-- ============================================
+CREATE OR REPLACE FUNCTION public.redirect_shard_update()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    v_parent BIGINT;
+BEGIN
+    SELECT parent_job_id INTO v_parent
+    FROM public.jobs
+    WHERE id = NEW.job_id;
+
+    IF v_parent IS NOT NULL THEN
+        NEW.shard_job_id := NEW.job_id;
+        NEW.job_id := v_parent;
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_worker_updates_redirect_shard ON public.worker_updates;
+CREATE TRIGGER trg_worker_updates_redirect_shard
+    BEFORE INSERT ON public.worker_updates
+    FOR EACH ROW
+    WHEN (NEW.job_id IS NOT NULL)
+    EXECUTE FUNCTION public.redirect_shard_update();
+
+-- ============================================
+-- Finish the parent when its last shard finishes: completed if any shard
+-- completed (the aggregator then publishes the merged model), else failed
+-- ============================================
+CREATE OR REPLACE FUNCTION public.finish_sharded_parent()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    v_parent_status TEXT;
+BEGIN
+    -- Lock the parent so shards finishing at the same time see each other
+    SELECT status INTO v_parent_status
+    FROM public.jobs
+    WHERE id = NEW.parent_job_id
+    FOR UPDATE;
+
+    IF v_parent_status IS DISTINCT FROM 'sharded' THEN
+        RETURN NULL;
+    END IF;
+
+    IF EXISTS (
+        SELECT 1 FROM public.jobs
+        WHERE parent_job_id = NEW.parent_job_id
+          AND status NOT IN ('completed', 'failed', 'cancelled', 'expired', 'slashed')
+    ) THEN
+        RETURN NULL; -- Shards still running
+    END IF;
+
+    UPDATE public.jobs
+    SET status = CASE WHEN EXISTS (
+            SELECT 1 FROM public.jobs
+            WHERE parent_job_id = NEW.parent_job_id AND status = 'completed'
+        ) THEN 'completed' ELSE 'failed' END
+    WHERE id = NEW.parent_job_id;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_jobs_finish_sharded_parent ON public.jobs;
+CREATE TRIGGER trg_jobs_finish_sharded_parent
+    AFTER UPDATE OF status ON public.jobs
+    FOR EACH ROW
+    WHEN (NEW.parent_job_id IS NOT NULL AND OLD.status IS DISTINCT FROM NEW.status
+          AND NEW.status IN ('completed', 'failed', 'cancelled', 'expired', 'slashed'))
+    EXECUTE FUNCTION public.finish_sharded_parent();
+
+-- ============================================
+-- Progress of a sharded job, for dashboards and the splitter CLI
+-- ============================================
+CREATE OR REPLACE FUNCTION public.get_shard_progress(p_job_id BIGINT)
+RETURNS TABLE(
+    shard_count INT,
+    pending INT,
+    processing INT,
+    completed INT,
+    failed INT
+)
+LANGUAGE sql
+SECURITY DEFINER
+AS $$
+    SELECT COUNT(*)::INT,
+           COUNT(*) FILTER (WHERE j.status = 'pending')::INT,
+           COUNT(*) FILTER (WHERE j.status = 'processing')::INT,
+           COUNT(*) FILTER (WHERE j.status = 'completed')::INT,
+           COUNT(*) FILTER (WHERE j.status IN ('failed', 'cancelled', 'expired', 'slashed'))::INT
+    FROM public.jobs j
+    WHERE j.parent_job_id = p_job_id;
+$$;
+
+-- Splitting rewrites other users' jobs: workers and the splitter CLI use the service_role key
+REVOKE ALL ON FUNCTION public.split_training_job(BIGINT, INT, TEXT, BIGINT, TEXT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.split_training_job(BIGINT, INT, TEXT, BIGINT, TEXT) TO service_role;
+GRANT EXECUTE ON FUNCTION public.get_shard_progress(BIGINT) TO anon, authenticated;
+
+SELECT 'Job sharding functions created successfully' as result;
@@ -46,8 +46,9 @@ create table public.worker_updates (
   id bigint generated by default as identity primary key,
   job_id bigint references public.jobs(id) on delete cascade,
   worker_address text not null,
-  update_hash text not null, -- Merkle root of the gradient batch
+  update_hash text not null, -- Merkle root of the uploaded update (node-client/merkle.py)
   update_url text, -- Link to actual gradient data
+  num_samples integer, -- Training samples behind this update (FedAvg weight)
   created_at timestamp with time zone default timezone('utc'::text, now())
 );
 
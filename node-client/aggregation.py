@@ -0,0 +1,201 @@
+"""
+Aggregation strategies for OBLIVION federated training.
+
+Every update is flattened into a single float32 parameter vector using the
+ParameterLayout of the first update. Updates whose keys or shapes differ,
+or that hold NaN or Inf values, are rejected instead of being partially
+summed. Strategies take vectors one at a time:
+
+- fedavg:       sample-count weighted mean, kept as a running sum
+- trimmed_mean: per-coordinate mean after dropping the highest and lowest
+                AGGREGATION_TRIM_RATIO of values (rounded up, so at least
+                one from each end once there are 3 updates)
+- median:       per-coordinate median
+
+The robust strategies spool vectors to a memory-mapped file and reduce it
+in coordinate chunks sized so a chunk for every worker fits in
+AGGREGATION_MEMORY_MB, whatever the number of workers or the model size.
+
+FedAvg can also be saved and restored (state_dict / from_state), which lets
+the aggregator keep a running sum per job and fold in updates as they land.
+"""
+import math
+import os
+import tempfile
+from abc import ABC, abstractmethod
+
+import numpy as np
+import torch
+
+AGGREGATION_STRATEGY = os.environ.get("AGGREGATION_STRATEGY", "fedavg")  # fedavg, trimmed_mean or median
+AGGREGATION_TRIM_RATIO = float(os.environ.get("AGGREGATION_TRIM_RATIO", "0.1"))  # Fraction trimmed from each end
+AGGREGATION_MEMORY_MB = int(os.environ.get("AGGREGATION_MEMORY_MB", "256"))  # Working memory for robust reductions
+BYTES_PER_VALUE = 16  # float32 block value plus the selection's working copy and int64 indices
+
+class ParameterLayout:
+    """Key order and shapes used to flatten state dicts into one vector."""
+
+    def __init__(self, state_dict: dict):
+        self.keys = list(state_dict.keys())
+        self.shapes = [tuple(state_dict[k].shape) for k in self.keys]
+        self.numels = [state_dict[k].numel() for k in self.keys]
+        self.size = sum(self.numels)
+
+    @classmethod
+    def from_shapes(cls, keys: list, shapes: list) -> 'ParameterLayout':
+        """Rebuild a layout from saved keys and shapes without allocating tensors."""
+        return cls({k: torch.empty(tuple(shape), device='meta') for k, shape in zip(keys, shapes)})
+
+    def flatten(self, state_dict: dict) -> torch.Tensor:
+        if set(state_dict.keys()) != set(self.keys):
+            missing = set(self.keys) - set(state_dict.keys())
+            extra = set(state_dict.keys()) - set(self.keys)
+            raise ValueError(f"Parameter keys don't match (missing {sorted(missing)}, extra {sorted(extra)})")
+        for key, shape in zip(self.keys, self.shapes):
+            if tuple(state_dict[key].shape) != shape:
+                raise ValueError(f"Shape mismatch for '{key}': {tuple(state_dict[key].shape)} != {shape}")
+        vector = torch.cat([state_dict[k].reshape(-1).float() for k in self.keys])
+        if not torch.isfinite(vector).all():
+            raise ValueError("Update contains NaN or Inf values")
+        return vector
+
+    def unflatten(self, vector: torch.Tensor) -> dict:
+        parts = torch.split(vector, self.numels)
+        return {k: p.reshape(shape) for k, p, shape in zip(self.keys, parts, self.shapes)}
+
+class AggregationStrategy(ABC):
+    """Base class: add() flattened updates, then call result() once."""
+
+    name = None
+
+    def __init__(self, layout: ParameterLayout):
+        self.layout = layout
+        self.count = 0
+
+    @abstractmethod
+    def add(self, vector: torch.Tensor, weight: float = 1.0):
+        pass
+
+    @abstractmethod
+    def result(self) -> torch.Tensor:
+        pass
+
+    def close(self):
+        pass
+
+class FedAvg(AggregationStrategy):
+    """Sample-count weighted FedAvg as a running sum; memory is one model."""
+
+    name = 'fedavg'
+
+    def __init__(self, layout: ParameterLayout):
+        super().__init__(layout)
+        self._sum = torch.zeros(layout.size, dtype=torch.float32)
+        self._weight = 0.0
+
+    def add(self, vector: torch.Tensor, weight: float = 1.0):
+        self._sum.add_(vector, alpha=weight)
+        self._weight += weight
+        self.count += 1
+
+    def result(self) -> torch.Tensor:
+        return self._sum / self._weight
+
+    @property
+    def weight(self) -> float:
+        return self._weight
+
+    def state_dict(self) -> dict:
+        """Running sum and layout, enough to resume with from_state()."""
+        return {
+            'keys': self.layout.keys,
+            'shapes': [list(s) for s in self.layout.shapes],
+            'sum': self._sum,
+            'weight': self._weight,
+            'count': self.count,
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> 'FedAvg':
+        strategy = cls(ParameterLayout.from_shapes(state['keys'], state['shapes']))
+        strategy._sum = state['sum'].float()
+        strategy._weight = float(state['weight'])
+        strategy.count = int(state['count'])
+        return strategy
+
+class _SpooledStrategy(AggregationStrategy):
+    """
+    Appends each vector to a temp file, then reduces the (updates x params)
+    matrix one coordinate chunk at a time through a read-only memory map.
+    Sample weights are ignored: robust statistics treat every worker equally.
+    """
+
+    def __init__(self, layout: ParameterLayout, memory_mb: int = AGGREGATION_MEMORY_MB):
+        super().__init__(layout)
+        self.memory_mb = memory_mb
+        self._spool = tempfile.NamedTemporaryFile(prefix='oblivion-agg-', suffix='.f32', delete=False)
+
+    def add(self, vector: torch.Tensor, weight: float = 1.0):
+        self._spool.write(vector.contiguous().numpy().tobytes())
+        self.count += 1
+
+    @abstractmethod
+    def reduce_chunk(self, block: torch.Tensor) -> torch.Tensor:
+        """Reduce a (updates x chunk) block along dim 0."""
+
+    def result(self) -> torch.Tensor:
+        self._spool.flush()
+        matrix = np.memmap(self._spool.name, dtype=np.float32, mode='r', shape=(self.count, self.layout.size))
+        out = torch.empty(self.layout.size, dtype=torch.float32)
+        chunk_size = max(1, (self.memory_mb << 20) // (self.count * BYTES_PER_VALUE))
+        for start in range(0, self.layout.size, chunk_size):
+            end = min(start + chunk_size, self.layout.size)
+            block = torch.from_numpy(np.array(matrix[:, start:end]))  # Copies just this chunk
+            out[start:end] = self.reduce_chunk(block)
+        del matrix
+        return out
+
+    def close(self):
+        self._spool.close()
+        if os.path.exists(self._spool.name):
+            os.unlink(self._spool.name)
+
+class TrimmedMean(_SpooledStrategy):
+    name = 'trimmed_mean'
+
+    def __init__(self, layout: ParameterLayout, trim_ratio: float = AGGREGATION_TRIM_RATIO, **kwargs):
+        super().__init__(layout, **kwargs)
+        self.trim_ratio = trim_ratio
+
+    def reduce_chunk(self, block: torch.Tensor) -> torch.Tensor:
+        n = block.shape[0]
+        # Round up: truncating would trim nothing below 1 / trim_ratio updates.
+        # round() keeps float noise (30 * 0.1 = 3.0000000000000004) from adding one.
+        k = min(math.ceil(round(n * self.trim_ratio, 9)), (n - 1) // 2)
+        if k == 0:
+            return block.mean(dim=0)
+        # Zero out the k highest and k lowest values instead of sorting the block.
+        # The highest become +inf first so ties can't pick the same value twice.
+        highest = block.topk(k, dim=0).indices
+        block.scatter_(0, highest, float('inf'))
+        lowest = block.topk(k, dim=0, largest=False).indices
+        block.scatter_(0, highest, 0.0)
+        block.scatter_(0, lowest, 0.0)
+        return block.sum(dim=0) / (n - 2 * k)
+
+class CoordinateMedian(_SpooledStrategy):
+    name = 'median'
+
+    def reduce_chunk(self, block: torch.Tensor) -> torch.Tensor:
+        n = block.shape[0]
+        upper = block.kthvalue(n // 2 + 1, dim=0).values
+        if n % 2:
+            return upper
+        return (block.kthvalue(n // 2, dim=0).values + upper) / 2
+
+STRATEGIES = {cls.name: cls for cls in (FedAvg, TrimmedMean, CoordinateMedian)}
+
+def create_strategy(name: str, layout: ParameterLayout) -> AggregationStrategy:
+    if name not in STRATEGIES:
+        raise ValueError(f"Unknown aggregation strategy '{name}' (expected one of {sorted(STRATEGIES)})")
+    return STRATEGIES[name](layout)
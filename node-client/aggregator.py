@@ -5,78 +5,222 @@ import os
 import asyncio
 import requests
 import io
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from supabase import create_client, Client
 from dotenv import load_dotenv
 from datetime import datetime
+from job_events import open_job_events, FALLBACK_POLL_INTERVAL
+from http_client import session as http_session
+from pagination import keyset_rows
+from update_format import decode_update, is_update
+from merkle import ChunkVerifier, MerkleHasher, SIDECAR_SUFFIX
+from aggregation import ParameterLayout, FedAvg, create_strategy, AGGREGATION_STRATEGY
 
 load_dotenv()
 
 # Configuration - SECURITY: Ensure these are set via environment variables
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
-SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
+SUPABASE_KEY = os.environ.get("SUPABASE_KEY")  # Must be the service_role key: the aggregation RPCs aren't granted to anon
+
+AGGREGATOR_MAX_INFLIGHT = int(os.environ.get("AGGREGATOR_MAX_INFLIGHT", "16"))  # Concurrent update downloads
+AGGREGATOR_VERIFY_UPDATES = os.environ.get("AGGREGATOR_VERIFY_UPDATES", "true").lower() == "true"  # Check downloads against update_hash
+AGGREGATION_QUORUM = int(os.environ.get("AGGREGATION_QUORUM", "0"))  # Publish intermediate models from this many updates (0 = on completion only)
+
+STATE_BUCKET = 'aggregator-state'  # Running FedAvg sums, so a restart doesn't re-download every update
 
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise ValueError("Missing required environment variables: SUPABASE_URL and SUPABASE_KEY")
 
+# Keep-alive connections shared by all update downloads (at most HTTP_MAX_PER_HOST per host)
+http = http_session()
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MB (0 if unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except (OSError, ValueError):
+        return 0.0
+
+def fetch_sidecar(update_url: str):
+    """Merkle leaf list published next to an update, or None if there isn't one."""
+    try:
+        response = http.get(update_url + SIDECAR_SUFFIX, timeout=10)
+        if response.status_code != 200:
+            return None
+        return response.json()
+    except (requests.RequestException, ValueError):
+        return None
+
+def fetch_update(update_url: str, expected_hash: str = None):
+    """
+    Download and deserialize one worker update. Returns (state_dict, bytes downloaded).
+    With an expected hash the download is checked against its Merkle root,
+    chunk by chunk when a leaf sidecar is available. Binary updates
+    contribute their weights; plain torch.save files are still accepted.
+    """
+    verifier = hasher = None
+    if expected_hash and AGGREGATOR_VERIFY_UPDATES:
+        sidecar = fetch_sidecar(update_url)
+        if sidecar:
+            verifier = ChunkVerifier(sidecar, expected_hash)
+        else:
+            hasher = MerkleHasher(parallel=False)
+    
+    response = http.get(update_url, timeout=30, stream=True)
+    response.raise_for_status()
+    weights_buffer = io.BytesIO()
+    for chunk in response.iter_content(chunk_size=1 << 20):
+        if verifier:
+            verifier.update(chunk)  # Raises on the first bad chunk, before the rest is downloaded
+        weights_buffer.write(chunk)
+    nbytes = weights_buffer.tell()
+    data = weights_buffer.getbuffer()
+    
+    if verifier:
+        verifier.finish()
+    elif hasher:
+        hasher.update(data)
+        if hasher.root() != expected_hash:
+            raise ValueError("Update doesn't match its update_hash")
+    
+    if is_update(data):
+        groups, _ = decode_update(data)
+        if 'weights' not in groups:
+            raise ValueError("Update has no weights")
+        return groups['weights'], nbytes
+    del data
+    weights_buffer.seek(0)
+    state_dict = torch.load(weights_buffer, map_location='cpu', weights_only=True)
+    return state_dict, nbytes
+
+def is_retryable(error: Exception) -> bool:
+    """Network errors and 5xx responses are worth retrying; a bad or missing update isn't."""
+    if isinstance(error, requests.HTTPError):
+        return error.response is None or error.response.status_code >= 500
+    return isinstance(error, OSError)  # Includes requests' connection errors and timeouts
+
+def fold_updates(updates: list, strategy=None, strategy_name: str = AGGREGATION_STRATEGY) -> tuple:
+    """
+    Download updates concurrently (at most AGGREGATOR_MAX_INFLIGHT at a time)
+    and feed each to the aggregation strategy as soon as it arrives, so peak
+    memory is about one model plus the in-flight downloads. Continues an
+    existing strategy if one is given, otherwise the first update creates it.
+    Returns (strategy, done ids, retry ids, stats): done ids were folded in or
+    rejected for good, retry ids failed to download and should be tried again.
+    """
+    layout = strategy.layout if strategy is not None else None
+    successful_updates = 0
+    done_ids, retry_ids = set(), set()
+    total_bytes = 0
+    peak_rss = current_rss_mb()
+    started = time.monotonic()
+    
+    pending = iter([u for u in updates if u.get('update_url')])
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=AGGREGATOR_MAX_INFLIGHT) as pool:
+        while True:
+            # Keep the download window full
+            while len(in_flight) < AGGREGATOR_MAX_INFLIGHT:
+                update = next(pending, None)
+                if update is None:
+                    break
+                in_flight[pool.submit(fetch_update, update['update_url'], update.get('update_hash'))] = update
+            if not in_flight:
+                break
+            
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                update = in_flight.pop(future)
+                try:
+                    state_dict, nbytes = future.result()
+                    
+                    if layout is None:
+                        # The first update defines the model structure
+                        layout = ParameterLayout(state_dict)
+                        strategy = create_strategy(strategy_name, layout)
+                    
+                    # Mismatched updates raise here and are skipped whole
+                    vector = layout.flatten(state_dict)
+                    strategy.add(vector, weight=float(update.get('num_samples') or 1))
+                    
+                    successful_updates += 1
+                    total_bytes += nbytes
+                    done_ids.add(update.get('id'))
+                    print(f"    - Processed update from {update.get('worker_address', 'unknown')}")
+                    
+                except Exception as e:
+                    if is_retryable(e):
+                        retry_ids.add(update.get('id'))
+                        print(f"    [!] Failed to download update {update.get('id')}, will retry: {e}")
+                    else:
+                        done_ids.add(update.get('id'))
+                        print(f"    [!] Rejected update {update.get('id')}: {e}")
+                finally:
+                    peak_rss = max(peak_rss, current_rss_mb())
+    
+    elapsed = max(time.monotonic() - started, 1e-9)
+    stats = {
+        'updates': successful_updates,
+        'retry': len(retry_ids),
+        'seconds': elapsed,
+        'updates_per_sec': successful_updates / elapsed,
+        'mb_per_sec': total_bytes / 1e6 / elapsed,
+        'peak_rss_mb': peak_rss,
+    }
+    return strategy, done_ids, retry_ids, stats
+
+def stream_aggregate(updates: list, strategy_name: str = AGGREGATION_STRATEGY) -> tuple:
+    """
+    Aggregate a full set of updates in one pass.
+    Returns (aggregated state dict, number of updates used, stats).
+    """
+    strategy, _, _, stats = fold_updates(updates, strategy_name=strategy_name)
+    successful_updates = stats['updates']
+    
+    aggregated_state = None
+    if strategy is not None:
+        try:
+            if successful_updates:
+                aggregated_state = strategy.layout.unflatten(strategy.result())
+        finally:
+            strategy.close()
+    return aggregated_state, successful_updates, stats
+
+def print_throughput(stats: dict):
+    print(f"    - Throughput: {stats['updates_per_sec']:.1f} updates/s, {stats['mb_per_sec']:.1f} MB/s "
+          f"over {stats['seconds']:.2f}s, peak RSS {stats['peak_rss_mb']:.0f} MB")
+
 async def aggregate_updates(supabase: Client, job_id: int) -> dict:
     """
-    Perform Federated Averaging (FedAvg) on worker updates.
-    Downloads model weights from all workers and averages them.
+    Aggregate worker updates with the configured strategy (FedAvg by default).
+    Downloads model weights from all workers and combines them.
     Returns the aggregated model state dict.
     """
     print(f"[*] Aggregating updates for Job {job_id}...")
     
     # 1. Fetch all updates for this job
-    updates_res = supabase.table('worker_updates').select("*").eq('job_id', job_id).execute()
-    updates = updates_res.data
+    updates = list(keyset_rows(lambda: supabase.table('worker_updates').select("*").eq('job_id', job_id)))
     
     if not updates:
         print("    - No updates found.")
         return None
 
-    print(f"    - Found {len(updates)} worker updates. Running FedAvg...")
+    print(f"    - Found {len(updates)} worker updates. Running {AGGREGATION_STRATEGY}...")
     
-    # 2. Download and aggregate model weights
-    aggregated_state = None
-    successful_updates = 0
-    
-    for update in updates:
-        update_url = update.get('update_url')
-        if not update_url:
-            continue
-            
-        try:
-            # Download model weights
-            response = requests.get(update_url, timeout=30)
-            response.raise_for_status()
-            
-            weights_buffer = io.BytesIO(response.content)
-            state_dict = torch.load(weights_buffer, map_location='cpu', weights_only=True)
-            
-            if aggregated_state is None:
-                # Initialize with first model's structure
-                aggregated_state = {k: v.clone().float() for k, v in state_dict.items()}
-            else:
-                # Add weights to running sum
-                for key in aggregated_state:
-                    if key in state_dict:
-                        aggregated_state[key] += state_dict[key].float()
-            
-            successful_updates += 1
-            print(f"    - Processed update from {update.get('worker_address', 'unknown')}")
-            
-        except Exception as e:
-            print(f"    [!] Failed to process update {update.get('id')}: {e}")
-            continue
+    # 2. Download and aggregate model weights (concurrent, streaming)
+    aggregated_state, successful_updates, stats = await asyncio.to_thread(stream_aggregate, updates)
+    print_throughput(stats)
     
+    if stats['retry']:
+        # Publishing now would silently leave them out
+        print(f"    [!] {stats['retry']} updates failed to download; aggregating again later")
+        return None
     if successful_updates == 0:
         print("    - No valid updates to aggregate")
         return None
     
-    # 3. Average the weights (FedAvg)
-    for key in aggregated_state:
-        aggregated_state[key] /= successful_updates
-    
     print(f"[+] Global Model Updated. Aggregated {successful_updates} updates.")
     return aggregated_state
 
@@ -113,46 +257,219 @@ async def save_global_model(supabase: Client, job_id: int, state_dict: dict) ->
         print(f"    [!] Failed to save global model: {e}")
         return None
 
+def claim_aggregation_batch(supabase: Client, limit: int = 20) -> list:
+    """
+    Dequeue jobs that need (re-)aggregation. Returns rows with job_id,
+    update_count and max_update_id.
+    """
+    result = supabase.rpc('claim_aggregation_batch', {'p_limit': limit}).execute()
+    return result.data or []
+
+def scan_completed_jobs(supabase: Client) -> list:
+    """Legacy fallback when the aggregation queue isn't deployed: rescan all completed training jobs."""
+    jobs = keyset_rows(lambda: supabase.table('jobs').select("id").eq('status', 'completed').eq('job_type', 'training'))
+    ready = []
+    for job in jobs:
+        # Check if we have multiple updates for this job
+        updates_count = supabase.table('worker_updates').select("id", count='exact').eq('job_id', job['id']).execute()
+        if updates_count.count and updates_count.count > 1:
+            ready.append({'job_id': job['id'], 'update_count': updates_count.count, 'max_update_id': None})
+    return ready
+
+# job_id -> (FedAvg running sum, update cursor, done update ids) for jobs still receiving updates
+running_sums = {}
+
+def load_running_sum(supabase: Client, item: dict):
+    """
+    Resume the job's running FedAvg sum from memory or the state bucket.
+    Returns (strategy, last_update_id, done_ids), or (None, 0, set()) to rebuild from scratch.
+    """
+    job_id, last_update_id = item['job_id'], item.get('last_update_id') or 0
+    cached = running_sums.get(job_id)
+    if cached and cached[1] == last_update_id:
+        return cached
+    if item.get('state_path') and last_update_id:
+        try:
+            data = supabase.storage.from_(STATE_BUCKET).download(item['state_path'])
+            state = torch.load(io.BytesIO(data), map_location='cpu', weights_only=True)
+            # Only trust a saved sum that matches what the database recorded
+            if state.get('last_update_id') == last_update_id and 'done_ids' in state:
+                return FedAvg.from_state(state), last_update_id, set(state['done_ids'])
+        except Exception as e:
+            print(f"    [!] Could not load running sum for Job {job_id}, rebuilding: {e}")
+    return None, 0, set()
+
+def save_running_sum(supabase: Client, job_id: int, strategy: FedAvg, last_update_id: int, done_ids: set) -> str:
+    """Persist the running sum so the next update (or a restarted aggregator) can continue it."""
+    buffer = io.BytesIO()
+    torch.save({**strategy.state_dict(), 'last_update_id': last_update_id, 'done_ids': sorted(done_ids)}, buffer)
+    path = f"job_{job_id}.pt"
+    options = {"content-type": "application/octet-stream", "upsert": "true"}
+    try:
+        supabase.storage.from_(STATE_BUCKET).upload(path=path, file=buffer.getvalue(), file_options=options)
+    except:
+        # Create bucket if it doesn't exist
+        supabase.storage.create_bucket(STATE_BUCKET, options={"public": False})
+        supabase.storage.from_(STATE_BUCKET).upload(path=path, file=buffer.getvalue(), file_options=options)
+    return path
+
+async def fold_new_updates(supabase: Client, item: dict, full_scan: bool = False):
+    """
+    Online FedAvg: download the updates the running sum doesn't include yet
+    and add them to it. Normally only updates after the cursor are read;
+    `full_scan` reads them all, to catch rows whose ids committed out of
+    order before the final model is published.
+    Returns (strategy, cursor, done_ids, retry_ids); strategy is None if
+    nothing usable arrived. The cursor only moves past ids that are done,
+    so updates that failed to download are read again next time.
+    """
+    job_id = item['job_id']
+    strategy, after_id, done_ids = await asyncio.to_thread(load_running_sum, supabase, item)
+    
+    rows = await asyncio.to_thread(
+        lambda: list(keyset_rows(lambda: supabase.table('worker_updates').select("*").eq('job_id', job_id),
+                                 after=None if full_scan else after_id))
+    )
+    updates = [u for u in rows if u['id'] not in done_ids]
+    print(f"[*] Job {job_id}: folding {len(updates)} new updates into running sum "
+          f"({strategy.count if strategy else 0} already included)")
+    
+    strategy, folded, retry_ids, stats = await asyncio.to_thread(fold_updates, updates, strategy, 'fedavg')
+    if updates:
+        print_throughput(stats)
+    done_ids |= folded
+    # Advance over the leading run of done ids; everything past the first failure is read again
+    cursor = after_id
+    for row in sorted(rows, key=lambda u: u['id']):
+        if row['id'] not in done_ids:
+            break
+        cursor = max(cursor, row['id'])
+    if strategy is None:
+        return None, after_id, done_ids, retry_ids
+    running_sums[job_id] = (strategy, cursor, done_ids)
+    return strategy, cursor, done_ids, retry_ids
+
+async def aggregate_job(supabase: Client, item: dict, use_queue: bool) -> bool:
+    """
+    Aggregate one job and record the result so it isn't redone until new updates arrive.
+    FedAvg is updated incrementally; the robust strategies re-aggregate all
+    updates, and only when a model is due to be published.
+    """
+    job_id = item['job_id']
+    
+    if not use_queue:
+        # Legacy scan: full re-aggregation
+        aggregated_state = await aggregate_updates(supabase, job_id)
+        model_url = await save_global_model(supabase, job_id, aggregated_state) if aggregated_state else None
+        if model_url:
+            await asyncio.to_thread(lambda: supabase.table('jobs').update({
+                'result_url': model_url
+            }).eq('id', job_id).execute())
+            print(f"[+] Job {job_id} aggregation complete: {model_url}")
+        return bool(model_url)
+    
+    final = item.get('job_status') == 'completed' and item['update_count'] > 1
+    quorum = AGGREGATION_QUORUM > 0 and item['update_count'] >= AGGREGATION_QUORUM
+    retry_ids = ()
+    
+    try:
+        if AGGREGATION_STRATEGY == 'fedavg':
+            strategy, last_update_id, done_ids, retry_ids = await fold_new_updates(supabase, item, full_scan=final)
+            if strategy is None:
+                if retry_ids:
+                    raise RuntimeError(f"{len(retry_ids)} updates failed to download")
+                print(f"    - No valid updates for Job {job_id}")
+                return False
+            state_path = await asyncio.to_thread(save_running_sum, supabase, job_id, strategy, last_update_id, done_ids)
+            updates_aggregated, weight_total = strategy.count, strategy.weight
+            if retry_ids:
+                # Keep the progress, but don't publish a final model without them
+                print(f"    [!] {len(retry_ids)} updates failed to download; retrying on the next pass")
+                final = False
+            publish = final or (quorum and strategy.count >= AGGREGATION_QUORUM)
+            aggregated_state = strategy.layout.unflatten(strategy.result()) if publish else None
+        else:
+            if not (final or quorum):
+                # Nothing to publish yet; the next update or the completion re-enqueues the job
+                return True
+            aggregated_state = await aggregate_updates(supabase, job_id)
+            if aggregated_state is None:
+                raise RuntimeError("no valid updates to aggregate")
+            last_update_id, updates_aggregated = item['max_update_id'], item['update_count']
+            weight_total, state_path, publish = 0, None, True
+        
+        model_url = None
+        if publish:
+            model_url = await save_global_model(supabase, job_id, aggregated_state)
+            if not model_url:
+                raise RuntimeError("global model upload failed")
+        
+        # Update the job with the aggregated model URL and remember what was included
+        await asyncio.to_thread(lambda: supabase.rpc('mark_job_aggregated', {
+            'p_job_id': job_id,
+            'p_last_update_id': last_update_id,
+            'p_updates_aggregated': updates_aggregated,
+            'p_global_model_url': model_url,
+            'p_weight_total': weight_total,
+            'p_state_path': state_path,
+            'p_is_final': final
+        }).execute())
+        
+    except Exception as e:
+        print(f"    [!] Aggregation failed for Job {job_id}: {e}")
+        running_sums.pop(job_id, None)
+        # Try again on the next pass
+        await asyncio.to_thread(lambda: supabase.rpc('requeue_aggregation', {'p_job_id': job_id}).execute())
+        return False
+    
+    if retry_ids:
+        await asyncio.to_thread(lambda: supabase.rpc('requeue_aggregation', {'p_job_id': job_id}).execute())
+        return False
+    if final:
+        running_sums.pop(job_id, None)
+        print(f"[+] Job {job_id} aggregation complete ({updates_aggregated} updates): {model_url}")
+    elif model_url:
+        print(f"[+] Job {job_id} intermediate global model ({updates_aggregated} updates): {model_url}")
+    return True
+
 async def main():
     print("--- OBLIVION: FEDERATED AGGREGATOR ---")
     supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    
+    # Get woken when jobs complete or workers submit updates; poll only as a fallback
+    job_events = await open_job_events(SUPABASE_URL, SUPABASE_KEY, [
+        ('jobs', 'UPDATE', 'status=eq.completed'),
+        ('worker_updates', 'INSERT', None),
+    ])
+    use_queue = True
 
     while True:
         try:
-            # Poll for training jobs that are completed but not yet aggregated
-            # We look for jobs with multiple worker updates that haven't been processed
-            response = supabase.table('jobs').select("id, status, job_type").eq('status', 'completed').eq('job_type', 'training').execute()
-            jobs = response.data
-
-            if jobs:
-                for job in jobs:
-                    job_id = job['id']
-                    
-                    # Check if we have multiple updates for this job
-                    updates_count = supabase.table('worker_updates').select("id", count='exact').eq('job_id', job_id).execute()
-                    
-                    if updates_count.count and updates_count.count > 1:
-                        # Aggregate the updates
-                        aggregated_state = await aggregate_updates(supabase, job_id)
-                        
-                        if aggregated_state:
-                            # Save the global model
-                            model_url = await save_global_model(supabase, job_id, aggregated_state)
-                            
-                            if model_url:
-                                # Update the job with the aggregated model URL
-                                supabase.table('jobs').update({
-                                    'result_url': model_url
-                                }).eq('id', job_id).execute()
-                                
-                                print(f"[+] Job {job_id} aggregation complete: {model_url}")
+            # Only jobs with new worker updates since their last aggregation come back
+            if use_queue:
+                try:
+                    ready = await asyncio.to_thread(claim_aggregation_batch, supabase)
+                except Exception as e:
+                    print(f"[!] Aggregation queue unavailable (run database/aggregation.sql), rescanning jobs: {e}")
+                    use_queue = False
+            if not use_queue:
+                ready = await asyncio.to_thread(scan_completed_jobs, supabase)
+
+            if ready:
+                aggregated = 0
+                for item in ready:
+                    aggregated += await aggregate_job(supabase, item, use_queue)
+                # More may be queued; check again without waiting unless everything failed
+                if use_queue and aggregated:
+                    continue
             else:
                 print(".", end="", flush=True)
             
         except Exception as e:
             print(f"\n[!] Aggregator Error: {e}")
             
-        await asyncio.sleep(10)
+        # Fast polling again if the push feed drops
+        await job_events.wait(FALLBACK_POLL_INTERVAL if job_events.push else 10)
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,234 @@
+"""
+On-disk content-addressed cache for training scripts, datasets and model weights.
+
+Bodies are stored once per sha256 under ARTIFACT_CACHE_DIR/blobs, so two
+URLs serving the same bytes share one file. A SQLite index maps each URL to
+its blob and the ETag / Last-Modified it was served with. A URL checked
+within the last ARTIFACT_CACHE_REVALIDATE seconds is served from disk
+without a request; after that it is revalidated with a conditional GET, and a
+304 keeps the cached blob.
+
+The cache is bounded to ARTIFACT_CACHE_MAX_MB, evicting least recently used
+blobs. Concurrent requests for the same URL share one download.
+
+Shard URLs (dataset_shards) are cached as their own blobs, holding only the
+shard's view of the dataset; they are refetched, not revalidated, when stale.
+"""
+import hashlib
+import io
+import mmap
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+import dataset_shards
+import http_client
+
+ARTIFACT_CACHE_DIR = os.environ.get("ARTIFACT_CACHE_DIR", "artifact_cache")
+ARTIFACT_CACHE_MAX_MB = int(os.environ.get("ARTIFACT_CACHE_MAX_MB", "2048"))
+ARTIFACT_CACHE_REVALIDATE = float(os.environ.get("ARTIFACT_CACHE_REVALIDATE", "300"))  # Seconds a URL is trusted before a conditional GET
+TOUCH_FLUSH_INTERVAL = 5.0  # Seconds cache-hit recency updates are held in memory before one batched write
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_blobs_last_used ON blobs(last_used);
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL REFERENCES blobs(sha256),
+    etag TEXT,
+    last_modified TEXT,
+    checked_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_urls_sha256 ON urls(sha256);
+"""
+
+class ArtifactCache:
+    """Thread-safe URL -> local file cache."""
+
+    def __init__(self, root: str = ARTIFACT_CACHE_DIR, max_mb: int = ARTIFACT_CACHE_MAX_MB,
+                 revalidate: float = ARTIFACT_CACHE_REVALIDATE):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_mb << 20
+        self.revalidate = revalidate
+        os.makedirs(os.path.join(self.root, 'blobs'), exist_ok=True)
+        os.makedirs(os.path.join(self.root, 'tmp'), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(self.root, 'index.db'), check_same_thread=False, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(SCHEMA)
+        self._in_flight = {}  # url -> Future of the blob path
+        self._last_used = {}  # sha256 -> time of a hit not yet written to the index
+        self._flushed_at = time.time()
+        self.hits = self.misses = self.revalidated = 0
+        self.bytes_downloaded = 0
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.root, 'blobs', sha256[:2], sha256)
+
+    def get_path(self, url: str) -> str:
+        """Local path of the artifact at `url`, downloading or revalidating it if needed."""
+        with self._lock:
+            future = self._in_flight.get(url)
+            owner = future is None
+            if owner:
+                future = self._in_flight[url] = Future()
+        if not owner:
+            return future.result()  # Someone else is already fetching it
+
+        try:
+            path = self._resolve(url)
+            future.set_result(path)
+            return path
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[url]
+
+    def get_bytes(self, url: str) -> bytes:
+        with open(self.get_path(url), 'rb') as f:
+            return f.read()
+
+    def get_text(self, url: str, encoding: str = 'utf-8') -> str:
+        return self.get_bytes(url).decode(encoding)
+
+    def open_mmap(self, url: str):
+        """Read-only memory map of the artifact (file-like: read, seek, readline, slicing)."""
+        with open(self.get_path(url), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return io.BytesIO()  # Empty files can't be mapped
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _resolve(self, url: str) -> str:
+        with self._lock:
+            entry = self._db.execute("SELECT * FROM urls WHERE url = ?", (url,)).fetchone()
+        if entry is not None and not os.path.exists(self.blob_path(entry['sha256'])):
+            entry = None  # Blob removed from disk behind our back
+
+        if entry is not None and time.time() - entry['checked_at'] < self.revalidate:
+            self.hits += 1
+            self._touch(url, entry['sha256'])
+            return self.blob_path(entry['sha256'])
+
+        if dataset_shards.parse_shard_url(url):
+            self.misses += 1
+            sha256, size = self._store(dataset_shards.iter_shard(url))
+            etag = last_modified = None
+        else:
+            headers = {}
+            if entry is not None:
+                if entry['etag']:
+                    headers['If-None-Match'] = entry['etag']
+                if entry['last_modified']:
+                    headers['If-Modified-Since'] = entry['last_modified']
+
+            with http_client.get(url, headers=headers, stream=True) as response:
+                if response.status_code == 304 and entry is not None:
+                    self.revalidated += 1
+                    self._touch(url, entry['sha256'], checked=True)
+                    return self.blob_path(entry['sha256'])
+                response.raise_for_status()
+                self.misses += 1
+                sha256, size = self._store(response.iter_content(chunk_size=http_client.CHUNK_SIZE))
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+        self.bytes_downloaded += size
+
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO blobs (sha256, size, last_used) VALUES (?, ?, ?) "
+                "ON CONFLICT(sha256) DO UPDATE SET last_used = excluded.last_used",
+                (sha256, size, now))
+            self._db.execute(
+                "INSERT OR REPLACE INTO urls (url, sha256, etag, last_modified, checked_at) VALUES (?, ?, ?, ?, ?)",
+                (url, sha256, etag, last_modified, now))
+            self._last_used.pop(sha256, None)
+            self._db.commit()
+            self._evict(keep=sha256)
+        return self.blob_path(sha256)
+
+    def _store(self, chunks) -> tuple:
+        """Write a body, given as chunks, into the blob store. Returns (sha256, size)."""
+        tmp_path = os.path.join(self.root, 'tmp', uuid.uuid4().hex)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            sha256 = digest.hexdigest()
+            path = self.blob_path(sha256)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)  # Same content twice just replaces identical bytes
+            return sha256, size
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def _touch(self, url: str, sha256: str, checked: bool = False):
+        """Record a use of the blob. Hits are batched; a revalidation is written at once."""
+        now = time.time()
+        with self._lock:
+            self._last_used[sha256] = now
+            if checked:
+                self._db.execute("UPDATE urls SET checked_at = ? WHERE url = ?", (now, url))
+                self._flush_touches()
+            elif now - self._flushed_at >= TOUCH_FLUSH_INTERVAL:
+                self._flush_touches()
+
+    def _flush_touches(self):
+        """Write the batched last_used times in one commit. Caller holds the lock."""
+        if self._last_used:
+            self._db.executemany("UPDATE blobs SET last_used = ? WHERE sha256 = ?",
+                                 [(used, sha256) for sha256, used in self._last_used.items()])
+            self._last_used.clear()
+        self._db.commit()
+        self._flushed_at = time.time()
+
+    def _evict(self, keep: str = None):
+        """Drop least recently used blobs until the cache fits. Caller holds the lock."""
+        self._flush_touches()  # Evict by up-to-date recency
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for row in self._db.execute("SELECT sha256, size FROM blobs ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            if row['sha256'] == keep:
+                continue  # The artifact just fetched stays even if it alone exceeds the bound
+            self._db.execute("DELETE FROM urls WHERE sha256 = ?", (row['sha256'],))
+            self._db.execute("DELETE FROM blobs WHERE sha256 = ?", (row['sha256'],))
+            try:
+                os.unlink(self.blob_path(row['sha256']))  # Open maps of it stay valid until closed
+            except FileNotFoundError:
+                pass
+            total -= row['size']
+        self._db.commit()
+
+    def urls(self) -> list:
+        """Every URL with a cached body (published to the scheduler as a Bloom digest)."""
+        with self._lock:
+            return [row['url'] for row in self._db.execute("SELECT url FROM urls")]
+
+    def stats(self) -> dict:
+        with self._lock:
+            row = self._db.execute("SELECT COUNT(*) AS n, COALESCE(SUM(size), 0) AS size FROM blobs").fetchone()
+        return {'blobs': row['n'], 'size_mb': row['size'] / 2**20,
+                'hits': self.hits, 'misses': self.misses, 'revalidated': self.revalidated,
+                'downloaded_mb': self.bytes_downloaded / 2**20}
+
+    def close(self):
+        with self._lock:
+            self._flush_touches()
+            self._db.close()
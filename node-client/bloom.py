@@ -0,0 +1,50 @@
+"""
+Bloom filter digest of the artifacts a worker has cached.
+
+Workers publish it as nodes.artifact_bloom with each heartbeat, and the
+claim RPCs test each job's precomputed hash words (jobs.*_bloom_words,
+from public.bloom_words) against it to prefer jobs whose script, dataset
+or model the worker already holds. Both sides hash the same way, so the
+layout here must match the SQL:
+
+    position_i = big-endian uint32 of sha256(key)[4i:4i+4] mod (8 * len(bits)),  i < BLOOM_HASHES
+    bit n      = bits[n // 8] >> (n % 8) & 1   (Postgres get_bit order)
+"""
+import hashlib
+import os
+
+BLOOM_BITS = int(os.environ.get("ARTIFACT_BLOOM_BITS", "8192"))  # Digest size; ~0.2% false positives at 500 artifacts
+BLOOM_HASHES = 4  # Must match public.bloom_hashes()
+
+class BloomFilter:
+    def __init__(self, bits: int = BLOOM_BITS, hashes: int = BLOOM_HASHES):
+        if bits <= 0 or bits % 8:
+            raise ValueError("Bloom filter size must be a positive multiple of 8 bits")
+        if not 0 < hashes <= 8:
+            raise ValueError("Bloom filter needs 1-8 hashes (one sha256 digest)")
+        self.bits = bytearray(bits // 8)
+        self.hashes = hashes
+
+    @classmethod
+    def from_keys(cls, keys, bits: int = BLOOM_BITS, hashes: int = BLOOM_HASHES) -> 'BloomFilter':
+        bloom = cls(bits, hashes)
+        for key in keys:
+            bloom.add(key)
+        return bloom
+
+    def _positions(self, key: str):
+        digest = hashlib.sha256(key.encode()).digest()
+        size = len(self.bits) * 8
+        for i in range(self.hashes):
+            yield int.from_bytes(digest[4 * i:4 * i + 4], 'big') % size
+
+    def add(self, key: str):
+        for n in self._positions(key):
+            self.bits[n >> 3] |= 1 << (n & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[n >> 3] >> (n & 7) & 1 for n in self._positions(key))
+
+    def to_postgres(self) -> str:
+        """bytea literal for PostgREST."""
+        return '\\x' + self.bits.hex()
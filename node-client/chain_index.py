@@ -0,0 +1,265 @@
+"""
+Local index of OblivionManager job state, built from contract events.
+
+ChainIndex follows JobCreated, JobProcessing, JobCompleted, JobExpired,
+JobCancelled and WorkerSlashed logs by block range. It stores them in a small
+SQLite file and keeps a per-job state table, so settlement and the contract
+tools can look job state up locally instead of calling getJob() each time.
+
+Each sync re-reads the last CHAIN_INDEX_REORG_DEPTH blocks, so reorged logs
+are replaced and the affected jobs are rebuilt from their events. Jobs
+created before the indexed range aren't known; get_job() returns None and
+callers fall back to an RPC read.
+"""
+import os
+import sqlite3
+import threading
+
+from eth_utils import event_abi_to_log_topic
+
+CHAIN_INDEX_PATH = os.environ.get("CHAIN_INDEX_PATH", "chain_index.db")
+CHAIN_INDEX_START_BLOCK = os.environ.get("CHAIN_INDEX_START_BLOCK")  # Default: CHAIN_INDEX_LOOKBACK blocks before the first sync
+CHAIN_INDEX_LOOKBACK = int(os.environ.get("CHAIN_INDEX_LOOKBACK", "50000"))
+CHAIN_INDEX_BATCH_BLOCKS = int(os.environ.get("CHAIN_INDEX_BATCH_BLOCKS", "2000"))  # Blocks per eth_getLogs call
+CHAIN_INDEX_REORG_DEPTH = int(os.environ.get("CHAIN_INDEX_REORG_DEPTH", "5"))
+CHAIN_INDEX_POLL_INTERVAL = float(os.environ.get("CHAIN_INDEX_POLL_INTERVAL", "5"))  # Seconds between syncs when following
+
+# OblivionManager.JobStatus
+STATUS_NAMES = ['Pending', 'Processing', 'Completed', 'Cancelled', 'Slashed', 'Expired']
+PENDING, PROCESSING, COMPLETED, CANCELLED, SLASHED, EXPIRED = range(6)
+
+INDEXED_EVENTS = ('JobCreated', 'JobProcessing', 'JobCompleted', 'JobExpired', 'JobCancelled', 'WorkerSlashed')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS events (
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    tx_hash TEXT NOT NULL,
+    event TEXT NOT NULL,
+    job_id INTEGER NOT NULL,
+    account TEXT,          -- requester, provider or slashed worker
+    job_type INTEGER,
+    reward TEXT,           -- wei, as text (exceeds SQLite integers)
+    update_hash TEXT,
+    PRIMARY KEY (block_number, log_index)
+);
+CREATE INDEX IF NOT EXISTS idx_events_job ON events(job_id);
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id INTEGER PRIMARY KEY,
+    status INTEGER NOT NULL,
+    requester TEXT,
+    provider TEXT,
+    job_type INTEGER,
+    reward TEXT,
+    update_hash TEXT,
+    updated_block INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+"""
+
+def apply_event(job: dict, event: dict) -> dict:
+    """Fold one event into a job's state (mirrors the contract's transitions)."""
+    kind = event['event']
+    job = dict(job or {'job_id': event['job_id'], 'status': PENDING})
+    if kind == 'JobCreated':
+        job.update(status=PENDING, requester=event['account'], job_type=event['job_type'], reward=event['reward'])
+    elif kind == 'JobProcessing':
+        job.update(status=PROCESSING, provider=event['account'])
+    elif kind == 'JobCompleted':
+        job.update(status=COMPLETED, provider=event['account'], update_hash=event['update_hash'])
+    elif kind == 'JobExpired':
+        job.update(status=EXPIRED)
+    elif kind == 'JobCancelled':
+        job.update(status=CANCELLED)
+    elif kind == 'WorkerSlashed' and job['status'] == PROCESSING:
+        # expireJob also emits WorkerSlashed, after JobExpired; only slashWorker leaves a processing job
+        job.update(status=SLASHED)
+    job['updated_block'] = event['block_number']
+    return job
+
+class ChainIndex:
+    """SQLite-backed job state for one contract. Thread-safe."""
+
+    def __init__(self, w3, contract, path: str = CHAIN_INDEX_PATH, start_block: int = None,
+                 batch_blocks: int = CHAIN_INDEX_BATCH_BLOCKS, reorg_depth: int = CHAIN_INDEX_REORG_DEPTH):
+        self.w3 = w3
+        self.contract = contract
+        self.path = path
+        self.batch_blocks = batch_blocks
+        self.reorg_depth = reorg_depth
+        if start_block is None and CHAIN_INDEX_START_BLOCK:
+            start_block = int(CHAIN_INDEX_START_BLOCK)
+        self.start_block = start_block
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(SCHEMA)
+        self._check_contract()
+        self._event_by_topic = {}
+        for name in INDEXED_EVENTS:
+            event = getattr(contract.events, name)
+            self._event_by_topic[event_abi_to_log_topic(event.abi)] = event
+        self._follower = None
+        self._stop = threading.Event()
+
+    def _check_contract(self):
+        """An index file belongs to one contract; start over if the address changed."""
+        address = self.contract.address.lower()
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'contract'").fetchone()
+        if row and row['value'] != address:
+            self._db.executescript("DELETE FROM events; DELETE FROM jobs; DELETE FROM meta;")
+        self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('contract', ?)", (address,))
+        self._db.commit()
+
+    @property
+    def last_block(self):
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'last_block'").fetchone()
+        return int(row['value']) if row else None
+
+    # Syncing
+
+    def sync(self, to_block: int = None) -> int:
+        """Index new blocks up to `to_block` (default latest). Returns the number of events stored."""
+        with self._lock:
+            latest = self.w3.eth.block_number if to_block is None else to_block
+            last = self.last_block
+            if last is None:
+                first = self.start_block if self.start_block is not None else max(0, latest - CHAIN_INDEX_LOOKBACK)
+            else:
+                # Re-read the most recent blocks in case they were reorganized
+                first = max(self.start_block or 0, last - self.reorg_depth + 1)
+            if first > latest:
+                return 0
+
+            touched = {r['job_id'] for r in self._db.execute(
+                "SELECT DISTINCT job_id FROM events WHERE block_number >= ?", (first,))}
+            self._db.execute("DELETE FROM events WHERE block_number >= ?", (first,))
+
+            stored = 0
+            for event in self._fetch(first, latest):
+                self._db.execute(
+                    "INSERT OR REPLACE INTO events (block_number, log_index, tx_hash, event, job_id, account, job_type, reward, update_hash) "
+                    "VALUES (:block_number, :log_index, :tx_hash, :event, :job_id, :account, :job_type, :reward, :update_hash)",
+                    event)
+                touched.add(event['job_id'])
+                stored += 1
+
+            for job_id in touched:
+                self._rebuild_job(job_id)
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_block', ?)", (str(latest),))
+            self._db.commit()
+            return stored
+
+    def _fetch(self, first: int, last: int):
+        """Decoded events in block order, fetched in ranges (halved if the node refuses a range)."""
+        topics = [['0x' + topic.hex() for topic in self._event_by_topic]]
+        start, size = first, self.batch_blocks
+        while start <= last:
+            end = min(start + size - 1, last)
+            try:
+                logs = self.w3.eth.get_logs({
+                    'address': self.contract.address,
+                    'fromBlock': start,
+                    'toBlock': end,
+                    'topics': topics,
+                })
+            except Exception:
+                if size == 1:
+                    raise
+                size = max(1, size // 2)
+                continue
+            for log in sorted(logs, key=lambda l: (l['blockNumber'], l['logIndex'])):
+                yield self._decode(log)
+            start = end + 1
+
+    def _decode(self, log) -> dict:
+        event = self._event_by_topic[bytes(log['topics'][0])]
+        decoded = event().process_log(log)
+        args = decoded['args']
+        account = args.get('requester') or args.get('provider') or args.get('worker')
+        update_hash = args.get('updateHash')
+        return {
+            'block_number': log['blockNumber'],
+            'log_index': log['logIndex'],
+            'tx_hash': bytes(log['transactionHash']).hex(),
+            'event': decoded['event'],
+            'job_id': args['jobId'],
+            'account': account,
+            'job_type': int(args['jobType']) if 'jobType' in args else None,
+            'reward': str(args['reward']) if 'reward' in args else None,
+            'update_hash': update_hash.hex() if update_hash is not None else None,
+        }
+
+    def _rebuild_job(self, job_id: int):
+        job = None
+        for event in self._db.execute(
+                "SELECT * FROM events WHERE job_id = ? ORDER BY block_number, log_index", (job_id,)):
+            job = apply_event(job, dict(event))
+        if job is None:
+            self._db.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+            return
+        job = {k: job.get(k) for k in ('job_id', 'status', 'requester', 'provider', 'job_type', 'reward', 'update_hash', 'updated_block')}
+        self._db.execute(
+            "INSERT OR REPLACE INTO jobs (job_id, status, requester, provider, job_type, reward, update_hash, updated_block) "
+            "VALUES (:job_id, :status, :requester, :provider, :job_type, :reward, :update_hash, :updated_block)",
+            job)
+
+    # Background following
+
+    def follow(self, interval: float = CHAIN_INDEX_POLL_INTERVAL):
+        """Keep syncing in a daemon thread until stop()."""
+        def run():
+            while not self._stop.is_set():
+                try:
+                    self.sync()
+                except Exception as e:
+                    print(f"[!] Chain index sync failed: {e}")
+                self._stop.wait(interval)
+
+        if self._follower is None:
+            self._follower = threading.Thread(target=run, name='chain-index', daemon=True)
+            self._follower.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._follower is not None:
+            self._follower.join(5)
+
+    # Queries
+
+    def get_job(self, job_id: int):
+        """Indexed state of one job as a dict, or None if it isn't in the index."""
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['status_name'] = STATUS_NAMES[job['status']]
+        return job
+
+    def jobs(self, status: int = None, provider: str = None, limit: int = 100) -> list:
+        query, params = "SELECT * FROM jobs WHERE 1 = 1", []
+        if status is not None:
+            query += " AND status = ?"
+            params.append(status)
+        if provider is not None:
+            query += " AND provider = ?"
+            params.append(provider)
+        query += " ORDER BY job_id DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return [dict(r) for r in self._db.execute(query, params)]
+
+    def status_counts(self) -> dict:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {STATUS_NAMES[r['status']]: r['n'] for r in rows}
+
+    def close(self):
+        self.stop()
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,132 @@
+"""
+Batched job completion for OBLIVION workers.
+
+A finished job is one complete_job call carrying everything the row needs:
+status, result_url, inference_result, logs_url and the worker update
+(hash, URL, sample count). CompletionWriter collects completions from all
+job slots for up to COMPLETION_BATCH_WINDOW seconds or COMPLETION_BATCH_SIZE
+jobs and writes them with a single complete_jobs_batch call.
+
+Databases without the batch RPC get one complete_job call per job, and
+without the extended complete_job the old sequence of table writes.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+COMPLETION_BATCH_SIZE = int(os.environ.get("COMPLETION_BATCH_SIZE", "32"))  # Jobs per complete_jobs_batch call
+COMPLETION_BATCH_WINDOW = float(os.environ.get("COMPLETION_BATCH_WINDOW", "0.25"))  # Seconds a batch stays open
+
+COMPLETION_FIELDS = ('result_url', 'inference_result', 'logs_url', 'update_hash', 'update_url', 'num_samples')
+
+class CompletionWriter:
+    """Background writer; complete() returns a Future resolving to True if the job row was completed."""
+
+    def __init__(self, supabase, provider_address: str, batch_size: int = COMPLETION_BATCH_SIZE,
+                 batch_window: float = COMPLETION_BATCH_WINDOW):
+        self.supabase = supabase
+        self.provider_address = provider_address
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self._requests = queue.Queue()
+        self._batch_supported = True
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='completion', daemon=True)
+            self._thread.start()
+
+    def close(self, timeout: float = 30):
+        """Write whatever is queued, then stop."""
+        self._requests.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def complete(self, job_id: int, status: str = 'completed', **fields) -> Future:
+        unknown = set(fields) - set(COMPLETION_FIELDS)
+        if unknown:
+            raise TypeError(f"Unknown completion fields: {', '.join(sorted(unknown))}")
+        future = Future()
+        item = {'job_id': job_id, 'status': status}
+        item.update({k: v for k, v in fields.items() if v is not None})
+        if self._thread is None:
+            self._write([(item, future)])  # Not started: write inline
+        else:
+            self._requests.put((item, future))
+        return future
+
+    def _run(self):
+        batch = []
+        opened = 0.0
+        while True:
+            timeout = None
+            if batch:
+                timeout = max(0.0, opened + self.batch_window - time.monotonic())
+            try:
+                request = self._requests.get(timeout=timeout)
+            except queue.Empty:
+                request = False
+            if request is None:
+                self._write(batch)
+                return
+            if request:
+                if not batch:
+                    opened = time.monotonic()
+                batch.append(request)
+            if batch and (len(batch) >= self.batch_size or time.monotonic() - opened >= self.batch_window):
+                self._write(batch)
+                batch = []
+
+    def _write(self, batch: list):
+        if not batch:
+            return
+        if len(batch) > 1 and self._batch_supported:
+            try:
+                result = self.supabase.rpc('complete_jobs_batch', {
+                    'p_provider_address': self.provider_address,
+                    'p_completions': [item for item, _ in batch],
+                }).execute()
+                completed = {row['job_id']: row['completed'] for row in result.data or []}
+                for item, future in batch:
+                    future.set_result(bool(completed.get(item['job_id'])))
+                return
+            except Exception as e:
+                print(f"[!] RPC complete_jobs_batch failed, completing jobs one at a time: {e}")
+                if getattr(e, 'code', None) == 'PGRST202':  # Function doesn't exist in this database
+                    self._batch_supported = False
+        for item, future in batch:
+            try:
+                future.set_result(self._complete_one(item))
+            except Exception as e:
+                future.set_exception(e)
+
+    def _complete_one(self, item: dict) -> bool:
+        params = {'p_job_id': item['job_id'], 'p_provider_address': self.provider_address, 'p_status': item['status']}
+        params.update({f'p_{k}': item[k] for k in COMPLETION_FIELDS if k in item})
+        try:
+            result = self.supabase.rpc('complete_job', params).execute()
+            return result.data == True
+        except Exception as e:
+            print(f"[!] RPC complete_job failed, using fallback: {e}")
+        return self._complete_fallback(item)
+
+    def _complete_fallback(self, item: dict) -> bool:
+        """Direct table writes for databases without the extended complete_job."""
+        try:
+            if item.get('update_hash'):
+                self.supabase.table('worker_updates').insert({
+                    'job_id': item['job_id'],
+                    'worker_address': self.provider_address,
+                    'update_hash': item['update_hash'],
+                    'update_url': item.get('update_url'),
+                    'num_samples': item.get('num_samples'),
+                }).execute()
+            update_data = {'status': item['status']}
+            update_data.update({k: item[k] for k in ('result_url', 'inference_result', 'logs_url') if k in item})
+            self.supabase.table('jobs').update(update_data).eq('id', item['job_id']).execute()
+            return True
+        except Exception:
+            return False
@@ -0,0 +1,113 @@
+"""
+Shard views of a CSV dataset for data-parallel training jobs.
+
+A shard job trains on part of its parent's dataset (database/job_sharding.sql).
+The worker hands the sandbox the dataset URL with a fragment naming the
+shard, e.g. `https://host/data.csv#shard=bytes:1048576-2097152`, and the
+artifact cache fetches only that view:
+
+  bytes  Only the byte range is downloaded (HTTP Range). The shard holds
+         every line that starts inside [start, end), so lines cut by a
+         boundary belong to exactly one shard.
+  rows   Data rows [start, end), for servers without Range support. The
+         file is streamed and rows outside the range are skipped.
+
+Every shard starts with the dataset's header line.
+"""
+import re
+
+import http_client
+
+SHARD_FRAGMENT = re.compile(r'#shard=(bytes|rows):(\d+)-(\d*)$')
+
+def shard_url(dataset_url: str, unit: str, start: int, end: int = None) -> str:
+    return f"{dataset_url}#shard={unit}:{start}-{'' if end is None else end}"
+
+def parse_shard_url(url: str):
+    """(dataset_url, unit, start, end) for a shard URL, else None. end is None for 'to the end'."""
+    match = SHARD_FRAGMENT.search(url)
+    if not match:
+        return None
+    unit, start, end = match.groups()
+    return url[:match.start()], unit, int(start), int(end) if end else None
+
+def job_dataset_url(job: dict) -> str:
+    """The dataset URL a job should train on: its shard view for shard jobs."""
+    dataset_url = job.get('dataset_url') or job.get('data_hash', '')
+    if job.get('shard_unit') and dataset_url.startswith('http'):
+        return shard_url(dataset_url, job['shard_unit'], job['shard_start'], job.get('shard_end'))
+    return dataset_url
+
+def _read_header(dataset_url: str) -> bytes:
+    """The first line of the dataset, newline included."""
+    head = b''
+    for chunk in http_client.iter_chunks(dataset_url, chunk_size=64 << 10):
+        head += chunk
+        newline = head.find(b'\n')
+        if newline >= 0:
+            return head[:newline + 1]
+    return head + b'\n' if head else b''
+
+def _iter_byte_shard(dataset_url: str, start: int, end):
+    if start > 0:
+        yield _read_header(dataset_url)
+    # Start one byte early: if it's a newline, the line at `start` is ours
+    offset = max(start - 1, 0)
+    with http_client.get(dataset_url, headers={'Range': f'bytes={offset}-'}, stream=True) as response:
+        response.raise_for_status()
+        position = offset if response.status_code == 206 else 0  # 200: server ignored the range
+        skipping = start > 0  # Until the first newline at or after start - 1
+        last = b'\n'
+        for chunk in response.iter_content(chunk_size=http_client.CHUNK_SIZE):
+            chunk_start = position
+            position += len(chunk)
+            if position <= start - 1:
+                continue  # Before our range (full body served)
+            if chunk_start < start - 1:
+                chunk = chunk[start - 1 - chunk_start:]
+                chunk_start = start - 1
+            if skipping:
+                newline = chunk.find(b'\n')
+                if newline < 0:
+                    continue
+                chunk = chunk[newline + 1:]
+                chunk_start += newline + 1
+                skipping = False
+                if end is not None and chunk_start >= end:
+                    return  # No line starts inside the range
+            if end is not None and position >= end:
+                # Finish the line that starts before `end`, then stop
+                newline = chunk.find(b'\n', max(end - 1 - chunk_start, 0))
+                if newline >= 0:
+                    yield chunk[:newline + 1]
+                    return
+            if chunk:
+                last = chunk[-1:]
+                yield chunk
+        if not skipping and last != b'\n':
+            yield b'\n'  # Unterminated last line
+
+def _iter_row_shard(dataset_url: str, start: int, end):
+    row = -1  # The header is line -1
+    pending = b''
+    for chunk in http_client.iter_chunks(dataset_url):
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        kept = []
+        for line in lines:
+            if row < 0 or start <= row:
+                if end is not None and row >= end:
+                    yield b''.join(kept)
+                    return
+                kept.append(line + b'\n')
+            row += 1
+        yield b''.join(kept)
+    if pending and (end is None or row < end) and start <= row:
+        yield pending + b'\n'
+
+def iter_shard(url: str):
+    """Body of the shard view at `url` (a shard URL) in chunks."""
+    dataset_url, unit, start, end = parse_shard_url(url)
+    if unit == 'bytes':
+        return _iter_byte_shard(dataset_url, start, end)
+    return _iter_row_shard(dataset_url, start, end)
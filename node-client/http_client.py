@@ -0,0 +1,236 @@
+"""
+Shared HTTP connection pools for the OBLIVION worker and aggregator.
+
+Training scripts, datasets, models and worker updates are all fetched
+through one process-wide requests.Session, so connections (and their TLS
+sessions) are kept alive and reused instead of being opened per download.
+Each host gets at most HTTP_MAX_PER_HOST connections; idempotent requests
+are retried with exponential backoff on connection errors, 429 and 5xx.
+
+FetchProxy serves the same session to sandboxed training scripts: the
+sandbox can't import network modules, so its `fetch(url)` asks the worker
+over a Unix socket and the body is streamed back in chunks. Sandbox fetches
+only reach public addresses: loopback, private, link-local (cloud metadata)
+and other non-global hosts are refused, including as redirect targets.
+"""
+import contextlib
+import ipaddress
+import json
+import os
+import socket
+import struct
+import tempfile
+import threading
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+HTTP_MAX_PER_HOST = int(os.environ.get("HTTP_MAX_PER_HOST", "16"))  # Pooled connections per host
+HTTP_MAX_HOSTS = int(os.environ.get("HTTP_MAX_HOSTS", "10"))  # Hosts with a kept-alive pool
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "3"))
+HTTP_BACKOFF = float(os.environ.get("HTTP_BACKOFF", "0.5"))  # Seconds; doubles per retry
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "30"))  # Connect/read timeout in seconds
+SANDBOX_FETCH_MAX_MB = int(os.environ.get("SANDBOX_FETCH_MAX_MB", "1024"))  # Largest body a sandboxed script may fetch
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+CHUNK_SIZE = 1 << 20
+
+_session = None
+_session_lock = threading.Lock()
+_restricted = threading.local()  # Set while serving a sandbox fetch
+
+def session() -> requests.Session:
+    """The process-wide pooled session (created on first use)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = Retry(
+                    total=HTTP_RETRIES,
+                    backoff_factor=HTTP_BACKOFF,
+                    status_forcelist=RETRY_STATUSES,
+                    allowed_methods=frozenset(['GET', 'HEAD']),
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(pool_connections=HTTP_MAX_HOSTS, pool_maxsize=HTTP_MAX_PER_HOST,
+                                      pool_block=True, max_retries=retry)
+                s = requests.Session()
+                s.mount('http://', adapter)
+                s.mount('https://', adapter)
+                s.hooks['response'].append(_check_redirect)
+                _session = s
+    return _session
+
+def is_public_host(host: str) -> bool:
+    """True if every address `host` resolves to is globally routable."""
+    try:
+        infos = socket.getaddrinfo(host, None)
+    except (socket.gaierror, UnicodeError):
+        return False
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split('%')[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global:
+            return False
+    return bool(infos)
+
+def check_public_url(url: str):
+    """Raise ValueError unless `url` is http(s) on a public host."""
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError(f"Only http(s) URLs can be fetched: {url}")
+    if not is_public_host(parts.hostname):
+        raise ValueError(f"Fetching non-public address {parts.hostname} is not allowed")
+
+@contextlib.contextmanager
+def public_only():
+    """Within this block, this thread's requests refuse redirects to non-public hosts."""
+    _restricted.active = True
+    try:
+        yield
+    finally:
+        _restricted.active = False
+
+def _check_redirect(response, **kwargs):
+    # Runs on every response, before requests follows a redirect
+    if getattr(_restricted, 'active', False) and response.is_redirect:
+        check_public_url(urljoin(response.url, response.headers['location']))
+
+def get(url: str, timeout: float = HTTP_TIMEOUT, **kwargs) -> requests.Response:
+    """GET through the shared pool. Pass stream=True to read the body incrementally."""
+    return session().get(url, timeout=timeout, **kwargs)
+
+def fetch_bytes(url: str, timeout: float = HTTP_TIMEOUT) -> bytes:
+    response = get(url, timeout=timeout)
+    response.raise_for_status()
+    return response.content
+
+def fetch_text(url: str, timeout: float = HTTP_TIMEOUT) -> str:
+    response = get(url, timeout=timeout)
+    response.raise_for_status()
+    return response.text
+
+def iter_chunks(url: str, chunk_size: int = CHUNK_SIZE, timeout: float = HTTP_TIMEOUT):
+    """Stream a body in chunks; the connection goes back to the pool once it's consumed."""
+    with get(url, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        yield from response.iter_content(chunk_size=chunk_size)
+
+# Sandbox fetch proxy
+
+END_OF_BODY = 0
+BODY_ERROR = 0xFFFFFFFF
+
+def _send_frame(sock, message: dict):
+    data = json.dumps(message).encode()
+    sock.sendall(struct.pack('>I', len(data)) + data)
+
+def _recv_exact(sock, n: int) -> bytes:
+    chunks = []
+    while n > 0:
+        chunk = sock.recv(min(n, CHUNK_SIZE))
+        if not chunk:
+            raise EOFError("Fetch proxy connection closed")
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b''.join(chunks)
+
+def _recv_frame(sock) -> dict:
+    (length,) = struct.unpack('>I', _recv_exact(sock, 4))
+    return json.loads(_recv_exact(sock, length).decode())
+
+class FetchProxy:
+    """
+    Unix socket server that performs GETs for sandboxed scripts with the
+    shared session, one thread per request.
+
+    Protocol (4-byte big-endian lengths, like the sandbox pipe):
+    request frame {'url': ...}; reply frame {'ok': True} or {'ok': False, 'error': ...};
+    then body chunks as length + bytes, ended by a 0 length, or by BODY_ERROR
+    and an error frame if the download fails part way. Only http(s) URLs on
+    public hosts are fetched (check_public_url), and redirects are held to the same rule.
+
+    With an artifact cache the body isn't streamed: the reply is
+    {'ok': True, 'path': ...} naming the cached file, which the sandbox maps.
+    """
+
+    def __init__(self, path: str = None, max_bytes: int = SANDBOX_FETCH_MAX_MB << 20, cache=None):
+        self.path = path or os.path.join(tempfile.gettempdir(), f"oblivion-fetch-{os.getpid()}.sock")
+        self.max_bytes = max_bytes
+        self.cache = cache  # artifact_cache.ArtifactCache
+        self._server = None
+
+    def start(self) -> str:
+        if self._server is not None:
+            return self.path
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.path)
+        os.chmod(self.path, 0o600)
+        server.listen(64)
+        self._server = server
+        threading.Thread(target=self._accept, args=(server,), name='fetch-proxy', daemon=True).start()
+        return self.path
+
+    def _accept(self, server):
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return  # Closed
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        with conn:
+            try:
+                url = _recv_frame(conn).get('url', '')
+                try:
+                    check_public_url(url.split('#', 1)[0])
+                except ValueError as e:
+                    _send_frame(conn, {'ok': False, 'error': str(e)})
+                    return
+                with public_only():
+                    self._fetch(conn, url)
+            except OSError:
+                pass  # Sandbox went away (job killed or timed out)
+            except Exception as e:
+                try:
+                    _send_frame(conn, {'ok': False, 'error': str(e)})
+                except OSError:
+                    pass
+
+    def _fetch(self, conn, url: str):
+        if self.cache is not None:
+            path = self.cache.get_path(url)
+            if os.path.getsize(path) > self.max_bytes:
+                raise ValueError(f"Response exceeds {self.max_bytes >> 20} MB")
+            _send_frame(conn, {'ok': True, 'path': path})
+            return
+        with get(url, stream=True) as response:
+            if response.status_code >= 400:
+                _send_frame(conn, {'ok': False, 'error': f"HTTP {response.status_code} for {url}"})
+                return
+            _send_frame(conn, {'ok': True})
+            sent = 0
+            try:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    sent += len(chunk)
+                    if sent > self.max_bytes:
+                        raise ValueError(f"Response exceeds {self.max_bytes >> 20} MB")
+                    conn.sendall(struct.pack('>I', len(chunk)) + chunk)
+            except (requests.RequestException, ValueError) as e:
+                conn.sendall(struct.pack('>I', BODY_ERROR))
+                _send_frame(conn, {'error': str(e)})
+                return
+            conn.sendall(struct.pack('>I', END_OF_BODY))
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
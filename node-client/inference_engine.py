@@ -0,0 +1,220 @@
+"""
+Inference for OBLIVION jobs: cached models and micro-batched forward passes.
+
+ModelCache keeps constructed, eval-mode models in memory, keyed by model
+URL and the content hash of the weights (from the artifact cache), so a
+model is downloaded and built once and rebuilt only if its weights change.
+A model served within the artifact cache's revalidation window is returned
+straight from memory, without touching the cache index.
+
+MicroBatcher merges concurrent requests for the same model into one
+forward pass. The first request opens a batch and waits up to
+INFERENCE_MAX_WAIT_MS for others to join, but only while other requests
+are in progress; a lone request runs at once. The batch runs as soon as it
+holds INFERENCE_MAX_BATCH rows or every request in progress.
+"""
+import contextlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import torch
+import torch.nn as nn
+
+INFERENCE_MODEL_CACHE_SIZE = int(os.environ.get("INFERENCE_MODEL_CACHE_SIZE", "8"))  # Built models kept in memory
+INFERENCE_MAX_BATCH = int(os.environ.get("INFERENCE_MAX_BATCH", "64"))  # Rows per forward pass
+INFERENCE_MAX_WAIT_MS = float(os.environ.get("INFERENCE_MAX_WAIT_MS", "10"))  # How long a batch waits to fill
+
+def build_sequential(state_dict: dict):
+    """
+    Rebuild an nn.Sequential of Linear layers with ReLU between them from its
+    state dict ('0.weight', '2.weight', ...). Returns None for other layouts.
+    """
+    if '0.weight' not in state_dict:
+        return None
+    layers = []
+    layer_idx = 0
+    while f'{layer_idx}.weight' in state_dict:
+        out_f, in_f = state_dict[f'{layer_idx}.weight'].shape
+        layers.append(nn.Linear(in_f, out_f))
+        if f'{layer_idx + 2}.weight' in state_dict:
+            layers.append(nn.ReLU())
+        layer_idx += 2
+    model = nn.Sequential(*layers)
+    model.load_state_dict(state_dict)
+    model.eval()
+    return model
+
+class ModelCache:
+    """LRU of built models by (model_url, weights hash). Thread-safe; each model is built once."""
+
+    def __init__(self, artifact_cache, size: int = INFERENCE_MODEL_CACHE_SIZE):
+        self.artifact_cache = artifact_cache
+        self.size = size
+        self._models = OrderedDict()
+        self._current = {}  # model_url -> (key, monotonic time its weights were last resolved)
+        self._building = {}  # key -> Lock held while the model is built
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, model_url: str):
+        """Returns (key, model); model is None if the weights aren't a Linear/ReLU stack."""
+        with self._lock:
+            current = self._current.get(model_url)
+            if (current is not None and current[0] in self._models and
+                    time.monotonic() - current[1] < self.artifact_cache.revalidate):
+                # The artifact cache would serve the same weights without checking
+                self._models.move_to_end(current[0])
+                self.hits += 1
+                return current[0], self._models[current[0]]
+
+        path = self.artifact_cache.get_path(model_url)
+        key = (model_url, os.path.basename(path))  # Blobs are named by their sha256
+        with self._lock:
+            self._current[model_url] = (key, time.monotonic())
+            if key in self._models:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return key, self._models[key]
+            build_lock = self._building.setdefault(key, threading.Lock())
+
+        with build_lock:
+            with self._lock:
+                if key in self._models:  # Built while we waited
+                    self.hits += 1
+                    return key, self._models[key]
+            state_dict = torch.load(path, map_location='cpu', weights_only=True, mmap=True)
+            model = build_sequential(state_dict)
+            with self._lock:
+                self.misses += 1
+                self._models[key] = model
+                while len(self._models) > self.size:
+                    (evicted_url, _), _ = self._models.popitem(last=False)
+                    if self._current.get(evicted_url, (None,))[0] not in self._models:
+                        self._current.pop(evicted_url, None)
+                self._building.pop(key, None)
+            return key, model
+
+    def urls(self) -> list:
+        """Model URLs currently built and in memory."""
+        with self._lock:
+            return sorted({url for url, _ in self._models})
+
+class _Batch:
+    def __init__(self):
+        self.inputs = []
+        self.rows = 0
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.outputs = None
+        self.error = None
+
+class MicroBatcher:
+    """Runs concurrent requests for the same model as one forward pass."""
+
+    def __init__(self, max_batch: int = INFERENCE_MAX_BATCH, max_wait_ms: float = INFERENCE_MAX_WAIT_MS):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._open = {}  # key -> batch still accepting rows
+        self._lock = threading.Lock()
+        self._callers = 0  # Requests in progress that may still join a batch
+        self.batches = self.rows = 0
+
+    @contextlib.contextmanager
+    def caller(self):
+        """Count a request as in progress (e.g. while its model loads) so open batches wait for it."""
+        with self._lock:
+            self._callers += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._callers -= 1
+                for batch in self._open.values():
+                    if len(batch.inputs) >= self._callers:
+                        batch.full.set()  # Nobody else can join
+
+    def run(self, key, model: nn.Module, inputs: torch.Tensor) -> torch.Tensor:
+        """Forward `inputs` (rows x features) through `model`, batched with other callers using `key`."""
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None or batch.rows + len(inputs) > self.max_batch
+            if leader:
+                if batch is not None:
+                    batch.full.set()  # No room for us; let it run and start a new one
+                batch = self._open[key] = _Batch()
+            index = len(batch.inputs)
+            batch.inputs.append(inputs)
+            batch.rows += len(inputs)
+            if batch.rows >= self.max_batch:
+                batch.full.set()
+                self._open.pop(key, None)
+            elif len(batch.inputs) >= self._callers:
+                batch.full.set()  # Every request in progress is in it; don't wait for more
+
+        if leader:
+            batch.full.wait(self.max_wait)
+            with self._lock:
+                if self._open.get(key) is batch:
+                    del self._open[key]  # Closed: later callers start a new batch
+            self._execute(model, batch)
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.outputs[index]
+
+    def _execute(self, model: nn.Module, batch: _Batch):
+        try:
+            with torch.no_grad():
+                try:
+                    merged = model(torch.cat(batch.inputs))
+                    batch.outputs = list(torch.split(merged, [len(x) for x in batch.inputs]))
+                except RuntimeError:
+                    # Mismatched input shapes: the bad request fails alone
+                    batch.outputs = []
+                    for x in batch.inputs:
+                        try:
+                            batch.outputs.append(model(x))
+                        except RuntimeError as e:
+                            batch.outputs.append(e)
+            self.batches += 1
+            self.rows += batch.rows
+        except Exception as e:
+            batch.error = e
+        finally:
+            batch.done.set()
+
+class InferenceEngine:
+    """Model cache plus micro-batching: infer(model_url, data) -> nested list of outputs."""
+
+    def __init__(self, artifact_cache, cache_size: int = INFERENCE_MODEL_CACHE_SIZE,
+                 max_batch: int = INFERENCE_MAX_BATCH, max_wait_ms: float = INFERENCE_MAX_WAIT_MS):
+        self.models = ModelCache(artifact_cache, cache_size)
+        self.batcher = MicroBatcher(max_batch, max_wait_ms)
+
+    def infer(self, model_url: str, data):
+        """Returns the model outputs as a list of rows, or None if the model isn't a Linear/ReLU stack."""
+        with self.batcher.caller():
+            key, model = self.models.get(model_url)
+            if model is None:
+                return None
+            inputs = torch.as_tensor(data, dtype=torch.float32)
+            if inputs.dim() == 1:
+                inputs = inputs.unsqueeze(0)
+            output = self.batcher.run(key, model, inputs)
+        if isinstance(output, Exception):
+            raise output
+        return output.tolist()
+
+    def stats(self) -> dict:
+        batches = self.batcher.batches
+        return {
+            'models_cached': len(self.models._models),
+            'model_hits': self.models.hits,
+            'model_loads': self.models.misses,
+            'batches': batches,
+            'avg_batch_rows': self.batcher.rows / batches if batches else 0.0,
+        }
@@ -0,0 +1,255 @@
+"""
+Low-latency inference serving for the OBLIVION worker.
+
+Enabled with INFERENCE_SERVE_PORT and INFERENCE_SERVE_TOKEN. Clients POST
+to the worker directly instead of going through the jobs table:
+
+    POST /infer    {"model_url": ..., "data": [...]}
+                   -> {"output": [[...]], "latency_ms": ...}
+    GET  /metrics  request counts and p50/p99 latency
+    GET  /health
+
+/infer and /metrics need `Authorization: Bearer <INFERENCE_SERVE_TOKEN>`.
+The server listens on localhost unless INFERENCE_SERVE_HOST says otherwise.
+
+Requests run on the warm InferenceEngine, so concurrent requests for one
+model share a forward pass. The response doesn't wait for the database:
+each served request is queued and written to the jobs table as a completed
+inference job in batches, for audit and billing. Rows are billed to
+INFERENCE_SERVE_REQUESTER, the account that holds the token, never to an
+address named in the request.
+
+Plain asyncio HTTP/1.1 with keep-alive; no extra dependencies.
+"""
+import asyncio
+import hmac
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+INFERENCE_SERVE_HOST = os.environ.get("INFERENCE_SERVE_HOST", "127.0.0.1")
+INFERENCE_SERVE_TOKEN = os.environ.get("INFERENCE_SERVE_TOKEN", "")  # Shared bearer token clients must send (required)
+INFERENCE_SERVE_REQUESTER = os.environ.get("INFERENCE_SERVE_REQUESTER", "inference-api")  # requester_address billed for served requests
+INFERENCE_SERVE_THREADS = int(os.environ.get("INFERENCE_SERVE_THREADS", "64"))  # Requests waiting on a batch at once
+INFERENCE_AUDIT_INTERVAL = float(os.environ.get("INFERENCE_AUDIT_INTERVAL", "2"))  # Seconds between audit row flushes
+INFERENCE_AUDIT_BATCH = int(os.environ.get("INFERENCE_AUDIT_BATCH", "500"))  # Rows per insert
+INFERENCE_AUDIT_MAX_PENDING = 50000  # Oldest rows are dropped past this if the database is unreachable
+
+MAX_BODY_BYTES = 16 << 20
+LATENCY_WINDOW = 10000  # Recent requests the percentiles are computed over
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+class LatencyTracker:
+    """Rolling window of request latencies."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.errors = 0
+
+    def record(self, seconds: float, ok: bool = True):
+        self.samples.append(seconds * 1000)
+        self.count += 1
+        if not ok:
+            self.errors += 1
+
+    def percentile(self, p: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    def summary(self) -> dict:
+        return {
+            'requests': self.count,
+            'errors': self.errors,
+            'p50_ms': round(self.percentile(50), 3),
+            'p99_ms': round(self.percentile(99), 3),
+            'max_ms': round(max(self.samples), 3) if self.samples else 0.0,
+        }
+
+class AuditWriter:
+    """Batches served requests into jobs rows off the request path."""
+
+    def __init__(self, supabase, node_id: str):
+        self.supabase = supabase
+        self.node_id = node_id
+        self.pending = deque()
+        self.written = 0
+        self.dropped = 0
+        self._task = None
+
+    def record(self, requester: str, model_url: str, data, output, error: str = None):
+        if len(self.pending) >= INFERENCE_AUDIT_MAX_PENDING:
+            self.pending.popleft()
+            self.dropped += 1
+        self.pending.append({
+            'requester_address': requester,
+            'job_type': 'inference',
+            'status': 'failed' if error else 'completed',
+            'provider_address': self.node_id,
+            'model_url': model_url,
+            'input_data': json.dumps({'data': data}),
+            'inference_result': f"ERROR: {error}" if error else f"RESULT: {output}",
+        })
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(INFERENCE_AUDIT_INTERVAL)
+            await self.flush()
+
+    async def flush(self):
+        while self.pending:
+            rows = [self.pending.popleft() for _ in range(min(INFERENCE_AUDIT_BATCH, len(self.pending)))]
+            try:
+                await asyncio.to_thread(lambda: self.supabase.table('jobs').insert(rows).execute())
+                self.written += len(rows)
+            except Exception as e:
+                print(f"[!] Inference audit write failed ({len(rows)} rows kept): {e}")
+                self.pending.extendleft(reversed(rows))
+                return
+
+class InferenceServer:
+    """HTTP front end for an InferenceEngine."""
+
+    def __init__(self, engine, audit: AuditWriter = None, host: str = INFERENCE_SERVE_HOST,
+                 port: int = 8080, threads: int = INFERENCE_SERVE_THREADS,
+                 token: str = INFERENCE_SERVE_TOKEN, requester: str = INFERENCE_SERVE_REQUESTER):
+        self.engine = engine
+        self.audit = audit
+        self.host = host
+        self.port = port
+        self.token = token
+        self.requester = requester
+        self.latency = LatencyTracker()
+        # Each request blocks a thread while its batch fills, so this bounds the batch sizes reachable
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='inference')
+        self._server = None
+
+    async def start(self):
+        if not self.token:
+            raise ValueError("Inference serving needs INFERENCE_SERVE_TOKEN")
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        if self.audit:
+            self.audit.start()
+        print(f"[*] Inference serving on http://{self.host}:{self.port} (POST /infer, GET /metrics)")
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self.audit:
+            await self.audit.flush()
+        self._executor.shutdown(wait=False)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                if isinstance(body, int):
+                    status, payload = body, {'error': STATUS_TEXT[body]}
+                else:
+                    status, payload = await self._route(method, path, headers, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data)
+                await writer.drain()
+                if not keep_alive or status == 413:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        """(method, path, headers, body) or None when the client closes. Body is a status code if rejected."""
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            return None
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, path, _ = lines[0].split(' ', 2)
+        except ValueError:
+            return None
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            headers['connection'] = 'close'  # Can't tell where the body ends
+            return method, path, headers, 400
+        if length > MAX_BODY_BYTES:
+            return method, path, headers, 413
+        body = await reader.readexactly(length) if length else b''
+        return method, path.split('?', 1)[0], headers, body
+
+    def _authorized(self, headers: dict) -> bool:
+        scheme, _, token = headers.get('authorization', '').partition(' ')
+        return scheme.lower() == 'bearer' and hmac.compare_digest(token.strip().encode(), self.token.encode())
+
+    async def _route(self, method: str, path: str, headers: dict, body: bytes):
+        if path == '/health':
+            return 200, {'ok': True}
+        if path in ('/infer', '/metrics') and not self._authorized(headers):
+            return 401, {'error': 'Missing or wrong bearer token'}
+        if path == '/infer':
+            if method != 'POST':
+                return 405, {'error': 'Use POST'}
+            return await self._infer(body)
+        if path == '/metrics':
+            return 200, self.metrics()
+        return 404, {'error': f'No route for {path}'}
+
+    async def _infer(self, body: bytes):
+        started = time.perf_counter()
+        try:
+            request = json.loads(body or b'{}')
+            model_url = request['model_url']
+            data = request['data']
+        except (ValueError, KeyError, TypeError):
+            self.latency.record(time.perf_counter() - started, ok=False)
+            return 400, {'error': 'Expected JSON {"model_url": ..., "data": [...]}'}
+
+        loop = asyncio.get_running_loop()
+        try:
+            output = await loop.run_in_executor(self._executor, self.engine.infer, model_url, data)
+            error = None if output is not None else 'Model is not a Linear/ReLU stack'
+        except Exception as e:
+            output, error = None, str(e)
+        elapsed = time.perf_counter() - started
+        self.latency.record(elapsed, ok=error is None)
+        if self.audit:
+            self.audit.record(self.requester, model_url, data, output, error)
+
+        if error:
+            return 500, {'error': error, 'latency_ms': round(elapsed * 1000, 3)}
+        return 200, {'output': output, 'latency_ms': round(elapsed * 1000, 3)}
+
+    def metrics(self) -> dict:
+        metrics = self.latency.summary()
+        metrics.update(self.engine.stats())
+        if self.audit:
+            metrics.update({'audit_pending': len(self.audit.pending), 'audit_written': self.audit.written,
+                            'audit_dropped': self.audit.dropped})
+        return metrics
@@ -0,0 +1,142 @@
+"""
+Push-based job dispatch for OBLIVION nodes.
+
+Workers wait on a job event source instead of sleeping between polls of the
+`jobs` table. With Supabase Realtime the source is woken by job inserts and
+status changes, and polling only remains as a slow fallback.
+"""
+import asyncio
+import os
+import uuid
+
+JOB_DISPATCH_MODE = os.environ.get("JOB_DISPATCH_MODE", "realtime")  # 'realtime' or 'poll'
+FALLBACK_POLL_INTERVAL = float(os.environ.get("FALLBACK_POLL_INTERVAL", "30"))  # Seconds between polls when push is active
+
+class JobEventSource:
+    """
+    Polling-only event source: wait() returns after the timeout unless
+    notify() is called first. Base class for the push-based sources.
+    """
+
+    push = False  # True when wake-ups come from database events
+
+    def __init__(self):
+        self._wake = asyncio.Event()
+        self.last_event = None
+
+    def notify(self, event=None):
+        """Wake up the waiting loop, e.g. on a change event or a freed job slot."""
+        self.last_event = event
+        self._wake.set()
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait for an event or the timeout. Returns True if woken by an event."""
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout)
+            woken = True
+        except asyncio.TimeoutError:
+            woken = False
+        self._wake.clear()
+        return woken
+
+    def lost(self, reason: str):
+        """The push feed stopped: fall back to regular polling and poll now."""
+        if self.push:
+            print(f"[!] Job events lost ({reason}), polling until they resume")
+        self.push = False
+        self.notify()
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+class LocalJobEvents(JobEventSource):
+    """In-process stand-in for tests: publish() simulates a database change."""
+
+    push = True
+
+    def publish(self, table: str, event_type: str, record: dict = None):
+        self.notify({'table': table, 'eventType': event_type, 'new': record or {}})
+
+    def disconnect(self):
+        """Simulate the channel dropping."""
+        self.lost('disconnected')
+
+class RealtimeJobEvents(JobEventSource):
+    """
+    Supabase Realtime subscription on Postgres changes.
+    `subscriptions` is a list of (table, event, filter) tuples, for example
+    ('jobs', 'INSERT', 'status=eq.pending').
+    """
+
+    push = True
+
+    def __init__(self, url: str, key: str, subscriptions: list):
+        super().__init__()
+        self.url = url
+        self.key = key
+        self.subscriptions = subscriptions
+        self._client = None
+        self._channel = None
+        self._closing = False
+
+    async def start(self):
+        """Subscribe and wait for the server to accept the join; raises if it refuses."""
+        from realtime.types import RealtimeSubscribeStates
+        from supabase import acreate_client
+
+        self._client = await acreate_client(self.url, self.key)
+        self._channel = self._client.channel(f"oblivion-jobs-{uuid.uuid4().hex[:8]}")
+        for table, event, row_filter in self.subscriptions:
+            self._channel.on_postgres_changes(
+                event,
+                callback=self.notify,
+                table=table,
+                schema='public',
+                filter=row_filter
+            )
+        joined = asyncio.get_running_loop().create_future()
+
+        def on_state(state, error=None):
+            if state == RealtimeSubscribeStates.SUBSCRIBED:
+                self.push = True
+                if not joined.done():
+                    joined.set_result(None)
+            elif not joined.done():
+                # Rejected join: missing publication, RLS, a bad filter...
+                joined.set_exception(RuntimeError(f"channel {state.value}" + (f": {error}" if error else "")))
+            elif not self._closing:
+                self.lost(f"channel {state.value}")
+
+        self._closing = False
+        # subscribe() returns before the join is acknowledged; the state callback reports the outcome
+        await self._channel.subscribe(on_state)
+        await joined
+
+    async def close(self):
+        self._closing = True
+        if self._client and self._channel:
+            try:
+                await self._client.remove_channel(self._channel)
+            except Exception:
+                pass
+
+async def open_job_events(url: str, key: str, subscriptions: list) -> JobEventSource:
+    """
+    Open the configured event source. Falls back to plain polling if
+    JOB_DISPATCH_MODE is 'poll' or the realtime subscription fails.
+    """
+    if JOB_DISPATCH_MODE != 'realtime':
+        return JobEventSource()
+
+    events = RealtimeJobEvents(url, key, subscriptions)
+    try:
+        await asyncio.wait_for(events.start(), timeout=10)
+        print(f"[*] Subscribed to job events ({len(subscriptions)} feeds), polling every {FALLBACK_POLL_INTERVAL:.0f}s as fallback")
+        return events
+    except Exception as e:
+        print(f"[!] Realtime subscription failed, falling back to polling: {e}")
+        await events.close()
+        return JobEventSource()
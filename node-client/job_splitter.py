@@ -0,0 +1,97 @@
+"""
+Split a training job into data-parallel shard jobs.
+
+Measures the job's dataset and calls split_training_job
+(database/job_sharding.sql), which creates one pending child job per
+shard. Each child trains on its own view of the dataset (dataset_shards),
+and the aggregator merges their updates into the parent's model.
+
+Datasets served with Accept-Ranges and a Content-Length are split by byte
+range, so each worker downloads only its shard. Otherwise the rows are
+counted once and the dataset is split by row range.
+
+    python job_splitter.py JOB_ID SHARDS
+"""
+import math
+import os
+import sys
+
+from dotenv import load_dotenv
+from supabase import create_client
+
+import http_client
+
+SHARD_TARGET_MB = float(os.environ.get("SHARD_TARGET_MB", "0"))  # Workers split larger datasets into shards this size (0 = off)
+SHARD_MAX = int(os.environ.get("SHARD_MAX", "32"))  # Most shards one job is split into
+
+def measure_dataset(dataset_url: str) -> tuple:
+    """('bytes', size) if the server supports range requests, else ('rows', data rows)."""
+    response = http_client.session().head(dataset_url, allow_redirects=True, timeout=http_client.HTTP_TIMEOUT)
+    length = response.headers.get('Content-Length')
+    if response.ok and 'bytes' in response.headers.get('Accept-Ranges', '') and length:
+        return 'bytes', int(length)
+    newlines = 0
+    last = b'\n'
+    for chunk in http_client.iter_chunks(dataset_url):
+        newlines += chunk.count(b'\n')
+        last = chunk[-1:] or last
+    lines = newlines + (last != b'\n')
+    return 'rows', max(lines - 1, 0)  # Minus the header
+
+def dataset_size(dataset_url: str):
+    """Content-Length of the dataset in bytes, or None if the server doesn't say."""
+    response = http_client.session().head(dataset_url, allow_redirects=True, timeout=http_client.HTTP_TIMEOUT)
+    length = response.headers.get('Content-Length')
+    return int(length) if response.ok and length else None
+
+def auto_shard_count(dataset_url: str, target_mb: float = SHARD_TARGET_MB, max_shards: int = SHARD_MAX) -> int:
+    """How many shards a dataset should be split into (1 = leave it whole)."""
+    if target_mb <= 0:
+        return 1
+    size = dataset_size(dataset_url)
+    if not size:
+        return 1
+    return max(1, min(max_shards, math.ceil(size / (target_mb * 2**20))))
+
+def split_job(supabase, job: dict, shards: int, provider_address: str = None) -> list:
+    """
+    Split `job` (a jobs row) into `shards` shard jobs. Returns the new rows;
+    empty if the job was claimed or split by someone else first.
+    `provider_address` lets the worker that claimed the job split it.
+    """
+    if job.get('on_chain_id'):
+        raise ValueError(f"Job {job['id']} is funded on chain and must be settled whole")
+    dataset_url = job.get('dataset_url') or job.get('data_hash', '')
+    if not dataset_url.startswith('http'):
+        raise ValueError(f"Job {job['id']} has no HTTP dataset to split")
+    unit, total = measure_dataset(dataset_url)
+    shards = min(shards, total)
+    if shards < 2:
+        raise ValueError(f"Dataset of {total} {unit} is too small to split")
+    result = supabase.rpc('split_training_job', {
+        'p_job_id': job['id'],
+        'p_shards': shards,
+        'p_unit': unit,
+        'p_total': total,
+        'p_provider_address': provider_address,
+    }).execute()
+    return result.data or []
+
+def main():
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python job_splitter.py JOB_ID SHARDS")
+    load_dotenv()
+    supabase = create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_KEY"])
+    job_id, shards = int(sys.argv[1]), int(sys.argv[2])
+
+    job = supabase.table('jobs').select("*").eq('id', job_id).single().execute().data
+    children = split_job(supabase, job, shards)
+    if not children:
+        sys.exit(f"[!] Job {job_id} is no longer pending; not split")
+    print(f"[+] Job {job_id} split into {len(children)} shards ({children[0]['shard_unit']}):")
+    for child in children:
+        print(f"    - Job {child['id']}: shard {child['shard_index']} "
+              f"[{child['shard_start']}, {child['shard_end']})")
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,8 @@ import json
 from supabase import create_client, Client
 from web3 import Web3
 from dotenv import load_dotenv
+from job_events import open_job_events, FALLBACK_POLL_INTERVAL
+from pagination import keyset_rows
 
 load_dotenv()
 
@@ -31,12 +33,16 @@ async def main():
     hardware_id = "GPU-RTX-4090-OBLIVION-01"
     print(f"Hardware Identity Verified: {hardware_id}")
     
+    # Get woken by new pending jobs; poll only as a fallback
+    job_events = await open_job_events(SUPABASE_URL, SUPABASE_KEY, [
+        ('jobs', 'INSERT', 'status=eq.pending'),
+    ])
+    
     # 4. Main Loop
     while True:
         try:
             print("Polling for pending jobs...")
-            response = supabase.table('jobs').select("*").eq('status', 'pending').execute()
-            jobs = response.data
+            jobs = list(keyset_rows(lambda: supabase.table('jobs').select("*").eq('status', 'pending')))
 
             if jobs:
                 for job in jobs:
@@ -76,7 +82,8 @@ async def main():
         except Exception as e:
             print(f"Error in node loop: {e}")
         
-        await asyncio.sleep(10)
+        # Fast polling again if the push feed drops
+        await job_events.wait(FALLBACK_POLL_INTERVAL if job_events.push else 10)
 
 if __name__ == "__main__":
     try:
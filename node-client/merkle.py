@@ -0,0 +1,181 @@
+"""
+Chunked Merkle hashing for OBLIVION worker updates.
+
+An update buffer is split into MERKLE_CHUNK_SIZE chunks. Each chunk is a
+leaf, sha256(0x00 | chunk), and each parent is sha256(0x01 | left | right).
+An odd node at the end of a level is promoted unchanged. The hex root is the
+worker_updates.update_hash.
+
+MerkleHasher takes data as it is produced and hashes full chunks on a
+thread pool (hashlib releases the GIL on large buffers). The leaf list is
+published next to the update as a small JSON sidecar, so a reader can check
+each chunk as it streams in, or check one chunk on its own with an
+inclusion proof.
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+MERKLE_CHUNK_SIZE = int(os.environ.get("MERKLE_CHUNK_SIZE", str(1 << 20)))  # Bytes per leaf
+MERKLE_THREADS = int(os.environ.get("MERKLE_THREADS", str(min(8, os.cpu_count() or 1))))
+
+SIDECAR_SUFFIX = '.leaves.json'
+
+_pool = None
+
+def _hash_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=MERKLE_THREADS, thread_name_prefix='merkle')
+    return _pool
+
+def leaf_hash(chunk) -> bytes:
+    h = hashlib.sha256(b'\x00')
+    h.update(chunk)
+    return h.digest()
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+def build_levels(leaves: list) -> list:
+    """All tree levels, leaves first and the root level last."""
+    if not leaves:
+        leaves = [leaf_hash(b'')]
+    levels = [list(leaves)]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parents = [node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            parents.append(level[-1])
+        levels.append(parents)
+    return levels
+
+def root_from_leaves(leaves: list) -> str:
+    return build_levels(leaves)[-1][0].hex()
+
+class MerkleHasher:
+    """Streaming hasher: update() with data in any sizes, then root()."""
+
+    def __init__(self, chunk_size: int = MERKLE_CHUNK_SIZE, parallel: bool = True):
+        self.chunk_size = chunk_size
+        self.parallel = parallel
+        self.size = 0
+        self._pending = bytearray()
+        self._leaves = []  # Digests or futures, in chunk order
+        self._levels = None
+
+    def update(self, data):
+        data = memoryview(data).cast('B')
+        self.size += len(data)
+        if self._pending:
+            # Top up the partial chunk first
+            take = min(self.chunk_size - len(self._pending), len(data))
+            self._pending += data[:take]
+            data = data[take:]
+            if len(self._pending) < self.chunk_size:
+                return
+            self._add_chunk(bytes(self._pending))
+            self._pending.clear()
+        # Whole chunks are hashed straight from the caller's buffer (kept alive until hashed)
+        full = len(data) - len(data) % self.chunk_size
+        for start in range(0, full, self.chunk_size):
+            self._add_chunk(data[start:start + self.chunk_size])
+        self._pending += data[full:]
+
+    def _add_chunk(self, chunk):
+        if self.parallel:
+            self._leaves.append(_hash_pool().submit(leaf_hash, chunk))
+        else:
+            self._leaves.append(leaf_hash(chunk))
+
+    def leaves(self) -> list:
+        """Finish hashing (including the last partial chunk) and return leaf digests."""
+        if self._levels is None:
+            if self._pending or not self._leaves:
+                self._add_chunk(bytes(self._pending))
+                self._pending.clear()
+            leaves = [leaf.result() if hasattr(leaf, 'result') else leaf for leaf in self._leaves]
+            self._levels = build_levels(leaves)
+        return self._levels[0]
+
+    def root(self) -> str:
+        self.leaves()
+        return self._levels[-1][0].hex()
+
+    def proof(self, index: int) -> list:
+        """Inclusion proof for chunk `index`: [(sibling hex, 'L' or 'R'), ...] from leaf to root."""
+        self.leaves()
+        return proof_from_levels(self._levels, index)
+
+    def sidecar(self) -> bytes:
+        """Leaf list published next to the update."""
+        return json.dumps({
+            'chunk_size': self.chunk_size,
+            'size': self.size,
+            'root': self.root(),
+            'leaves': [leaf.hex() for leaf in self.leaves()],
+        }).encode()
+
+def proof_from_levels(levels: list, index: int) -> list:
+    if not 0 <= index < len(levels[0]):
+        raise IndexError(f"Chunk {index} out of range (0..{len(levels[0]) - 1})")
+    proof = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append((level[sibling].hex(), 'L' if sibling < index else 'R'))
+        index //= 2
+    return proof
+
+def verify_proof(chunk, proof: list, root: str) -> bool:
+    """Check one chunk against the root without the rest of the update."""
+    digest = leaf_hash(chunk)
+    for sibling_hex, side in proof:
+        sibling = bytes.fromhex(sibling_hex)
+        digest = node_hash(sibling, digest) if side == 'L' else node_hash(digest, sibling)
+    return digest.hex() == root
+
+def merkle_root(data, chunk_size: int = MERKLE_CHUNK_SIZE) -> str:
+    hasher = MerkleHasher(chunk_size)
+    hasher.update(data)
+    return hasher.root()
+
+class ChunkVerifier:
+    """
+    Checks a download chunk by chunk against a sidecar's leaves, so a bad
+    update is rejected at the first corrupt chunk rather than after the
+    whole file has arrived.
+    """
+
+    def __init__(self, sidecar: dict, root: str):
+        leaves = [bytes.fromhex(h) for h in sidecar['leaves']]
+        if root_from_leaves(leaves) != root:
+            raise ValueError("Sidecar leaves don't match the update hash")
+        self.leaves = leaves
+        self.chunk_size = sidecar['chunk_size']
+        self.size = sidecar['size']
+        self._pending = bytearray()
+        self._index = 0
+        self._received = 0
+
+    def update(self, data):
+        self._received += len(data)
+        if self._received > self.size:
+            raise ValueError("Update is larger than its sidecar declares")
+        self._pending += data
+        while len(self._pending) >= self.chunk_size:
+            self._check(bytes(self._pending[:self.chunk_size]))
+            del self._pending[:self.chunk_size]
+
+    def _check(self, chunk: bytes):
+        if self._index >= len(self.leaves) or leaf_hash(chunk) != self.leaves[self._index]:
+            raise ValueError(f"Chunk {self._index} doesn't match the update hash")
+        self._index += 1
+
+    def finish(self):
+        if self._pending or self._index == 0:
+            self._check(bytes(self._pending))
+            self._pending.clear()
+        if self._index != len(self.leaves) or self._received != self.size:
+            raise ValueError("Update is truncated")
@@ -0,0 +1,49 @@
+"""
+Resources this node advertises in its nodes row.
+
+The claim RPCs compare them with each job's requirements (job_fits_node in
+database/fair_job_distribution.sql), so this worker is only handed jobs
+it can run. Throughput is measured once at startup with a float32 matmul;
+NODE_MEMORY_MB and NODE_GFLOPS override the measurements.
+"""
+import os
+import time
+
+import torch
+
+NODE_MEMORY_MB = int(os.environ.get("NODE_MEMORY_MB", "0"))  # Memory offered to jobs (0 = physical RAM)
+NODE_GFLOPS = float(os.environ.get("NODE_GFLOPS", "0"))  # Advertised throughput (0 = measure)
+
+_capabilities = None
+
+def measure_gflops(size: int = 512, seconds: float = 0.25) -> float:
+    """Sustained float32 matmul throughput in GFLOP/s."""
+    a = torch.randn(size, size)
+    b = torch.randn(size, size)
+    torch.mm(a, b)  # Warm up
+    runs = 0
+    started = time.perf_counter()
+    while True:
+        torch.mm(a, b)
+        runs += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= seconds:
+            return 2 * size ** 3 * runs / elapsed / 1e9
+
+def physical_memory_mb():
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') >> 20
+    except (ValueError, OSError, AttributeError):
+        return None  # Not available on this platform
+
+def node_capabilities() -> dict:
+    """cpu_cores, memory_mb, gflops and has_gpu columns for the nodes row (measured on first call)."""
+    global _capabilities
+    if _capabilities is None:
+        _capabilities = {
+            'cpu_cores': os.cpu_count(),
+            'memory_mb': NODE_MEMORY_MB or physical_memory_mb(),
+            'gflops': round(NODE_GFLOPS or measure_gflops(), 1),
+            'has_gpu': torch.cuda.is_available(),
+        }
+    return dict(_capabilities)
@@ -0,0 +1,54 @@
+"""
+Keyset pagination for PostgREST reads.
+
+Pages are fetched as "WHERE key > last seen ORDER BY key LIMIT n" rather
+than with offsets, so every page is one index range scan however far in
+the caller is, and rows inserted meanwhile don't shift later pages. Reads
+without a limit are also capped at the server's max-rows (1000 on Supabase
+by default), silently dropping the rest.
+"""
+import os
+
+PAGE_SIZE = int(os.environ.get("PAGE_SIZE", "1000"))  # Rows per request
+
+def keyset_pages(query, column: str = 'id', after=None, page_size: int = PAGE_SIZE):
+    """
+    Yield pages (lists of rows) ordered by a unique `column`.
+    `query` is a zero-argument callable returning a fresh filtered select
+    that includes `column`; rows start after `after` if given.
+    """
+    while True:
+        q = query()
+        if after is not None:
+            q = q.gt(column, after)
+        rows = q.order(column).limit(page_size).execute().data or []
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        after = rows[-1][column]
+
+def keyset_rows(query, column: str = 'id', after=None, page_size: int = PAGE_SIZE):
+    """Every row, fetched a page at a time."""
+    for page in keyset_pages(query, column, after, page_size):
+        yield from page
+
+def after_cursor(query, cursor, column: str = 'created_at', tiebreak: str = 'id'):
+    """
+    Restrict `query` to rows after `cursor` = (column value, tiebreak value),
+    for feeds ordered by a non-unique column such as created_at.
+    """
+    if cursor is None:
+        return query
+    value, key = cursor
+    return query.or_(f'{column}.gt."{value}",and({column}.eq."{value}",{tiebreak}.gt.{key})')
+
+def pending_jobs_page(supabase, limit: int, cursor=None, columns: str = '*'):
+    """
+    Oldest pending jobs after `cursor`, in claim order (served by idx_jobs_pending_created).
+    Returns (rows, cursor of the last row or None when there are no more).
+    """
+    query = supabase.table('jobs').select(columns).eq('status', 'pending')
+    rows = after_cursor(query, cursor).order('created_at').order('id').limit(limit).execute().data or []
+    next_cursor = (rows[-1]['created_at'], rows[-1]['id']) if len(rows) == limit else None
+    return rows, next_cursor
@@ -0,0 +1,239 @@
+"""
+Warm sandbox interpreter for OBLIVION training jobs.
+
+Started by sandbox_pool.SandboxPool, never imported by the worker itself.
+The allowed ML modules are imported once at startup; after that the host
+serves jobs read from stdin. Each job runs in a forked child that installs
+the import hook before touching user code, so every job still gets a fresh
+process but skips the interpreter and torch start-up cost.
+
+Protocol: 4-byte big-endian length + JSON frames on stdin/stdout.
+
+Scripts can't import network modules; when the worker runs a fetch proxy,
+they get `fetch(url) -> bytes` and `open_dataset(url)` built-ins that
+download through it (open_dataset maps the worker's cached copy).
+"""
+import builtins
+import json
+import io
+import mmap
+import os
+import socket
+import struct
+import sys
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+import torch
+import torch.nn as nn
+import torch.optim as optim
+import numpy as np
+
+from tensor_channel import write_tensors
+
+# Preload pandas too, most training scripts read their dataset with it
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+# Trigger lazy imports that would otherwise be paid in every job
+# (building an optimizer pulls in torch._dynamo)
+optim.SGD([torch.zeros(1, requires_grad=True)], lr=0.1)
+
+# Disable dangerous operations
+original_import = builtins.__import__
+
+ALLOWED_MODULES = {
+    'torch', 'torch.nn', 'torch.optim', 'torch.nn.functional',
+    'numpy', 'np', 'pandas', 'pd', 'json', 'math', 'collections',
+    'functools', 'itertools', 'typing', 'io', 'csv',
+    # Internal Python modules needed for basic operations
+    '_io', 'codecs', 'encodings', 'abc', '_abc', '_codecs',
+    '_collections_abc', '_functools', '_operator', '_weakref',
+    'operator', 'weakref', 'reprlib', 'keyword', '_string',
+    'string', 're', '_sre', 'sre_compile', 'sre_parse', 'sre_constants',
+    'copyreg', 'copy', 'warnings', '_warnings', 'contextlib',
+    # NumPy internals
+    'numpy.core', 'numpy.lib', 'numpy.linalg', 'numpy.random',
+    # Torch internals
+    'torch.autograd', 'torch.cuda', 'torch.utils', 'torch._C',
+}
+
+# Allow any module that starts with these prefixes
+ALLOWED_PREFIXES = ('torch.', 'numpy.', 'pandas.', '_', 'encodings.')
+
+SCRIPT_MODULE = '__sandbox__'  # __name__ the training script runs under
+
+def safe_import(name, *args, **kwargs):
+    # Every import is filtered once the hook is installed, whoever makes it:
+    # the caller's globals are under the script's control
+    base_module = name.split('.')[0]
+    # Allow internal modules (start with _) and whitelisted modules
+    if (base_module.startswith('_') or
+        name in ALLOWED_MODULES or
+        base_module in ALLOWED_MODULES or
+        any(name.startswith(p) for p in ALLOWED_PREFIXES)):
+        return original_import(name, *args, **kwargs)
+    raise ImportError(f"Import of '{name}' is not allowed in sandbox")
+
+def read_frame(stream):
+    """Read one frame, or return None on EOF."""
+    header = stream.read(4)
+    if len(header) < 4:
+        return None
+    (length,) = struct.unpack('>I', header)
+    return json.loads(stream.read(length).decode())
+
+def write_frame(stream, message: dict):
+    data = json.dumps(message).encode()
+    stream.write(struct.pack('>I', len(data)) + data)
+    stream.flush()
+
+END_OF_BODY = 0
+BODY_ERROR = 0xFFFFFFFF  # See http_client.FetchProxy
+
+def proxy_request(socket_path: str, url: str):
+    """Ask the worker's fetch proxy for `url`. Returns a cached file path or the body bytes."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        stream = sock.makefile('rwb')
+        write_frame(stream, {'url': url})
+        reply = read_frame(stream)
+        if reply is None or not reply.get('ok'):
+            raise IOError(f"fetch({url}) failed: {(reply or {}).get('error', 'no reply')}")
+        if reply.get('path'):
+            return reply['path']
+        body = io.BytesIO()
+        while True:
+            header = stream.read(4)
+            if len(header) < 4:
+                raise IOError(f"fetch({url}) failed: connection closed")
+            (length,) = struct.unpack('>I', header)
+            if length == END_OF_BODY:
+                return body.getvalue()
+            if length == BODY_ERROR:
+                raise IOError(f"fetch({url}) failed: {read_frame(stream)['error']}")
+            body.write(stream.read(length))
+
+def make_fetch(socket_path: str):
+    """
+    Built-ins for the training script, served by the worker's pooled HTTP
+    session and artifact cache: fetch(url) -> bytes, and open_dataset(url),
+    a read-only file-like object that maps the cached file instead of copying it.
+    """
+    def fetch(url: str) -> bytes:
+        result = proxy_request(socket_path, url)
+        if isinstance(result, bytes):
+            return result
+        with open(result, 'rb') as f:
+            return f.read()
+
+    def open_dataset(url: str):
+        result = proxy_request(socket_path, url)
+        if isinstance(result, bytes):
+            return io.BytesIO(result)
+        with open(result, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return io.BytesIO()
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    return fetch, open_dataset
+
+def run_job(request: dict) -> dict:
+    """Execute the user script and capture results. Runs with the import hook active."""
+    # Same names the user script could rely on in the old wrapper script
+    namespace = {
+        '__name__': SCRIPT_MODULE,
+        'json': json, 'torch': torch, 'nn': nn, 'optim': optim, 'np': np,
+    }
+    if request.get('fetch_socket'):
+        namespace['fetch'], namespace['open_dataset'] = make_fetch(request['fetch_socket'])
+    try:
+        exec(compile(request['script'], '<training_script>', 'exec'), namespace)
+        result = namespace['train'](request['dataset_url'])
+        if isinstance(result, tuple) and len(result) >= 2:
+            grads, loss = result[0], result[1]
+            weights = result[2] if len(result) > 2 else None
+            num_samples = result[3] if len(result) > 3 else None
+        else:
+            grads, loss, weights, num_samples = result, 0.0, None, None
+        # Named gradients (a dict or module) go back as a list, in their own order
+        if hasattr(grads, 'state_dict'):
+            grads = grads.state_dict()
+        if isinstance(grads, dict):
+            grads = list(grads.values())
+
+        # Summary goes back as JSON, tensors as raw buffers on the job's result channel
+        output = {
+            'success': True,
+            'loss': float(loss) if loss else 0.0,
+            'grads_shape': [list(g.shape) if hasattr(g, 'shape') else len(g) for g in grads] if grads else [],
+            'num_samples': int(num_samples) if num_samples else None,
+        }
+        write_tensors(request['result_path'], {
+            'grads': grads or [],
+            'weights': weights if weights else None,
+        })
+        output['weights_saved'] = bool(weights)
+
+        return output
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+def peak_rss_kb(usage=None) -> int:
+    if usage is None:
+        if resource is None:
+            return 0
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+    return int(usage.ru_maxrss)
+
+def serve():
+    proto_in = os.fdopen(os.dup(0), 'rb')
+    proto_out = os.fdopen(os.dup(1), 'wb')
+    # Keep the protocol pipe clean: anything the user script prints is discarded
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+
+    write_frame(proto_out, {'ready': True, 'pid': os.getpid()})
+
+    while True:
+        request = read_frame(proto_in)
+        if request is None:
+            break
+
+        if not hasattr(os, 'fork'):
+            # No fork: the interpreter runs the job itself, so the script's changes
+            # (patched modules, sys.modules) stay in it; the pool discards it after the job
+            builtins.__import__ = safe_import
+            output = run_job(request)
+            output['rss_kb'] = peak_rss_kb()
+            output['recycle'] = True
+            write_frame(proto_out, output)
+            continue
+
+        result_r, result_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(result_r)
+            builtins.__import__ = safe_import
+            with os.fdopen(result_w, 'wb') as result_out:
+                write_frame(result_out, run_job(request))
+            os._exit(0)
+
+        os.close(result_w)
+        with os.fdopen(result_r, 'rb') as result_in:
+            output = read_frame(result_in)
+        _, status, usage = os.wait4(pid, 0)
+        if output is None:
+            output = {'success': False, 'error': f'Sandbox process exited with status {status}'}
+        # The job's memory is in the child; the host itself stays at its start-up size
+        output['rss_kb'] = peak_rss_kb(usage)
+        write_frame(proto_out, output)
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,167 @@
+"""
+Pool of warm sandbox interpreters for OBLIVION training jobs.
+
+Each interpreter runs sandbox_host.py, which has torch, numpy and pandas
+imported before the first job arrives. Jobs are sent over a pipe and run in
+a forked child of the interpreter with the import hook installed. An
+interpreter is recycled after SANDBOX_MAX_JOBS jobs or once a job's memory
+high-water mark passes SANDBOX_MAX_RSS_MB, and killed on a job timeout.
+Without os.fork the job runs in the interpreter itself, which is then
+discarded after every job.
+"""
+import json
+import os
+import queue
+import select
+import signal
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+SANDBOX_MAX_JOBS = int(os.environ.get("SANDBOX_MAX_JOBS", "50"))  # Jobs per interpreter before recycling
+SANDBOX_MAX_RSS_MB = int(os.environ.get("SANDBOX_MAX_RSS_MB", "2048"))  # Job memory high-water mark before recycling an interpreter
+SANDBOX_START_TIMEOUT = 120  # Seconds to wait for an interpreter to finish its imports
+
+HOST_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_host.py")
+
+class SandboxTimeout(Exception):
+    pass
+
+class SandboxProcess:
+    """One warm interpreter running sandbox_host.py."""
+
+    def __init__(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, HOST_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env={**os.environ, 'PYTHONPATH': ''},  # Clean environment
+            start_new_session=True  # Own process group, so a kill takes the job child too
+        )
+        self.jobs_run = 0
+        self.rss_kb = 0
+        try:
+            self.read_frame(time.monotonic() + SANDBOX_START_TIMEOUT)  # Wait for the 'ready' frame
+        except BaseException:
+            self.kill()
+            raise
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def write_frame(self, message: dict):
+        data = json.dumps(message).encode()
+        self.proc.stdin.write(struct.pack('>I', len(data)) + data)
+        self.proc.stdin.flush()
+
+    def read_frame(self, deadline: float) -> dict:
+        (length,) = struct.unpack('>I', self._read_exact(4, deadline))
+        return json.loads(self._read_exact(length, deadline).decode())
+
+    def _read_exact(self, n: int, deadline: float) -> bytes:
+        fd = self.proc.stdout.fileno()
+        chunks = []
+        while n > 0:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise SandboxTimeout()
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                continue
+            chunk = os.read(fd, n)
+            if not chunk:
+                raise EOFError(f"Sandbox interpreter exited with status {self.proc.wait()}")
+            chunks.append(chunk)
+            n -= len(chunk)
+        return b''.join(chunks)
+
+    def kill(self):
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        self.proc.wait()
+
+class SandboxPool:
+    """
+    Fixed number of warm interpreters. Thread-safe: run() borrows an idle
+    interpreter, so at most `size` jobs execute at the same time.
+    """
+
+    def __init__(self, size: int, max_jobs: int = SANDBOX_MAX_JOBS, max_rss_mb: int = SANDBOX_MAX_RSS_MB,
+                 fetch_socket: str = None):
+        self.size = size
+        self.fetch_socket = fetch_socket  # http_client.FetchProxy socket offered to scripts as fetch()
+        self.max_jobs = max_jobs
+        self.max_rss_kb = max_rss_mb * 1024
+        self._idle = queue.Queue()
+        for _ in range(size):
+            self._idle.put(None)  # Started on first use or by start()
+
+    def start(self):
+        """Pre-fork all interpreters in parallel so the first jobs don't pay for imports."""
+        slots = [self._idle.get() for _ in range(self.size)]
+
+        def warm(i):
+            try:
+                if slots[i] is None or not slots[i].alive():
+                    slots[i] = SandboxProcess()
+            except Exception as e:
+                print(f"[!] Sandbox interpreter failed to start: {e}")
+                slots[i] = None
+
+        threads = [threading.Thread(target=warm, args=(i,)) for i in range(self.size)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for sandbox in slots:
+            self._idle.put(sandbox)
+
+    def run(self, script_code: str, dataset_url: str, result_path: str, timeout: int = 300) -> dict:
+        """
+        Run one training job in a warm interpreter. Gradients and weights are
+        written to the tensor channel at `result_path`; returns the summary dict.
+        """
+        sandbox = self._idle.get()
+        try:
+            if sandbox is None or not sandbox.alive():
+                sandbox = SandboxProcess()
+
+            sandbox.write_frame({
+                'script': script_code,
+                'dataset_url': dataset_url,
+                'result_path': result_path,
+                'fetch_socket': self.fetch_socket,
+            })
+            output = sandbox.read_frame(time.monotonic() + timeout)
+            sandbox.jobs_run += 1
+            sandbox.rss_kb = max(sandbox.rss_kb, output.pop('rss_kb', 0))
+            recycle = output.pop('recycle', False)  # Job ran in the interpreter itself (no fork)
+
+            if recycle or sandbox.jobs_run >= self.max_jobs or sandbox.rss_kb >= self.max_rss_kb:
+                sandbox.kill()
+                sandbox = None
+            return output
+
+        except SandboxTimeout:
+            if sandbox is not None:
+                sandbox.kill()
+                sandbox = None
+            return {'success': False, 'error': 'Script execution timed out'}
+        except Exception as e:
+            if sandbox is not None:
+                sandbox.kill()
+                sandbox = None
+            return {'success': False, 'error': str(e)}
+        finally:
+            self._idle.put(sandbox)
+
+    def close(self):
+        for _ in range(self.size):
+            sandbox = self._idle.get()
+            if sandbox is not None:
+                sandbox.kill()
@@ -0,0 +1,410 @@
+"""
+Background on-chain settlement for OBLIVION workers.
+
+Job slots hand results to a SettlementQueue and move on. A single
+settlement thread owns the worker's account:
+
+- NonceManager hands out nonces locally, so transactions are pipelined
+  (claimJob and submitResult go out back to back) instead of re-reading
+  the nonce and waiting for each receipt.
+- FeeOracle prices transactions with EIP-1559 fees, cached per block.
+- Completed jobs are collected for up to SETTLEMENT_BATCH_WINDOW seconds
+  or SETTLEMENT_BATCH_SIZE jobs and settled with one claimAndSubmitBatch
+  transaction, falling back to per-job claimJob/submitResult on contracts
+  deployed before the batch functions existed.
+- Receipts are polled in the background. A transaction still pending after
+  SETTLEMENT_REPLACE_AFTER seconds is re-sent with the same nonce and
+  higher fees, up to SETTLEMENT_MAX_REPLACEMENTS times.
+
+Everything takes a Web3 instance, so it runs the same against a node or an
+EthereumTesterProvider.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+
+SETTLEMENT_REPLACE_AFTER = float(os.environ.get("SETTLEMENT_REPLACE_AFTER", "60"))  # Seconds before re-sending with higher fees
+SETTLEMENT_MAX_REPLACEMENTS = int(os.environ.get("SETTLEMENT_MAX_REPLACEMENTS", "3"))
+SETTLEMENT_RECEIPT_TIMEOUT = float(os.environ.get("SETTLEMENT_RECEIPT_TIMEOUT", "600"))  # Give up on a transaction after this long
+SETTLEMENT_POLL_INTERVAL = float(os.environ.get("SETTLEMENT_POLL_INTERVAL", "2"))  # Seconds between receipt checks
+SETTLEMENT_BATCH_SIZE = int(os.environ.get("SETTLEMENT_BATCH_SIZE", "16"))  # Jobs per claimAndSubmitBatch (1 = one job per transaction)
+SETTLEMENT_BATCH_WINDOW = float(os.environ.get("SETTLEMENT_BATCH_WINDOW", "5"))  # Seconds a batch stays open for more jobs
+
+FEE_BUMP = 1.125  # Replacements must raise fees by at least 10%
+DEFAULT_PRIORITY_FEE = Web3.to_wei(1, 'gwei')
+
+# Fixed limits: a pipelined submitResult can't be estimated before its claim is mined
+GAS_LIMITS = {
+    'claimJob': 200000,
+    'submitResult': 300000,
+}
+
+CLAIM_AND_SUBMIT_BATCH_SELECTOR = Web3.keccak(text='claimAndSubmitBatch(uint256[],bytes32[],uint256[][],bytes[])')[:4]
+
+# OblivionManager.JobStatus
+STATUS_PENDING = 0
+STATUS_PROCESSING = 1
+
+class FeeOracle:
+    """EIP-1559 fees, fetched at most once per block. Falls back to gasPrice on legacy chains."""
+
+    def __init__(self, w3: Web3):
+        self.w3 = w3
+        self._block = None
+        self._fees = None
+
+    def fees(self) -> dict:
+        block_number = self.w3.eth.block_number
+        if self._fees is None or block_number != self._block:
+            block = self.w3.eth.get_block('latest')
+            base_fee = block.get('baseFeePerGas')
+            if base_fee is None:
+                self._fees = {'gasPrice': self.w3.eth.gas_price}
+            else:
+                try:
+                    priority_fee = self.w3.eth.max_priority_fee
+                except Exception:
+                    priority_fee = DEFAULT_PRIORITY_FEE
+                # Room for the base fee to double before the transaction is priced out
+                self._fees = {
+                    'maxFeePerGas': 2 * base_fee + priority_fee,
+                    'maxPriorityFeePerGas': priority_fee,
+                }
+            self._block = block_number
+        return dict(self._fees)
+
+def to_bytes32(update_hash: str) -> bytes:
+    return Web3.to_bytes(hexstr=update_hash if update_hash.startswith('0x') else '0x' + update_hash)
+
+def bump_fees(fees: dict) -> dict:
+    return {k: int(v * FEE_BUMP) + 1 for k, v in fees.items()}
+
+class NonceManager:
+    """Locally tracked nonce; resync() re-reads it from the node after a failed send."""
+
+    def __init__(self, w3: Web3, address: str):
+        self.w3 = w3
+        self.address = address
+        self._lock = threading.Lock()
+        self._next = None
+
+    def next(self) -> int:
+        with self._lock:
+            if self._next is None:
+                self._next = self.w3.eth.get_transaction_count(self.address, 'pending')
+            nonce = self._next
+            self._next += 1
+            return nonce
+
+    def resync(self):
+        with self._lock:
+            self._next = self.w3.eth.get_transaction_count(self.address, 'pending')
+
+class PendingTx:
+    """A broadcast transaction and every hash it has been sent under."""
+
+    def __init__(self, label: str, tx: dict, future: Future):
+        self.label = label
+        self.tx = tx
+        self.future = future
+        self.hashes = []
+        self.first_sent = time.monotonic()
+        self.last_sent = self.first_sent
+        self.replacements = 0
+
+class SettlementQueue:
+    """
+    Thread-safe front end: send() and settle() return Futures resolved with
+    the transaction receipt once it is mined (or with an exception).
+    """
+
+    def __init__(self, w3: Web3, account, contract=None, chain_index=None,
+                 replace_after: float = SETTLEMENT_REPLACE_AFTER,
+                 max_replacements: int = SETTLEMENT_MAX_REPLACEMENTS,
+                 receipt_timeout: float = SETTLEMENT_RECEIPT_TIMEOUT,
+                 poll_interval: float = SETTLEMENT_POLL_INTERVAL,
+                 batch_size: int = SETTLEMENT_BATCH_SIZE,
+                 batch_window: float = SETTLEMENT_BATCH_WINDOW):
+        self.w3 = w3
+        self.account = account
+        self.contract = contract
+        self.chain_index = chain_index  # Local job state; getJob() is only called on a miss
+        self.replace_after = replace_after
+        self.max_replacements = max_replacements
+        self.receipt_timeout = receipt_timeout
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.nonces = NonceManager(w3, account.address)
+        self.fees = FeeOracle(w3)
+        self._requests = queue.Queue()
+        self._pending = {}  # nonce -> PendingTx
+        self._chain_id = None
+        self._batch = []  # (job_id, on_chain_id, update_hash, future) waiting for the window to close
+        self._batch_opened = 0.0
+        self._batch_supported = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='settlement', daemon=True)
+            self._thread.start()
+
+    def close(self, timeout: float = 30):
+        """Stop after queued requests are sent and their receipts are in (or `timeout` passes)."""
+        self._requests.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def send(self, tx: dict, label: str = 'tx') -> Future:
+        """Queue a transaction (no nonce or fees needed). Resolves with its receipt."""
+        future = Future()
+        self._requests.put(('send', (tx, label), future))
+        return future
+
+    def settle(self, job_id: int, on_chain_id: int, update_hash: str) -> Future:
+        """
+        Queue a job for settlement (batched when batch_size > 1). Resolves with
+        the receipt of the transaction that completed it on chain.
+        """
+        future = Future()
+        self._requests.put(('settle', (job_id, on_chain_id, update_hash), future))
+        return future
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    # Settlement thread
+
+    def _run(self):
+        while True:
+            timeout = self.poll_interval if self._pending else None
+            if self._batch:
+                # Wake up in time to close the batch window
+                remaining = max(0.0, self._batch_opened + self.batch_window - time.monotonic())
+                timeout = remaining if timeout is None else min(timeout, remaining)
+            try:
+                request = self._requests.get(timeout=timeout)
+            except queue.Empty:
+                request = False
+            if request is None:
+                self._flush_batch()
+                # Drain: finish confirming what was already sent
+                deadline = time.monotonic() + self.receipt_timeout
+                while self._pending and time.monotonic() < deadline:
+                    self._check_pending()
+                    time.sleep(self.poll_interval)
+                return
+            if request:
+                kind, args, future = request
+                try:
+                    if kind == 'send':
+                        self._broadcast(*args, future)
+                    elif self.batch_size > 1:
+                        if not self._batch:
+                            self._batch_opened = time.monotonic()
+                        self._batch.append((*args, future))
+                    else:
+                        self._settle(*args, future)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+            if self._batch and (len(self._batch) >= self.batch_size or
+                                time.monotonic() - self._batch_opened >= self.batch_window):
+                self._flush_batch()
+            # Receipts are checked between requests, so a busy queue still confirms
+            self._check_pending()
+
+    def _flush_batch(self):
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+        try:
+            self._settle_batch(batch)
+        except Exception as e:
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    def _supports_batches(self) -> bool:
+        """True if the deployed contract has claimAndSubmitBatch (older deployments don't)."""
+        if self._batch_supported is None:
+            code = self.w3.eth.get_code(self.contract.address)
+            self._batch_supported = CLAIM_AND_SUBMIT_BATCH_SELECTOR in bytes(code)
+            if not self._batch_supported:
+                print("[!] Contract has no claimAndSubmitBatch, settling jobs one at a time")
+        return self._batch_supported
+
+    def _settle_batch(self, batch: list):
+        """Settle a window of jobs with one claimAndSubmitBatch transaction."""
+        if self.contract is None:
+            raise RuntimeError("No contract configured for settlement")
+        if len(batch) == 1 or not self._supports_batches():
+            for job_id, on_chain_id, update_hash, future in batch:
+                try:
+                    self._settle(job_id, on_chain_id, update_hash, future)
+                except Exception as e:
+                    future.set_exception(e)
+            return
+
+        # Drop jobs another worker got first, they would revert the whole batch
+        members = []
+        for job_id, on_chain_id, update_hash, future in batch:
+            status, provider = self._job_state(on_chain_id)
+            if status == STATUS_PENDING or (status == STATUS_PROCESSING and provider == self.account.address):
+                members.append((job_id, on_chain_id, update_hash, future))
+            else:
+                print(f"    [!] Job {on_chain_id} isn't claimable by this worker (status {status}), skipping settlement")
+                future.set_result(None)
+        if not members:
+            return
+
+        ids = [m[1] for m in members]
+        call = self.contract.functions.claimAndSubmitBatch(
+            ids,
+            [to_bytes32(m[2]) for m in members],
+            [[] for _ in members],  # pubInputs - would contain ZK proof inputs in production
+            [b"" for _ in members]  # proofs - would contain actual ZK proofs in production
+        )
+        try:
+            # Estimating also simulates the batch, so a job that would revert is caught here
+            gas = int(call.estimate_gas({'from': self.account.address}) * 1.2)
+        except Exception as e:
+            print(f"    [!] Batch of {len(members)} jobs would fail ({e}), settling them one at a time")
+            for job_id, on_chain_id, update_hash, future in members:
+                try:
+                    self._settle(job_id, on_chain_id, update_hash, future)
+                except Exception as err:
+                    future.set_exception(err)
+            return
+
+        tx = call.build_transaction({'from': self.account.address, 'gas': gas, 'nonce': 0, **self.fees.fees()})
+        print(f"    - Settling {len(members)} jobs in one transaction: {ids}")
+        batch_future = Future()
+        self._broadcast(tx, f"claimAndSubmitBatch({len(members)} jobs)", batch_future)
+
+        def resolve(f, futures=[m[3] for m in members]):
+            for future in futures:
+                if f.exception():
+                    future.set_exception(f.exception())
+                else:
+                    future.set_result(f.result())
+        batch_future.add_done_callback(resolve)
+
+    def _job_state(self, on_chain_id: int) -> tuple:
+        """(status, provider) from the chain index, or from getJob() if the job isn't indexed."""
+        if self.chain_index is not None:
+            job = self.chain_index.get_job(on_chain_id)
+            if job is not None:
+                return job['status'], job['provider']
+        job_info = self.contract.functions.getJob(on_chain_id).call()
+        return job_info[3], job_info[6]
+
+    def _settle(self, job_id: int, on_chain_id: int, update_hash: str, future: Future):
+        if self.contract is None:
+            raise RuntimeError("No contract configured for settlement")
+        status, provider = self._job_state(on_chain_id)
+
+        if status == STATUS_PENDING:
+            print(f"    - Claiming job {on_chain_id} on-chain...")
+            # Not awaited: the submit below uses the next nonce, so it can only be mined after the claim
+            self._broadcast(self._build('claimJob', on_chain_id), f"claimJob({on_chain_id})", Future())
+        elif status != STATUS_PROCESSING or provider != self.account.address:
+            print(f"    [!] Job {on_chain_id} isn't claimable by this worker (status {status}), skipping settlement")
+            future.set_result(None)
+            return
+
+        tx = self._build('submitResult', on_chain_id, to_bytes32(update_hash),
+                         [],  # pubInputs - would contain ZK proof inputs in production
+                         b"")  # proof - would contain actual ZK proof in production
+        print(f"    - Submitting result for job {on_chain_id}...")
+        self._broadcast(tx, f"submitResult({on_chain_id}) for job {job_id}", future)
+
+    def _build(self, function: str, *args) -> dict:
+        return getattr(self.contract.functions, function)(*args).build_transaction({
+            'from': self.account.address,
+            'gas': GAS_LIMITS[function],
+            'nonce': 0,  # Assigned in _broadcast
+            **self.fees.fees(),
+        })
+
+    def _sign_and_send(self, tx: dict):
+        signed = self.account.sign_transaction(tx)
+        return self.w3.eth.send_raw_transaction(signed.raw_transaction)
+
+    def _broadcast(self, tx: dict, label: str, future: Future) -> PendingTx:
+        if self._chain_id is None:
+            self._chain_id = self.w3.eth.chain_id
+        tx = {k: v for k, v in tx.items() if k not in ('gasPrice', 'maxFeePerGas', 'maxPriorityFeePerGas')}
+        tx.update({'from': self.account.address, 'chainId': self._chain_id, **self.fees.fees()})
+        tx.setdefault('gas', 21000)
+
+        for attempt in range(2):
+            tx['nonce'] = self.nonces.next()
+            try:
+                tx_hash = self._sign_and_send(tx)
+                break
+            except Exception as e:
+                # Our view of the nonce is off (restart, external tx, dropped send): re-read it
+                self.nonces.resync()
+                if attempt or 'nonce' not in str(e).lower():
+                    raise
+
+        pending = PendingTx(label, tx, future)
+        pending.hashes.append(tx_hash)
+        self._pending[tx['nonce']] = pending
+        print(f"    - Sent {label}: {tx_hash.hex()} (nonce {tx['nonce']})")
+        return pending
+
+    def _receipt(self, pending: PendingTx):
+        for tx_hash in reversed(pending.hashes):
+            try:
+                return self.w3.eth.get_transaction_receipt(tx_hash)
+            except TransactionNotFound:
+                continue
+        return None
+
+    def _check_pending(self):
+        now = time.monotonic()
+        for nonce, pending in sorted(self._pending.items()):
+            try:
+                receipt = self._receipt(pending)
+            except Exception as e:
+                print(f"    [!] Receipt check failed for {pending.label}: {e}")
+                continue
+
+            if receipt is not None:
+                del self._pending[nonce]
+                if receipt['status'] == 1:
+                    print(f"    [+] Confirmed {pending.label} in block {receipt['blockNumber']}")
+                    pending.future.set_result(receipt)
+                else:
+                    print(f"    [!] {pending.label} reverted: {receipt['transactionHash'].hex()}")
+                    pending.future.set_exception(RuntimeError(f"{pending.label} reverted"))
+            elif now - pending.first_sent > self.receipt_timeout:
+                del self._pending[nonce]
+                pending.future.set_exception(TimeoutError(f"{pending.label} not mined after {self.receipt_timeout:.0f}s"))
+                self.nonces.resync()
+            elif now - pending.last_sent > self.replace_after and pending.replacements < self.max_replacements:
+                self._replace(pending)
+
+    def _replace(self, pending: PendingTx):
+        """Re-send a stuck transaction with the same nonce and at least FEE_BUMP higher fees."""
+        current = self.fees.fees()
+        bumped = bump_fees({k: pending.tx[k] for k in current if k in pending.tx})
+        pending.tx.update({k: max(bumped.get(k, 0), v) for k, v in current.items()})
+        pending.replacements += 1
+        pending.last_sent = time.monotonic()
+        try:
+            tx_hash = self._sign_and_send(pending.tx)
+            pending.hashes.append(tx_hash)
+            print(f"    - Replaced {pending.label} (attempt {pending.replacements}): {tx_hash.hex()}")
+        except Exception as e:
+            # Usually means an earlier hash was just mined; the next receipt check will tell
+            print(f"    [!] Replacement of {pending.label} failed: {e}")
@@ -5,8 +5,6 @@ import numpy as np
 import json
 import os
 import asyncio
-import subprocess
-import tempfile
 from supabase import create_client, Client
 from web3 import Web3
 from web3.middleware import ExtraDataToPOAMiddleware
@@ -14,10 +12,29 @@ from dotenv import load_dotenv
 import uuid
 import types
 import requests
+import socket
 import sys
 from datetime import datetime
 import io
-import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from job_events import open_job_events, FALLBACK_POLL_INTERVAL
+from http_client import FetchProxy
+from artifact_cache import ArtifactCache
+from inference_engine import InferenceEngine
+from inference_server import InferenceServer, AuditWriter
+from completion_writer import CompletionWriter
+from pagination import pending_jobs_page
+from node_capabilities import node_capabilities
+from bloom import BloomFilter
+from dataset_shards import job_dataset_url
+from job_splitter import SHARD_TARGET_MB, auto_shard_count, split_job
+from sandbox_pool import SandboxPool
+from settlement import SettlementQueue
+from chain_index import ChainIndex
+from tensor_channel import new_channel_path, read_tensors
+from merkle import MerkleHasher, SIDECAR_SUFFIX
+from update_format import encode_update, UPDATE_GRAD_BITS, UPDATE_WEIGHT_BITS, UPDATE_TOPK_RATIO
 
 load_dotenv()
 
@@ -27,6 +44,9 @@ SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
 RPC_URL = os.environ.get("RPC_URL", "https://polygon-amoy-bor-rpc.publicnode.com")
 CONTRACT_ADDRESS = os.environ.get("CONTRACT_ADDRESS")
 PRIVATE_KEY = os.environ.get("PRIVATE_KEY")
+MAX_CONCURRENT_JOBS = int(os.environ.get("MAX_CONCURRENT_JOBS", "2"))  # Job slots on this node
+INFERENCE_SERVE_PORT = int(os.environ.get("INFERENCE_SERVE_PORT", "0"))  # Local /infer endpoint (0 = off)
+FALLBACK_CLAIM_PAGES = 4  # Pages of pending jobs tried when claim_job_fair_batch is unavailable
 
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise ValueError("Missing required environment variables: SUPABASE_URL and SUPABASE_KEY")
@@ -59,64 +79,111 @@ with open(abi_path, "r") as f:
 
 contract = w3.eth.contract(address=CONTRACT_ADDRESS, abi=CONTRACT_ABI) if CONTRACT_ADDRESS else None
 
-def quantize_gradients(gradients, bits=8):
-    """Quantize gradients to reduce bandwidth for federated learning."""
-    q_grads = []
-    for g in gradients:
-        if not isinstance(g, torch.Tensor):
-            g = torch.tensor(g, dtype=torch.float32)
-        max_val = torch.max(torch.abs(g))
-        scale = (2**(bits-1) - 1) / (max_val if max_val > 0 else 1)
-        q_g = torch.round(g * scale).to(torch.int8)
-        q_grads.append(q_g.numpy().tolist())
-    return q_grads
-
-def register_node(supabase: Client, worker_type: str = 'python'):
-    """Register or update node heartbeat in database."""
+# Scripts, datasets and model weights are downloaded once and reused across jobs
+artifact_cache = ArtifactCache()
+
+# Built models stay loaded; concurrent inference jobs on one model share a forward pass
+inference_engine = InferenceEngine(artifact_cache)
+
+# Cached downloads for sandboxed scripts (their fetch()/open_dataset() built-ins); needs Unix sockets
+fetch_proxy = FetchProxy(cache=artifact_cache) if hasattr(socket, 'AF_UNIX') else None
+
+# Warm sandbox interpreters, one per job slot
+sandbox_pool = SandboxPool(MAX_CONCURRENT_JOBS, fetch_socket=fetch_proxy.path if fetch_proxy else None)
+
+# Local job state from contract events, so settlement doesn't call getJob() per job
+chain_index = ChainIndex(w3, contract) if contract else None
+
+# Batched complete_job writes; created in main() once there is a Supabase client
+completion_writer = None
+
+# Background transaction pipeline for on-chain settlement
+settlement = SettlementQueue(w3, worker_account, contract, chain_index) if worker_account and contract else None
+
+def encode_worker_update(weights, gradients) -> bytes:
+    """Pack weights and quantized gradients into the binary update format."""
+    return encode_update(
+        {'weights': weights, 'grads': gradients},
+        bits={'grads': UPDATE_GRAD_BITS, 'weights': UPDATE_WEIGHT_BITS},
+        topk_ratio={'grads': UPDATE_TOPK_RATIO},
+        meta={'worker': NODE_ID}
+    )
+
+def upload_worker_update(supabase: Client, job_id: int, data: bytes, sidecar: bytes = None) -> str:
+    """
+    Upload an encoded update for the aggregator, plus its Merkle leaf sidecar
+    if given. Returns the update's public URL or None.
+    """
+    bucket_name = 'worker-updates'
+    file_name = f"update_job_{job_id}_{NODE_ID}_{int(datetime.now().timestamp())}.oblu"
+    try:
+        try:
+            supabase.storage.from_(bucket_name).upload(
+                path=file_name,
+                file=data,
+                file_options={"content-type": "application/octet-stream"}
+            )
+        except Exception:
+            supabase.storage.create_bucket(bucket_name, options={"public": True})
+            supabase.storage.from_(bucket_name).upload(
+                path=file_name,
+                file=data,
+                file_options={"content-type": "application/octet-stream"}
+            )
+        if sidecar:
+            try:
+                supabase.storage.from_(bucket_name).upload(
+                    path=file_name + SIDECAR_SUFFIX,
+                    file=sidecar,
+                    file_options={"content-type": "application/json"}
+                )
+            except Exception as e:
+                # The aggregator can still verify the whole file against the root
+                print(f"    [!] Merkle sidecar upload failed: {e}")
+        return supabase.storage.from_(bucket_name).get_public_url(file_name)
+    except Exception as e:
+        print(f"    [!] Update upload failed: {e}")
+        return None
+
+# Cleared if the nodes table has no capability columns yet (fair_job_distribution.sql not re-run)
+advertise_capabilities = True
+
+def register_node(supabase: Client, worker_type: str = 'python', current_jobs: int = None):
+    """
+    Register or update node heartbeat in database, with the worker's own job
+    count, the capabilities the claim RPCs route jobs by, and a Bloom digest
+    of the cached artifacts they prefer to send us jobs for.
+    """
+    global advertise_capabilities
     try:
         wallet_addr = worker_account.address if worker_account else None
-        supabase.table('nodes').upsert({
+        node = {
             'hardware_id': NODE_ID,
             'status': 'active',
             'wallet_address': wallet_addr,
             'last_seen': datetime.utcnow().isoformat(),
             'worker_type': worker_type
-        }, on_conflict='hardware_id').execute()
+        }
+        if current_jobs is not None:
+            node['current_jobs'] = current_jobs  # Local slot count is authoritative
+        if advertise_capabilities:
+            node.update(node_capabilities())
+            node['cached_models'] = inference_engine.models.urls()
+            node['artifact_bloom'] = BloomFilter.from_keys(artifact_cache.urls()).to_postgres()
+        try:
+            supabase.table('nodes').upsert(node, on_conflict='hardware_id').execute()
+        except Exception as e:
+            if not advertise_capabilities or getattr(e, 'code', None) != 'PGRST204':  # Unknown column
+                raise
+            print(f"[!] nodes table has no capability columns, registering without them: {e}")
+            advertise_capabilities = False
+            for column in list(node_capabilities()) + ['cached_models', 'artifact_bloom']:
+                node.pop(column)
+            supabase.table('nodes').upsert(node, on_conflict='hardware_id').execute()
         print(f"[*] Node registered in database")
     except Exception as e:
         print(f"[!] Node registration failed: {e}")
 
-def complete_job_with_stats(supabase: Client, job_id: int, status: str = 'completed', result_url: str = None):
-    """Complete a job and update worker statistics."""
-    try:
-        # Try using the RPC function for atomic completion
-        result = supabase.rpc('complete_job', {
-            'p_job_id': job_id,
-            'p_provider_address': NODE_ID,
-            'p_result_url': result_url,
-            'p_status': status
-        }).execute()
-        return result.data == True
-    except Exception as e:
-        # Fallback to direct update
-        print(f"[!] RPC complete_job failed, using fallback: {e}")
-        try:
-            update_data = {'status': status}
-            if result_url:
-                update_data['result_url'] = result_url
-            supabase.table('jobs').update(update_data).eq('id', job_id).execute()
-            return True
-        except:
-            return False
-
-def get_worker_load(supabase: Client) -> int:
-    """Get current worker's job load."""
-    try:
-        result = supabase.table('nodes').select('current_jobs').eq('hardware_id', NODE_ID).single().execute()
-        return result.data.get('current_jobs', 0) if result.data else 0
-    except:
-        return 0
-
 def atomic_claim_job(supabase: Client, job_id: int) -> bool:
     """
     Atomically claim a job using database function to prevent race conditions.
@@ -162,185 +229,390 @@ def atomic_claim_job(supabase: Client, job_id: int) -> bool:
     
     return False
 
+def claim_jobs_batch(supabase: Client, limit: int) -> list:
+    """
+    Lease up to `limit` pending jobs in one round trip via claim_job_fair_batch.
+    Returns the claimed job rows. Falls back to per-job claims if the RPC is unavailable.
+    """
+    try:
+        result = supabase.rpc('claim_job_fair_batch', {
+            'p_provider_address': NODE_ID,
+            'p_limit': limit
+        }).execute()
+        return result.data or []
+    except Exception as e:
+        print(f"[!] RPC claim_job_fair_batch failed, using per-job claims: {e}")
+    
+    claimed = []
+    cursor = None
+    for _ in range(FALLBACK_CLAIM_PAGES):
+        # Page past jobs other workers won instead of re-reading the same head of the queue
+        jobs, cursor = pending_jobs_page(supabase, 5, cursor)
+        for job in jobs:
+            if len(claimed) >= limit:
+                return claimed
+            # Atomic job claim to prevent race conditions
+            if atomic_claim_job(supabase, job['id']):
+                claimed.append(job)
+            else:
+                print(f"[*] Job {job['id']} already claimed by another worker")
+        if claimed or cursor is None:
+            break
+    return claimed
+
 def execute_training_sandboxed(script_code: str, dataset_url: str, timeout: int = 300) -> dict:
     """
-    Execute training script in a sandboxed subprocess for security.
+    Execute training script in a warm sandbox interpreter for security.
     Returns dict with gradients, loss, and weights.
     """
-    # Create a wrapper script that executes safely
-    wrapper_script = f'''
-import sys
-import json
-import torch
-import torch.nn as nn
-import torch.optim as optim
-import numpy as np
+    result_path = new_channel_path()
+    try:
+        result = sandbox_pool.run(script_code, dataset_url, result_path, timeout=timeout)
+        if result.get('success'):
+            # Tensors are mapped from the job's channel file, not copied
+            groups, _ = read_tensors(result_path)
+            grads = groups.get('grads', {})
+            names = list(grads)
+            if all(name.isdigit() for name in names):
+                names.sort(key=int)  # Written as a list: "0", "1", ... "10"
+            result['grads'] = [grads[k] for k in names]
+            result['weights'] = groups.get('weights')
+        return result
+    except Exception as e:
+        return {'success': False, 'error': f'Invalid sandbox result: {e}'}
+    finally:
+        if os.path.exists(result_path):
+            os.unlink(result_path)
 
-# Disable dangerous operations
-import builtins
-original_import = builtins.__import__
-
-ALLOWED_MODULES = {{
-    'torch', 'torch.nn', 'torch.optim', 'torch.nn.functional',
-    'numpy', 'np', 'pandas', 'pd', 'json', 'math', 'collections',
-    'functools', 'itertools', 'typing', 'io', 'csv',
-    # Internal Python modules needed for basic operations
-    '_io', 'codecs', 'encodings', 'abc', '_abc', '_codecs',
-    '_collections_abc', '_functools', '_operator', '_weakref',
-    'operator', 'weakref', 'reprlib', 'keyword', '_string',
-    'string', 're', '_sre', 'sre_compile', 'sre_parse', 'sre_constants',
-    'copyreg', 'copy', 'warnings', '_warnings', 'contextlib',
-    # NumPy internals
-    'numpy.core', 'numpy.lib', 'numpy.linalg', 'numpy.random',
-    # Torch internals
-    'torch.autograd', 'torch.cuda', 'torch.utils', 'torch._C',
-}}
-
-# Allow any module that starts with these prefixes
-ALLOWED_PREFIXES = ('torch.', 'numpy.', 'pandas.', '_', 'encodings.')
-
-def safe_import(name, *args, **kwargs):
-    base_module = name.split('.')[0]
-    # Allow internal modules (start with _) and whitelisted modules
-    if (base_module.startswith('_') or 
-        name in ALLOWED_MODULES or 
-        base_module in ALLOWED_MODULES or
-        any(name.startswith(p) for p in ALLOWED_PREFIXES)):
-        return original_import(name, *args, **kwargs)
-    raise ImportError(f"Import of '{{name}}' is not allowed in sandbox")
-
-builtins.__import__ = safe_import
-
-# User script
-{script_code}
-
-# Execute and capture results
-try:
-    result = train("{dataset_url}")
-    if isinstance(result, tuple) and len(result) >= 2:
-        grads, loss = result[0], result[1]
-        weights = result[2] if len(result) > 2 else None
-    else:
-        grads, loss, weights = result, 0.0, None
-    
-    # Serialize results
-    output = {{
-        'success': True,
-        'loss': float(loss) if loss else 0.0,
-        'grads_shape': [list(g.shape) if hasattr(g, 'shape') else len(g) for g in grads] if grads else [],
-    }}
+def settle_on_chain(job_id: int, on_chain_id: int, update_hash: str):
+    """
+    Queue job completion for on-chain settlement. Returns at once; the
+    settlement thread sends the transactions and confirms them in the background.
+    """
+    if not settlement:
+        print("[!] Blockchain not configured, skipping on-chain settlement")
+        return None
     
-    # Save weights if available
-    if weights:
-        if hasattr(weights, 'state_dict'):
-            weights = weights.state_dict()
-        torch.save(weights, '/tmp/sandbox_weights.pt')
-        output['weights_saved'] = True
+    future = settlement.settle(job_id, on_chain_id, update_hash)
     
-    print(json.dumps(output))
-except Exception as e:
-    print(json.dumps({{'success': False, 'error': str(e)}}))
-'''
+    def report(f):
+        if f.exception():
+            print(f"[!] On-chain settlement failed for job {job_id}: {f.exception()}")
+    future.add_done_callback(report)
+    print(f"    - Queued on-chain settlement for job {on_chain_id} ({settlement.pending_count} transactions pending)")
+    return future
+
+class JobLogRouter(io.TextIOBase):
+    """
+    Stand-in for sys.stdout that sends print() output to the log buffer of
+    the job running on the current thread, or to the real stdout otherwise.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+
+    def capture(self, buffer: io.StringIO):
+        self._local.buffer = buffer
+
+    def release(self):
+        self._local.buffer = None
+
+    def write(self, s):
+        buffer = getattr(self._local, 'buffer', None)
+        return (buffer or self._stream).write(s)
+
+    def flush(self):
+        self._stream.flush()
+
+def process_job(supabase: Client, job: dict, job_logs: JobLogRouter):
+    """Run a claimed job to completion. Blocking; called from a job slot thread."""
+    job_id = job['id']
+    job_type = job.get('job_type', 'training')
+
+    print(f"\n[*] Processing {job_type.upper()} Job {job_id}...")
+
+    # Capture logs (per job, so concurrent slots don't mix their output)
+    log_stream = io.StringIO()
+    job_logs.capture(log_stream)
     
+    # Everything the job row gets, written in one complete_job call once the logs are up
+    completion = {'status': 'failed'}
+    split = False  # Split into shard jobs: the parent completes when its shards do
+
     try:
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
-            f.write(wrapper_script)
-            script_path = f.name
-        
-        # Execute in subprocess with timeout and resource limits
-        result = subprocess.run(
-            [sys.executable, script_path],
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-            env={**os.environ, 'PYTHONPATH': ''}  # Clean environment
-        )
-        
-        os.unlink(script_path)
-        
-        if result.returncode == 0:
+        if job_type == 'training':
+            # 1. Execute Training (SECURE)
+            script_url = job.get('script_url') or job.get('model_hash')
+            dataset_url = job_dataset_url(job)  # Shard jobs get their slice of the parent's dataset
+            
+            # Large datasets fan out to other workers as shard jobs instead of running here
+            # (jobs funded on chain are settled by one worker, so they always run whole)
+            if (SHARD_TARGET_MB and not job.get('parent_job_id') and not job.get('on_chain_id')
+                    and dataset_url.startswith('http')):
+                try:
+                    shards = auto_shard_count(dataset_url)
+                    children = split_job(supabase, job, shards, NODE_ID) if shards > 1 else []
+                except Exception as split_err:
+                    print(f"[!] Could not split job {job_id}, training it whole: {split_err}")
+                    children = []
+                if children:
+                    print(f"[+] Job {job_id} split into {len(children)} shard jobs "
+                          f"({', '.join(str(c['id']) for c in children)})")
+                    split = True
+                    return
+            
+            # Check if script_url is a valid HTTP URL
+            is_valid_url = script_url and script_url.startswith('http')
+            
+            if not script_url or script_url.startswith('ipfs://') or not is_valid_url:
+                # Use default model for IPFS, missing scripts, or invalid URLs
+                print("    - Using default model architecture...")
+                module = nn.Sequential(nn.Linear(10, 32), nn.ReLU(), nn.Linear(32, 1))
+                
+                # Simple training loop
+                optimizer = torch.optim.SGD(module.parameters(), lr=0.01)
+                data = torch.randn(16, 10)
+                target = torch.randn(16, 1)
+                
+                for _ in range(10):
+                    optimizer.zero_grad()
+                    loss = nn.MSELoss()(module(data), target)
+                    loss.backward()
+                    optimizer.step()
+                
+                grads = [p.grad for p in module.parameters() if p.grad is not None]
+                loss_val = loss.item()
+                num_samples = len(data)
+                weights = module.state_dict()
+                print(f"    - Training complete. Loss: {loss_val:.4f}")
+            else:
+                # Download and execute script in sandbox
+                print(f"    - Downloading training script from {script_url}...")
+                try:
+                    script_code = artifact_cache.get_text(script_url)
+                except requests.RequestException as e:
+                    raise Exception(f"Failed to download script: {e}")
+                
+                print("    - Executing in secure sandbox...")
+                sandbox_result = execute_training_sandboxed(script_code, dataset_url)
+                
+                if not sandbox_result.get('success'):
+                    raise Exception(f"Sandbox execution failed: {sandbox_result.get('error')}")
+                
+                loss_val = sandbox_result.get('loss', 0.0)
+                grads = sandbox_result['grads']
+                num_samples = sandbox_result.get('num_samples')
+                
+                # Weights come back with the gradients on the result channel
+                if sandbox_result.get('weights'):
+                    weights = sandbox_result['weights']
+                else:
+                    module = nn.Sequential(nn.Linear(10, 32), nn.ReLU(), nn.Linear(32, 1))
+                    weights = module.state_dict()
+
+            # 2. Handle Weights Upload
+            result_url = None
             try:
-                output = json.loads(result.stdout.strip().split('\\n')[-1])
-                return output
-            except json.JSONDecodeError:
-                return {'success': False, 'error': f'Invalid output: {result.stdout}'}
-        else:
-            return {'success': False, 'error': result.stderr}
+                buffer = io.BytesIO()
+                torch.save(weights if weights else {"info": "Final state dict"}, buffer)
+                buffer.seek(0)
+                
+                bucket_name = 'trained-models'
+                file_name = f"model_job_{job_id}_{int(datetime.now().timestamp())}.pt"
+                
+                print(f"    - Uploading weights to {bucket_name}...")
+                try:
+                    supabase.storage.from_(bucket_name).upload(
+                        path=file_name,
+                        file=buffer.getvalue(),
+                        file_options={"content-type": "application/octet-stream"}
+                    )
+                    result_url = supabase.storage.from_(bucket_name).get_public_url(file_name)
+                    print(f"    [+] Weights uploaded: {result_url}")
+                except Exception as upload_err:
+                    print(f"    [!] Upload failed: {upload_err}")
+                    try:
+                        supabase.storage.create_bucket(bucket_name, options={"public": True})
+                        supabase.storage.from_(bucket_name).upload(path=file_name, file=buffer.getvalue())
+                        result_url = supabase.storage.from_(bucket_name).get_public_url(file_name)
+                    except:
+                        pass
+
+            except Exception as ue:
+                print(f"    [!] Weight processing failed: {ue}")
+
+            # 3. Encode the update and Merkle-hash the exact bytes uploaded
+            update_data = encode_worker_update(weights, grads)
+            hasher = MerkleHasher()
+            hasher.update(update_data)
+            u_hash = hasher.root()
+            update_url = upload_worker_update(supabase, job_id, update_data, hasher.sidecar())
+            print(f"    - Update encoded: {len(update_data) / 1024:.1f} KB (grads {UPDATE_GRAD_BITS}-bit)")
             
-    except subprocess.TimeoutExpired:
-        return {'success': False, 'error': 'Script execution timed out'}
-    except Exception as e:
-        return {'success': False, 'error': str(e)}
+            # 4. Settle on chain if applicable
+            if job.get('on_chain_id'):
+                settle_on_chain(job_id, int(job['on_chain_id']), u_hash)
+            
+            # 5. Complete with the update recorded in the same call (worker_updates row included)
+            completion = {
+                'status': 'completed',
+                'result_url': result_url,
+                'update_hash': u_hash,
+                'update_url': update_url,
+                'num_samples': num_samples,
+            }
+            print(f"[+] Training Job {job_id} Complete. Loss: {loss_val}")
+
+        elif job_type == 'inference':
+            # Real Inference Job logic
+            input_raw = job.get('input_data') or "{}"
+            model_url = job.get('model_url') or job.get('result_url')
+            
+            print(f"    - Starting inference sequence...")
+            prediction = None
+            try:
+                # 1. Parse input
+                input_data = json.loads(input_raw)
+                data_list = input_data.get('data', [0.0] * 10)
+                
+                # 2. Run on the cached model (downloaded and built on first use)
+                if model_url and not model_url.startswith('ipfs://'):
+                    print(f"    - Running model {model_url}")
+                    output = inference_engine.infer(model_url, data_list)
+                    if output is not None:
+                        prediction = f"RESULT: {output}"
+                    else:
+                        prediction = f"RESULT: Model executed successfully"
+                else:
+                    # Default inference
+                    prediction = f"RESULT: [{', '.join([f'{x:.4f}' for x in torch.randn(2).tolist()])}]"
+
+            except json.JSONDecodeError as e:
+                prediction = f"ERROR: Invalid input JSON - {e}"
+            except requests.RequestException as e:
+                prediction = f"ERROR: Failed to download model - {e}"
+            except Exception as inf_err:
+                print(f"    [!] Inference error: {inf_err}")
+                prediction = f"ERROR: {str(inf_err)}"
+            
+            completion = {'status': 'completed', 'inference_result': prediction}
+            print(f"[+] Inference Job {job_id} Complete: {prediction}")
 
-async def settle_on_chain(job_id: int, on_chain_id: int, update_hash: str):
-    """Submit job completion to blockchain with ZK proof."""
-    if not worker_account or not contract:
-        print("[!] Blockchain not configured, skipping on-chain settlement")
-        return
+    except Exception as ie:
+        print(f"[!] Job failed: {ie}")
+        completion = {'status': 'failed'}
     
-    try:
-        nonce = w3.eth.get_transaction_count(worker_account.address)
+    finally:
+        # Restore stdout and upload logs
+        job_logs.release()
+        final_logs = log_stream.getvalue()
+        print(final_logs)
         
-        # Check job status on chain
-        job_info = contract.functions.getJob(on_chain_id).call()
-        job_status = job_info[3]  # Status is at index 3
-        
-        if job_status == 0:  # Pending - need to claim first
-            print(f"    - Claiming job {on_chain_id} on-chain...")
-            tx = contract.functions.claimJob(on_chain_id).build_transaction({
-                'from': worker_account.address,
-                'nonce': nonce,
-                'gas': 200000,
-                'gasPrice': w3.eth.gas_price * 2
-            })
-            signed_tx = w3.eth.account.sign_transaction(tx, PRIVATE_KEY)
-            tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
-            w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
-            nonce += 1
-            print(f"    - Claimed: {tx_hash.hex()}")
-
-        # Submit result
-        print(f"    - Submitting result for job {on_chain_id}...")
-        tx = contract.functions.submitResult(
-            on_chain_id,
-            Web3.to_bytes(hexstr=update_hash if update_hash.startswith('0x') else '0x' + update_hash),
-            [],  # pubInputs - would contain ZK proof inputs in production
-            b""  # proof - would contain actual ZK proof in production
-        ).build_transaction({
-            'from': worker_account.address,
-            'nonce': nonce,
-            'gas': 300000,
-            'gasPrice': w3.eth.gas_price * 2
-        })
-        signed_tx = w3.eth.account.sign_transaction(tx, PRIVATE_KEY)
-        tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
-        print(f"    - Submitted: {tx_hash.hex()}")
-        return receipt
+        # A split job's row is now the 'sharded' parent: nothing to upload or complete
+        if not split:
+            try:
+                log_file_name = f"logs/job_{job_id}_{int(datetime.now().timestamp())}.txt"
+                supabase.storage.from_('logs').upload(
+                    path=log_file_name,
+                    file=final_logs.encode(),
+                    file_options={"content-type": "text/plain"}
+                )
+                completion['logs_url'] = supabase.storage.from_('logs').get_public_url(log_file_name)
+            except:
+                pass
         
-    except Exception as e:
-        print(f"[!] On-chain error: {e}")
+            # Status, results, update and logs_url land together; batched with other slots' completions
+            completion_writer.complete(job_id, **completion).add_done_callback(
+                lambda f: f.exception() and print(f"[!] Completing job {job_id} failed: {f.exception()}"))
+
 
 async def main():
     print("--- OBLIVION: SECURE & VERIFIABLE WORKER ---")
     print(f"[*] Worker Type: Python (High-Performance)")
     print(f"[*] Worker ID: {NODE_ID}")
+    print(f"[*] Job Slots: {MAX_CONCURRENT_JOBS}")
+    capabilities = node_capabilities()
+    print(f"[*] Capabilities: {capabilities['cpu_cores']} cores, {capabilities['memory_mb']} MB, "
+          f"{capabilities['gflops']} GFLOP/s{', GPU' if capabilities['has_gpu'] else ''}")
     
     supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-    register_node(supabase, worker_type='python')
+    await asyncio.to_thread(register_node, supabase, 'python', 0)  # Fresh start: nothing running
+    
+    global completion_writer
+    completion_writer = CompletionWriter(supabase, NODE_ID)
+    completion_writer.start()
+    
+    # Pre-fork the sandbox interpreters in the background
+    loop = asyncio.get_running_loop()
+    if fetch_proxy:
+        fetch_proxy.start()
+    loop.run_in_executor(None, sandbox_pool.start)
+    if chain_index:
+        chain_index.follow()
+    if settlement:
+        settlement.start()
+    if INFERENCE_SERVE_PORT:
+        # Direct requests skip the job queue; jobs rows are written afterwards for audit
+        inference_server = InferenceServer(inference_engine, AuditWriter(supabase, NODE_ID), port=INFERENCE_SERVE_PORT)
+        try:
+            await inference_server.start()
+        except ValueError as e:
+            print(f"[!] Inference serving disabled: {e}")
+    
+    # Route print() output per job slot so each job keeps its own logs
+    job_logs = JobLogRouter(sys.stdout)
+    sys.stdout = job_logs
     
     # Track consecutive idle cycles for adaptive polling
     idle_cycles = 0
-    MAX_CONCURRENT_JOBS = 2  # Max jobs this worker can handle simultaneously
+    
+    # Claimed jobs wait here for a free slot; blocking work runs on the slot threads
+    executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_JOBS, thread_name_prefix='job-slot')
+    job_queue: asyncio.Queue = asyncio.Queue(maxsize=MAX_CONCURRENT_JOBS)
+    in_flight = 0  # Claimed jobs that are queued or running
+    leased_jobs = set()  # Their ids; each heartbeat renews their leases
+    
+    # Wake the poller on new or re-queued pending jobs instead of fixed sleeps
+    job_events = await open_job_events(SUPABASE_URL, SUPABASE_KEY, [
+        ('jobs', 'INSERT', 'status=eq.pending'),
+        ('jobs', 'UPDATE', 'status=eq.pending'),
+    ])
+    
+    async def job_slot():
+        nonlocal in_flight
+        while True:
+            job = await job_queue.get()
+            try:
+                await loop.run_in_executor(executor, process_job, supabase, job, job_logs)
+            except Exception as e:
+                print(f"[!] Job slot error on job {job.get('id')}: {e}")
+            finally:
+                in_flight -= 1
+                leased_jobs.discard(job['id'])
+                job_queue.task_done()
+                job_events.notify()  # A slot is free, look for more work
+    
+    slot_tasks = [asyncio.create_task(job_slot()) for _ in range(MAX_CONCURRENT_JOBS)]
     
     # Heartbeat task - more frequent for production
     async def heartbeat():
         while True:
             try:
-                register_node(supabase, worker_type='python')
-                # Also cleanup stale jobs periodically
+                await asyncio.to_thread(register_node, supabase, 'python', in_flight)
+                # Keep our claimed jobs from being reaped (leases last job_lease_ttl(), 60s)
+                if leased_jobs:
+                    job_ids = list(leased_jobs)
+                    try:
+                        await asyncio.to_thread(lambda: supabase.rpc('renew_job_leases', {
+                            'p_provider_address': NODE_ID,
+                            'p_job_ids': job_ids
+                        }).execute())
+                    except Exception as e:
+                        print(f"[!] Lease renewal failed: {e}")
+                # Reap expired leases (a no-op where pg_cron runs the reaper)
                 try:
-                    supabase.rpc('cleanup_stale_jobs').execute()
+                    await asyncio.to_thread(lambda: supabase.rpc('cleanup_stale_jobs').execute())
                 except:
                     pass
             except:
@@ -349,230 +621,24 @@ async def main():
     
     heartbeat_task = asyncio.create_task(heartbeat())
     
-    import random
-    
     while True:
         try:
-            # Check current worker load
-            current_load = get_worker_load(supabase)
-            if current_load >= MAX_CONCURRENT_JOBS:
-                print(f"[*] Worker at capacity ({current_load}/{MAX_CONCURRENT_JOBS} jobs), waiting...")
-                await asyncio.sleep(3)
+            # Slots are counted locally; the heartbeat reports the count to the database
+            if in_flight >= MAX_CONCURRENT_JOBS:
+                await job_events.wait(1)
                 continue
             
-            # Query pending jobs
-            response = supabase.table('jobs').select("*").eq('status', 'pending').order('created_at').limit(5).execute()
-            jobs = response.data
+            # Lease enough pending jobs to fill the free slots in one call
+            free_slots = MAX_CONCURRENT_JOBS - in_flight
+            jobs = await asyncio.to_thread(claim_jobs_batch, supabase, free_slots)
 
             if jobs:
                 idle_cycles = 0  # Reset idle counter
                 
-                # Small random delay for fair distribution among all workers
-                delay = random.uniform(0.1, 0.5)
-                await asyncio.sleep(delay)
-                
                 for job in jobs:
-                    job_id = job['id']
-                    job_type = job.get('job_type', 'training')
-                    
-                    # Atomic job claim to prevent race conditions
-                    if not atomic_claim_job(supabase, job_id):
-                        print(f"[*] Job {job_id} already claimed by another worker")
-                        continue
-                    
-                    print(f"\n[*] Processing {job_type.upper()} Job {job_id}...")
-
-                    # Capture logs
-                    log_stream = io.StringIO()
-                    old_stdout = sys.stdout
-                    sys.stdout = log_stream
-
-                    try:
-                        if job_type == 'training':
-                            # 1. Execute Training (SECURE)
-                            script_url = job.get('script_url') or job.get('model_hash')
-                            dataset_url = job.get('dataset_url') or job.get('data_hash', '')
-                            
-                            # Check if script_url is a valid HTTP URL
-                            is_valid_url = script_url and script_url.startswith('http')
-                            
-                            if not script_url or script_url.startswith('ipfs://') or not is_valid_url:
-                                # Use default model for IPFS, missing scripts, or invalid URLs
-                                print("    - Using default model architecture...")
-                                module = nn.Sequential(nn.Linear(10, 32), nn.ReLU(), nn.Linear(32, 1))
-                                
-                                # Simple training loop
-                                optimizer = torch.optim.SGD(module.parameters(), lr=0.01)
-                                data = torch.randn(16, 10)
-                                target = torch.randn(16, 1)
-                                
-                                for _ in range(10):
-                                    optimizer.zero_grad()
-                                    loss = nn.MSELoss()(module(data), target)
-                                    loss.backward()
-                                    optimizer.step()
-                                
-                                grads = [p.grad for p in module.parameters() if p.grad is not None]
-                                loss_val = loss.item()
-                                weights = module.state_dict()
-                                print(f"    - Training complete. Loss: {loss_val:.4f}")
-                            else:
-                                # Download and execute script in sandbox
-                                print(f"    - Downloading training script from {script_url}...")
-                                try:
-                                    script_response = requests.get(script_url, timeout=30)
-                                    script_response.raise_for_status()
-                                    script_code = script_response.text
-                                except requests.RequestException as e:
-                                    raise Exception(f"Failed to download script: {e}")
-                                
-                                print("    - Executing in secure sandbox...")
-                                sandbox_result = execute_training_sandboxed(script_code, dataset_url)
-                                
-                                if not sandbox_result.get('success'):
-                                    raise Exception(f"Sandbox execution failed: {sandbox_result.get('error')}")
-                                
-                                loss_val = sandbox_result.get('loss', 0.0)
-                                grads = [torch.randn(10, 32)]  # Placeholder gradients
-                                
-                                # Load weights if saved
-                                weights_path = '/tmp/sandbox_weights.pt'
-                                if sandbox_result.get('weights_saved') and os.path.exists(weights_path):
-                                    weights = torch.load(weights_path, map_location='cpu', weights_only=True)
-                                    os.unlink(weights_path)
-                                else:
-                                    module = nn.Sequential(nn.Linear(10, 32), nn.ReLU(), nn.Linear(32, 1))
-                                    weights = module.state_dict()
-
-                            # 2. Handle Weights Upload
-                            result_url = None
-                            try:
-                                buffer = io.BytesIO()
-                                torch.save(weights if weights else {"info": "Final state dict"}, buffer)
-                                buffer.seek(0)
-                                
-                                bucket_name = 'trained-models'
-                                file_name = f"model_job_{job_id}_{int(datetime.now().timestamp())}.pt"
-                                
-                                print(f"    - Uploading weights to {bucket_name}...")
-                                try:
-                                    supabase.storage.from_(bucket_name).upload(
-                                        path=file_name,
-                                        file=buffer.getvalue(),
-                                        file_options={"content-type": "application/octet-stream"}
-                                    )
-                                    result_url = supabase.storage.from_(bucket_name).get_public_url(file_name)
-                                    print(f"    [+] Weights uploaded: {result_url}")
-                                except Exception as upload_err:
-                                    print(f"    [!] Upload failed: {upload_err}")
-                                    try:
-                                        supabase.storage.create_bucket(bucket_name, options={"public": True})
-                                        supabase.storage.from_(bucket_name).upload(path=file_name, file=buffer.getvalue())
-                                        result_url = supabase.storage.from_(bucket_name).get_public_url(file_name)
-                                    except:
-                                        pass
-
-                            except Exception as ue:
-                                print(f"    [!] Weight processing failed: {ue}")
-
-                            # 3. Create update hash and record
-                            u_hash = hashlib.sha256(json.dumps(quantize_gradients(grads)).encode()).hexdigest()
-                            supabase.table('worker_updates').insert({
-                                'job_id': job_id,
-                                'worker_address': NODE_ID,
-                                'update_hash': u_hash
-                            }).execute()
-                            
-                            # 4. Settle on chain if applicable
-                            if job.get('on_chain_id'):
-                                await settle_on_chain(job_id, int(job['on_chain_id']), u_hash)
-                            
-                            # 5. Mark complete with stats update
-                            complete_job_with_stats(supabase, job_id, 'completed', result_url)
-                            print(f"[+] Training Job {job_id} Complete. Loss: {loss_val}")
-
-                        elif job_type == 'inference':
-                            # Real Inference Job logic
-                            input_raw = job.get('input_data') or "{}"
-                            model_url = job.get('model_url') or job.get('result_url')
-                            
-                            print(f"    - Starting inference sequence...")
-                            prediction = None
-                            try:
-                                # 1. Parse input
-                                input_data = json.loads(input_raw)
-                                data_list = input_data.get('data', [0.0] * 10)
-                                data_tensor = torch.tensor(data_list, dtype=torch.float32)
-                                
-                                # 2. Load model
-                                if model_url and not model_url.startswith('ipfs://'):
-                                    print(f"    - Downloading weights from {model_url}")
-                                    r = requests.get(model_url, timeout=30)
-                                    r.raise_for_status()
-                                    weights_buffer = io.BytesIO(r.content)
-                                    state_dict = torch.load(weights_buffer, map_location='cpu', weights_only=True)
-                                    
-                                    # Reconstruct model from state dict
-                                    if '0.weight' in state_dict:
-                                        layers = []
-                                        layer_idx = 0
-                                        while f'{layer_idx}.weight' in state_dict:
-                                            weight = state_dict[f'{layer_idx}.weight']
-                                            out_f, in_f = weight.shape
-                                            layers.append(nn.Linear(in_f, out_f))
-                                            if f'{layer_idx + 2}.weight' in state_dict:
-                                                layers.append(nn.ReLU())
-                                            layer_idx += 2
-                                        model = nn.Sequential(*layers)
-                                        model.load_state_dict(state_dict)
-                                        
-                                        model.eval()
-                                        with torch.no_grad():
-                                            if data_tensor.dim() == 1:
-                                                data_tensor = data_tensor.unsqueeze(0)
-                                            output = model(data_tensor)
-                                            prediction = f"RESULT: {output.tolist()}"
-                                    else:
-                                        prediction = f"RESULT: Model executed successfully"
-                                else:
-                                    # Default inference
-                                    prediction = f"RESULT: [{', '.join([f'{x:.4f}' for x in torch.randn(2).tolist()])}]"
-
-                            except json.JSONDecodeError as e:
-                                prediction = f"ERROR: Invalid input JSON - {e}"
-                            except requests.RequestException as e:
-                                prediction = f"ERROR: Failed to download model - {e}"
-                            except Exception as inf_err:
-                                print(f"    [!] Inference error: {inf_err}")
-                                prediction = f"ERROR: {str(inf_err)}"
-                            
-                            complete_job_with_stats(supabase, job_id, 'completed', None)
-                            supabase.table('jobs').update({
-                                'inference_result': prediction
-                            }).eq('id', job_id).execute()
-                            print(f"[+] Inference Job {job_id} Complete: {prediction}")
-
-                    except Exception as ie:
-                        print(f"[!] Job failed: {ie}")
-                        complete_job_with_stats(supabase, job_id, 'failed', None)
-                    
-                    finally:
-                        # Restore stdout and upload logs
-                        sys.stdout = old_stdout
-                        final_logs = log_stream.getvalue()
-                        print(final_logs)
-                        
-                        try:
-                            log_file_name = f"logs/job_{job_id}_{int(datetime.now().timestamp())}.txt"
-                            supabase.storage.from_('logs').upload(
-                                path=log_file_name,
-                                file=final_logs.encode(),
-                                file_options={"content-type": "text/plain"}
-                            )
-                            log_url = supabase.storage.from_('logs').get_public_url(log_file_name)
-                            supabase.table('jobs').update({'logs_url': log_url}).eq('id', job_id).execute()
-                        except:
-                            pass
+                    in_flight += 1
+                    leased_jobs.add(job['id'])
+                    await job_queue.put(job)
 
             else:
                 idle_cycles += 1
@@ -586,9 +652,12 @@ async def main():
             print(f"\n[!] Worker error: {e}")
             await asyncio.sleep(5)
         
-        # Adaptive sleep: faster polling when there were jobs recently
+        # Adaptive sleep: faster polling when there were jobs recently.
+        # With push dispatch an idle worker only polls as a slow fallback.
         poll_interval = 2 if idle_cycles < 5 else 5
-        await asyncio.sleep(poll_interval)
+        if job_events.push and idle_cycles > 0:
+            poll_interval = FALLBACK_POLL_INTERVAL
+        await job_events.wait(poll_interval)
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,98 @@
+"""
+Binary tensor channel between the sandbox and the worker.
+
+A sandbox job writes its gradients and weights into a per-job file as raw
+tensor buffers behind a small header:
+
+    b'OBLT' | u32 header length | JSON header | buffers (64-byte aligned)
+
+The header lists each tensor's group, name, dtype, shape and byte offset.
+Files live in shared memory (/dev/shm) where available, and the reader maps
+them so the returned tensors are views on the mapping rather than copies.
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+import uuid
+
+import torch
+
+MAGIC = b'OBLT'
+ALIGN = 64
+CHANNEL_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+def new_channel_path(prefix: str = 'oblivion-result') -> str:
+    """Unique per-job channel file, so concurrent jobs never share a path."""
+    return os.path.join(CHANNEL_DIR, f"{prefix}-{uuid.uuid4().hex}.bin")
+
+def _named_tensors(tensors):
+    """Accept a state dict, a module, or a list of tensors (named by index)."""
+    if hasattr(tensors, 'state_dict'):
+        tensors = tensors.state_dict()
+    items = tensors.items() if isinstance(tensors, dict) else enumerate(tensors)
+    for name, t in items:
+        if t is None:
+            continue
+        if not isinstance(t, torch.Tensor):
+            t = torch.as_tensor(t)
+        yield str(name), t.detach().cpu().contiguous()
+
+def _align(n: int) -> int:
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+def write_tensors(path: str, groups: dict, meta: dict = None):
+    """Write {group: tensors} to `path`. Groups with a None value are skipped."""
+    entries, buffers = [], []
+    offset = 0
+    for group, tensors in groups.items():
+        if tensors is None:
+            continue
+        for name, t in _named_tensors(tensors):
+            data = t.reshape(-1).view(torch.uint8).numpy() if t.numel() else b''
+            entries.append({
+                'group': group,
+                'name': name,
+                'dtype': str(t.dtype).replace('torch.', ''),
+                'shape': list(t.shape),
+                'offset': offset,
+                'nbytes': t.numel() * t.element_size(),
+            })
+            buffers.append(data)
+            offset = _align(offset + entries[-1]['nbytes'])
+
+    header = json.dumps({'tensors': entries, 'meta': meta or {}}).encode()
+    data_start = _align(len(MAGIC) + 4 + len(header))
+    with open(path, 'wb') as f:
+        f.write(MAGIC + struct.pack('>I', len(header)) + header)
+        for entry, data in zip(entries, buffers):
+            f.seek(data_start + entry['offset'])
+            f.write(data)
+        f.truncate(data_start + offset)
+
+def read_tensors(path: str):
+    """
+    Map a channel file and return ({group: {name: tensor}}, meta). Tensors
+    are copy-on-write views of the mapping, which stays alive with them.
+    """
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    if mm[:4] != MAGIC:
+        raise ValueError(f"Not a tensor channel file: {path}")
+    (header_len,) = struct.unpack('>I', mm[4:8])
+    header = json.loads(mm[8:8 + header_len].decode())
+    data_start = _align(8 + header_len)
+
+    groups = {}
+    for entry in header['tensors']:
+        dtype = getattr(torch, entry['dtype'])
+        numel = 1
+        for dim in entry['shape']:
+            numel *= dim
+        if numel == 0:
+            t = torch.empty(entry['shape'], dtype=dtype)
+        else:
+            t = torch.frombuffer(mm, dtype=dtype, count=numel, offset=data_start + entry['offset']).reshape(entry['shape'])
+        groups.setdefault(entry['group'], {})[entry['name']] = t
+    return groups, header['meta']
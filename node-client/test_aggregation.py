@@ -0,0 +1,86 @@
+import pytest
+import torch
+
+from aggregation import (AggregationStrategy, CoordinateMedian, FedAvg, ParameterLayout, TrimmedMean,
+                         create_strategy)
+
+LAYOUT = ParameterLayout({'w': torch.zeros(3), 'b': torch.zeros(1, 2)})
+
+def vec(*values):
+    return torch.tensor(values, dtype=torch.float32)
+
+def aggregate(strategy, vectors, weights=None):
+    for i, v in enumerate(vectors):
+        strategy.add(v, weight=weights[i] if weights else 1.0)
+    try:
+        return strategy.result()
+    finally:
+        strategy.close()
+
+def test_layout_round_trips_and_rejects_bad_updates():
+    state = {'w': torch.tensor([1., 2., 3.]), 'b': torch.tensor([[4., 5.]])}
+    flat = LAYOUT.flatten(state)
+    assert torch.equal(flat, vec(1, 2, 3, 4, 5))
+    assert all(torch.equal(LAYOUT.unflatten(flat)[k], state[k]) for k in state)
+    with pytest.raises(ValueError, match="keys"):
+        LAYOUT.flatten({'w': state['w']})
+    with pytest.raises(ValueError, match="Shape"):
+        LAYOUT.flatten({**state, 'b': torch.zeros(2)})
+    for bad in (float('nan'), float('inf')):
+        with pytest.raises(ValueError, match="NaN or Inf"):
+            LAYOUT.flatten({**state, 'w': torch.tensor([1., bad, 3.])})
+
+def test_fedavg_weights_by_sample_count():
+    result = aggregate(FedAvg(LAYOUT), [vec(1, 1, 1, 1, 1), vec(4, 4, 4, 4, 4)], weights=[2, 1])
+    assert torch.allclose(result, torch.full((5,), 2.0))
+
+def test_fedavg_resumes_from_its_state():
+    strategy = FedAvg(LAYOUT)
+    strategy.add(vec(1, 2, 3, 4, 5), weight=3)
+    resumed = FedAvg.from_state(strategy.state_dict())
+    assert resumed.layout.keys == LAYOUT.keys and resumed.layout.shapes == LAYOUT.shapes
+    resumed.add(vec(5, 6, 7, 8, 9), weight=1)
+    assert resumed.count == 2 and resumed.weight == 4
+    assert torch.allclose(resumed.result(), vec(2, 3, 4, 5, 6))
+
+def test_trimmed_mean_drops_an_outlier_among_few_updates():
+    updates = [vec(1, 2, 3, 4, 5) + i for i in range(4)] + [torch.full((5,), 100.0)]
+    result = aggregate(TrimmedMean(LAYOUT), updates)
+    assert torch.allclose(result, vec(1, 2, 3, 4, 5) + 2)  # Trims 100 and the +0 update
+
+@pytest.mark.parametrize('n, k', [(2, 0), (3, 1), (10, 1), (30, 3), (31, 4)])
+def test_trimmed_mean_rounds_the_trim_up(n, k):
+    updates = [torch.full((5,), float(i)) for i in range(n)]
+    expected = sum(range(k, n - k)) / (n - 2 * k)
+    assert torch.allclose(aggregate(TrimmedMean(LAYOUT), updates), torch.full((5,), expected))
+
+def test_trimmed_mean_handles_ties():
+    result = aggregate(TrimmedMean(LAYOUT, trim_ratio=0.25), [torch.ones(5)] * 4)
+    assert torch.allclose(result, torch.ones(5))
+
+@pytest.mark.parametrize('values, expected', [([3, 1, 2], 2), ([4, 1, 3, 2], 2.5), ([7], 7)])
+def test_median_odd_and_even_counts(values, expected):
+    result = aggregate(CoordinateMedian(LAYOUT), [torch.full((5,), float(v)) for v in values])
+    assert torch.allclose(result, torch.full((5,), float(expected)))
+
+@pytest.mark.parametrize('cls', [TrimmedMean, CoordinateMedian])
+def test_chunked_reduction_matches_whole(cls):
+    layout = ParameterLayout({'w': torch.zeros(20000)})
+    torch.manual_seed(0)
+    updates = [torch.randn(20000) for _ in range(9)]
+    whole = aggregate(cls(layout), updates)
+    # 1 MB / (9 updates x 16 bytes) = chunks of 7281 coordinates, the last one short
+    chunked = aggregate(cls(layout, memory_mb=1), updates)
+    assert torch.allclose(whole, chunked, atol=1e-6)  # Sums may vectorize differently per chunk width
+    reference = torch.stack(updates).sort(dim=0).values
+    if cls is CoordinateMedian:
+        assert torch.equal(whole, reference[4])
+    else:
+        assert torch.allclose(whole, reference[1:8].mean(dim=0), atol=1e-6)
+
+def test_strategies_are_abstract_and_created_by_name():
+    with pytest.raises(TypeError):
+        AggregationStrategy(LAYOUT)
+    assert isinstance(create_strategy('median', LAYOUT), CoordinateMedian)
+    with pytest.raises(ValueError):
+        create_strategy('mean', LAYOUT)
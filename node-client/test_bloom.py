@@ -0,0 +1,43 @@
+import hashlib
+
+import pytest
+
+from bloom import BloomFilter
+
+URLS = [f'https://example.com/datasets/{i}.csv' for i in range(200)]
+
+def sql_words(key):
+    """public.bloom_words: big-endian 32-bit words of the sha256 hex digest."""
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return [int(digest[8 * i:8 * i + 8], 16) for i in range(4)]
+
+def sql_contains(bits: bytes, words) -> bool:
+    """public.bloom_contains_words: get_bit(bytea, n) reads bit n % 8 of byte n // 8."""
+    return all(bits[n // 8] >> (n % 8) & 1 for n in (w % (len(bits) * 8) for w in words))
+
+def test_every_added_key_is_found():
+    bloom = BloomFilter.from_keys(URLS, bits=4096)
+    assert all(url in bloom for url in URLS)
+
+def test_false_positives_are_rare():
+    bloom = BloomFilter.from_keys(URLS, bits=8192)
+    misses = [f'https://example.com/models/{i}.pt' for i in range(2000)]
+    assert sum(url in bloom for url in misses) < 20
+
+def test_layout_matches_the_sql_side():
+    bloom = BloomFilter.from_keys(URLS[:50], bits=1024)
+    literal = bloom.to_postgres()
+    assert literal.startswith('\\x')
+    bits = bytes.fromhex(literal[2:])
+    assert len(bits) == 128
+    for url in URLS[:50]:
+        assert sql_contains(bits, sql_words(url))
+    assert all((url in bloom) == sql_contains(bits, sql_words(url)) for url in URLS[50:])
+
+def test_empty_filter_holds_nothing():
+    assert URLS[0] not in BloomFilter(bits=64)
+
+@pytest.mark.parametrize('bits, hashes', [(0, 4), (12, 4), (64, 0), (64, 9)])
+def test_rejects_bad_sizes(bits, hashes):
+    with pytest.raises(ValueError):
+        BloomFilter(bits, hashes)
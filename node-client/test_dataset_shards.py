@@ -0,0 +1,88 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import http_client
+from dataset_shards import iter_shard, job_dataset_url, parse_shard_url, shard_url
+
+HEADER = b'x,y\n'
+ROWS = [f'{i},{i * i * 37 % 1001}\n'.encode() for i in range(300)]  # Lines of varying length
+DATASET = HEADER + b''.join(ROWS)
+
+class DatasetHandler(BaseHTTPRequestHandler):
+    ranges = True
+    body = DATASET
+
+    def do_GET(self):
+        body, status = self.body, 200
+        requested = self.headers.get('Range')
+        if self.ranges and requested:
+            start = int(requested.split('=')[1].split('-')[0])
+            body, status = body[start:], 206
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        if self.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture(params=[True, False], ids=['ranges', 'no-ranges'])
+def dataset_url(request, monkeypatch):
+    monkeypatch.setattr(http_client, 'CHUNK_SIZE', 97)  # Chunk edges land mid-line
+    handler = type('Handler', (DatasetHandler,), {'ranges': request.param})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}/data.csv'
+    server.shutdown()
+    server.server_close()
+
+def read_shard(url):
+    return b''.join(iter_shard(url))
+
+def bounds(total, shards):
+    return [(total * i // shards, total * (i + 1) // shards) for i in range(shards)]
+
+@pytest.mark.parametrize('shards', [2, 3, 7])
+def test_byte_shards_hold_every_row_exactly_once(dataset_url, shards):
+    rows = []
+    for start, end in bounds(len(DATASET), shards):
+        body = read_shard(shard_url(dataset_url, 'bytes', start, end))
+        assert body.startswith(HEADER)
+        rows += body[len(HEADER):].splitlines(keepends=True)
+    assert rows == ROWS
+
+@pytest.mark.parametrize('shards', [2, 3, 7])
+def test_row_shards_hold_every_row_exactly_once(dataset_url, shards):
+    rows = []
+    for start, end in bounds(len(ROWS), shards):
+        body = read_shard(shard_url(dataset_url, 'rows', start, end))
+        assert body.startswith(HEADER)
+        rows += body[len(HEADER):].splitlines(keepends=True)
+    assert rows == ROWS
+
+def test_open_ended_shards_run_to_the_end(dataset_url):
+    assert read_shard(shard_url(dataset_url, 'rows', 290)) == HEADER + b''.join(ROWS[290:])
+    tail = read_shard(shard_url(dataset_url, 'bytes', len(DATASET) - 20))
+    assert tail.startswith(HEADER) and tail.endswith(ROWS[-1])
+
+def test_unterminated_last_line_gets_a_newline(monkeypatch, dataset_url):
+    monkeypatch.setattr(DatasetHandler, 'body', DATASET[:-1])
+    assert read_shard(shard_url(dataset_url, 'bytes', 50)).endswith(ROWS[-1])
+    assert read_shard(shard_url(dataset_url, 'rows', 299)) == HEADER + ROWS[-1]
+
+def test_shard_urls_round_trip():
+    url = shard_url('https://host/data.csv', 'bytes', 10, 20)
+    assert url == 'https://host/data.csv#shard=bytes:10-20'
+    assert parse_shard_url(url) == ('https://host/data.csv', 'bytes', 10, 20)
+    assert parse_shard_url(shard_url('https://host/d.csv', 'rows', 5)) == ('https://host/d.csv', 'rows', 5, None)
+    assert parse_shard_url('https://host/data.csv') is None
+
+def test_job_dataset_url_points_shard_jobs_at_their_view():
+    job = {'dataset_url': 'https://host/data.csv'}
+    assert job_dataset_url(job) == 'https://host/data.csv'
+    shard = dict(job, shard_unit='rows', shard_start=100, shard_end=200)
+    assert job_dataset_url(shard) == 'https://host/data.csv#shard=rows:100-200'
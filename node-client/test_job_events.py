@@ -0,0 +1,107 @@
+import asyncio
+import sys
+import types
+
+import pytest
+
+import job_events
+from job_events import JobEventSource, LocalJobEvents, open_job_events
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def test_publish_wakes_the_waiting_loop():
+    async def scenario():
+        events = LocalJobEvents()
+        waiter = asyncio.create_task(events.wait(5))
+        await asyncio.sleep(0)
+        events.publish('jobs', 'INSERT', {'id': 7, 'status': 'pending'})
+        woken = await asyncio.wait_for(waiter, 1)
+        return woken, events.last_event
+    woken, event = run(scenario())
+    assert woken
+    assert event == {'table': 'jobs', 'eventType': 'INSERT', 'new': {'id': 7, 'status': 'pending'}}
+
+def test_wait_times_out_without_events_and_is_rearmed():
+    async def scenario():
+        events = LocalJobEvents()
+        events.notify()
+        first = await events.wait(0.01)  # Already set: returns at once
+        second = await events.wait(0.01)  # Cleared by the first wait
+        return first, second
+    assert run(scenario()) == (True, False)
+
+def test_lost_feed_drops_push_and_wakes_the_loop():
+    async def scenario():
+        events = LocalJobEvents()
+        assert events.push
+        waiter = asyncio.create_task(events.wait(5))
+        await asyncio.sleep(0)
+        events.disconnect()
+        return await asyncio.wait_for(waiter, 1), events.push
+    assert run(scenario()) == (True, False)
+
+def test_poll_mode_uses_plain_polling(monkeypatch):
+    monkeypatch.setattr(job_events, 'JOB_DISPATCH_MODE', 'poll')
+    events = run(open_job_events('http://x', 'k', [('jobs', 'INSERT', None)]))
+    assert type(events) is JobEventSource and not events.push
+
+class FakeChannel:
+    def __init__(self, states):
+        self.states = states
+        self.callback = None
+
+    def on_postgres_changes(self, *args, **kwargs):
+        return self
+
+    async def subscribe(self, callback=None):
+        self.callback = callback
+        for state in self.states:  # Acknowledged after subscribe() returns, like the real client
+            asyncio.get_running_loop().call_soon(callback, state, None)
+        return self
+
+class FakeClient:
+    def __init__(self, states):
+        self.channel_ = FakeChannel(states)
+        self.removed = False
+
+    def channel(self, name):
+        return self.channel_
+
+    async def remove_channel(self, channel):
+        self.removed = True
+
+@pytest.fixture
+def realtime(monkeypatch):
+    """open_job_events against a client whose join ends in the given states."""
+    pytest.importorskip('realtime')
+    from realtime.types import RealtimeSubscribeStates
+    monkeypatch.setattr(job_events, 'JOB_DISPATCH_MODE', 'realtime')
+    clients = []
+
+    def open_with(*states):
+        async def acreate_client(url, key):
+            clients.append(FakeClient(states))
+            return clients[-1]
+        monkeypatch.setitem(sys.modules, 'supabase', types.SimpleNamespace(acreate_client=acreate_client))
+        return open_job_events('http://x', 'k', [('jobs', 'INSERT', 'status=eq.pending')])
+    return RealtimeSubscribeStates, open_with, clients
+
+def test_rejected_join_falls_back_to_polling(realtime):
+    states, open_with, clients = realtime
+    for state in (states.CHANNEL_ERROR, states.TIMED_OUT):
+        events = run(open_with(state))
+        assert type(events) is JobEventSource and not events.push
+        assert clients[-1].removed
+
+def test_accepted_join_pushes_until_the_channel_errors(realtime):
+    states, open_with, clients = realtime
+
+    async def scenario():
+        events = await open_with(states.SUBSCRIBED)
+        pushing = events.push
+        clients[-1].channel_.callback(states.CHANNEL_ERROR, None)
+        after_error = events.push, await events.wait(0.01)
+        clients[-1].channel_.callback(states.SUBSCRIBED, None)  # Rejoined
+        return pushing, after_error, events.push
+    assert run(scenario()) == (True, (False, True), True)
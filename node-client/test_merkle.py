@@ -0,0 +1,68 @@
+import json
+import os
+
+import pytest
+
+from merkle import ChunkVerifier, MerkleHasher, leaf_hash, merkle_root, root_from_leaves, verify_proof
+
+DATA = os.urandom(10 * 64 + 17)
+
+def test_streaming_root_matches_one_shot_root():
+    hasher = MerkleHasher(chunk_size=64)
+    for start in range(0, len(DATA), 23):  # Pieces that don't line up with chunks
+        hasher.update(DATA[start:start + 23])
+    assert hasher.root() == merkle_root(DATA, chunk_size=64)
+    assert len(hasher.leaves()) == 11
+
+def test_parallel_and_serial_hashing_agree():
+    serial = MerkleHasher(chunk_size=64, parallel=False)
+    serial.update(DATA)
+    assert serial.root() == merkle_root(DATA, chunk_size=64)
+
+def test_single_chunk_root_is_its_leaf():
+    assert merkle_root(b'abc', chunk_size=64) == leaf_hash(b'abc').hex()
+    assert merkle_root(b'', chunk_size=64) == leaf_hash(b'').hex()
+
+def test_any_changed_byte_changes_the_root():
+    changed = bytearray(DATA)
+    changed[300] ^= 1
+    assert merkle_root(bytes(changed), chunk_size=64) != merkle_root(DATA, chunk_size=64)
+
+def test_inclusion_proofs_verify_every_chunk():
+    hasher = MerkleHasher(chunk_size=64)
+    hasher.update(DATA)
+    root = hasher.root()
+    for index in range(len(hasher.leaves())):
+        chunk = DATA[index * 64:(index + 1) * 64]
+        assert verify_proof(chunk, hasher.proof(index), root)
+        assert not verify_proof(chunk + b'x', hasher.proof(index), root)
+    with pytest.raises(IndexError):
+        hasher.proof(11)
+
+def sidecar():
+    hasher = MerkleHasher(chunk_size=64)
+    hasher.update(DATA)
+    return json.loads(hasher.sidecar()), hasher.root()
+
+def test_chunk_verifier_accepts_the_update_in_any_pieces():
+    leaves, root = sidecar()
+    assert root_from_leaves([bytes.fromhex(h) for h in leaves['leaves']]) == root
+    verifier = ChunkVerifier(leaves, root)
+    for start in range(0, len(DATA), 50):
+        verifier.update(DATA[start:start + 50])
+    verifier.finish()
+
+def test_chunk_verifier_rejects_corrupt_truncated_and_oversized_updates():
+    leaves, root = sidecar()
+    corrupt = bytearray(DATA)
+    corrupt[5] ^= 1
+    with pytest.raises(ValueError, match="Chunk 0"):
+        ChunkVerifier(leaves, root).update(bytes(corrupt[:64]))
+    truncated = ChunkVerifier(leaves, root)
+    truncated.update(DATA[:128])
+    with pytest.raises(ValueError):
+        truncated.finish()
+    with pytest.raises(ValueError, match="larger"):
+        ChunkVerifier(leaves, root).update(DATA + b'x')
+    with pytest.raises(ValueError, match="don't match"):
+        ChunkVerifier(leaves, merkle_root(b'other', chunk_size=64))
@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+
+from pagination import after_cursor, keyset_pages, keyset_rows, pending_jobs_page
+
+class FakeQuery:
+    """Just enough of a PostgREST select builder to page through a list of rows."""
+
+    def __init__(self, rows, log=None):
+        self.rows, self.log = list(rows), log if log is not None else []
+        self.filters, self.orders, self.limit_to = [], [], None
+
+    def table(self, name):
+        return self
+
+    def select(self, columns):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda r: r[column] == value)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda r: r[column] > value)
+        return self
+
+    def or_(self, expression):
+        self.log.append(expression)
+        return self
+
+    def order(self, column):
+        self.orders.append(column)
+        return self
+
+    def limit(self, n):
+        self.limit_to = n
+        return self
+
+    def execute(self):
+        rows = [r for r in self.rows if all(f(r) for f in self.filters)]
+        rows.sort(key=lambda r: tuple(r[c] for c in self.orders))
+        self.log.append(('page', len(rows[:self.limit_to])))
+        return SimpleNamespace(data=rows[:self.limit_to])
+
+ROWS = [{'id': i, 'status': 'pending' if i % 3 else 'completed', 'created_at': f'2026-01-{i // 4 + 1:02d}'}
+        for i in range(1, 26)]
+
+def test_keyset_pages_cover_every_row_once():
+    log = []
+    pages = list(keyset_pages(lambda: FakeQuery(reversed(ROWS), log), page_size=10))
+    assert [len(p) for p in pages] == [10, 10, 5]
+    assert [r['id'] for p in pages for r in p] == list(range(1, 26))
+    assert len(log) == 3
+
+def test_full_last_page_costs_one_empty_request():
+    log = []
+    pages = list(keyset_pages(lambda: FakeQuery(ROWS[:20], log), page_size=10))
+    assert [len(p) for p in pages] == [10, 10]
+    assert log[-1] == ('page', 0)
+
+def test_keyset_rows_resume_after_a_key_and_keep_filters():
+    rows = keyset_rows(lambda: FakeQuery(ROWS).eq('status', 'pending'), after=10, page_size=4)
+    assert [r['id'] for r in rows] == [i for i in range(11, 26) if i % 3]
+
+def test_after_cursor_builds_a_tiebreak_filter():
+    log = []
+    query = FakeQuery(ROWS, log)
+    assert after_cursor(query, None) is query and not log
+    after_cursor(query, ('2026-01-02', 7))
+    assert log == ['created_at.gt."2026-01-02",and(created_at.eq."2026-01-02",id.gt.7)']
+
+def test_pending_jobs_page_returns_a_cursor_only_when_full():
+    supabase = FakeQuery(ROWS)
+    rows, cursor = pending_jobs_page(supabase, limit=5)
+    assert [r['id'] for r in rows] == [1, 2, 4, 5, 7]
+    assert cursor == ('2026-01-02', 7)
+    assert supabase.orders == ['created_at', 'id']
+    rows, cursor = pending_jobs_page(FakeQuery(ROWS), limit=50)
+    assert len(rows) == 17 and cursor is None
@@ -0,0 +1,90 @@
+import time
+
+import pytest
+
+pytest.importorskip('eth_tester')
+from eth_tester import EthereumTester
+from web3 import EthereumTesterProvider, Web3
+
+from settlement import FEE_BUMP, FeeOracle, NonceManager, SettlementQueue, bump_fees
+
+@pytest.fixture
+def chain():
+    tester = EthereumTester()
+    w3 = Web3(EthereumTesterProvider(tester))
+    account = w3.eth.account.create()
+    w3.eth.send_transaction({'from': w3.eth.accounts[0], 'to': account.address, 'value': Web3.to_wei(10, 'ether')})
+    return tester, w3, account
+
+@pytest.fixture
+def settlement(chain):
+    _, w3, account = chain
+    queue = SettlementQueue(w3, account, poll_interval=0.05, replace_after=0.2, receipt_timeout=30)
+    queue.start()
+    yield queue
+    queue.close(5)
+
+def payment(w3, value):
+    return {'to': w3.eth.accounts[1], 'value': value}
+
+def test_nonce_manager_counts_locally_and_resyncs(chain):
+    _, w3, account = chain
+    nonces = NonceManager(w3, account.address)
+    assert [nonces.next() for _ in range(3)] == [0, 1, 2]
+    nonces.resync()
+    assert nonces.next() == 0  # Nothing was sent, so the node still says 0
+
+def test_fee_oracle_prices_with_eip1559(chain):
+    _, w3, _ = chain
+    fees = FeeOracle(w3).fees()
+    base_fee = w3.eth.get_block('latest')['baseFeePerGas']
+    assert fees['maxFeePerGas'] == 2 * base_fee + fees['maxPriorityFeePerGas']
+
+def test_bump_fees_clears_the_replacement_minimum():
+    fees = {'maxFeePerGas': 1000, 'maxPriorityFeePerGas': 10}
+    bumped = bump_fees(fees)
+    assert FEE_BUMP >= 1.1
+    for key, value in fees.items():
+        assert bumped[key] >= value * 1.1
+
+def test_pipelined_sends_use_consecutive_nonces(chain, settlement):
+    _, w3, account = chain
+    futures = [settlement.send(payment(w3, 1000 + i), f'pay{i}') for i in range(5)]
+    receipts = [f.result(10) for f in futures]
+    assert [r['status'] for r in receipts] == [1] * 5
+    nonces = [w3.eth.get_transaction(r['transactionHash'])['nonce'] for r in receipts]
+    assert nonces == [0, 1, 2, 3, 4]
+    assert w3.eth.get_transaction_count(account.address) == 5
+
+def test_stuck_transaction_is_replaced_with_higher_fees(chain, settlement):
+    tester, w3, _ = chain
+    tester.disable_auto_mine_transactions()
+    future = settlement.send(payment(w3, 7), 'stuck')
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline and not any(len(p.hashes) > 1 for p in settlement._pending.values()):
+        time.sleep(0.05)
+    (pending,) = settlement._pending.values()
+    assert len(pending.hashes) > 1  # Re-sent under a new hash with the same nonce
+    # No block was mined, so the original send was priced at the current fees
+    original = FeeOracle(w3).fees()
+    assert pending.tx['maxFeePerGas'] >= original['maxFeePerGas'] * 1.1
+    assert pending.tx['maxPriorityFeePerGas'] >= original['maxPriorityFeePerGas'] * 1.1
+
+    tester.mine_blocks(1)
+    receipt = future.result(10)
+    assert receipt['status'] == 1
+    assert receipt['transactionHash'] in pending.hashes
+    assert w3.eth.get_transaction(receipt['transactionHash'])['nonce'] == pending.tx['nonce']
+    tester.enable_auto_mine_transactions()
+
+def test_resyncs_after_a_transaction_sent_outside_the_queue(chain, settlement):
+    _, w3, account = chain
+    assert settlement.send(payment(w3, 1), 'first').result(10)['status'] == 1
+    # Another process spends the next nonce behind the queue's back
+    tx = {**payment(w3, 2), 'nonce': 1, 'gas': 21000, 'maxFeePerGas': Web3.to_wei(10, 'gwei'),
+          'maxPriorityFeePerGas': Web3.to_wei(1, 'gwei'), 'chainId': w3.eth.chain_id}
+    w3.eth.send_raw_transaction(account.sign_transaction(tx).raw_transaction)
+
+    receipt = settlement.send(payment(w3, 3), 'after').result(10)
+    assert receipt['status'] == 1
+    assert w3.eth.get_transaction(receipt['transactionHash'])['nonce'] == 2
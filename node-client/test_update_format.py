@@ -0,0 +1,52 @@
+import pytest
+import torch
+
+from update_format import (decode_update, dequantize, encode_update, is_update, pack_4bit,
+                           quantize, unpack_4bit)
+
+def test_raw_round_trip_keeps_dtype_and_values():
+    weights = {'w': torch.randn(3, 4), 'b': torch.randn(4).double(), 'steps': torch.tensor([7, 8])}
+    groups, meta = decode_update(encode_update({'weights': weights}, meta={'loss': 0.5}))
+    assert meta == {'loss': 0.5}
+    for name, t in weights.items():
+        assert groups['weights'][name].dtype == t.dtype
+        assert torch.equal(groups['weights'][name], t)
+
+def test_gradient_lists_are_named_by_index():
+    grads = [torch.ones(2), torch.zeros(3)]
+    groups, _ = decode_update(encode_update({'grads': grads, 'weights': None}))
+    assert set(groups) == {'grads'}
+    assert torch.equal(groups['grads']['1'], grads[1])
+
+@pytest.mark.parametrize('bits', [8, 4])
+def test_quantized_error_is_within_half_a_step(bits):
+    t = torch.randn(1001)
+    groups, _ = decode_update(encode_update({'grads': [t]}, bits={'grads': bits}))
+    step = (max(t.max().item(), 0) - min(t.min().item(), 0)) / ((1 << bits) - 1)
+    assert (groups['grads']['0'] - t).abs().max() <= step / 2 + 1e-6
+
+def test_zero_survives_quantization():
+    codes, scale, zero_point = quantize(torch.tensor([-1.0, 0.0, 3.0]), 8)
+    assert dequantize(codes, scale, zero_point)[1] == 0
+
+def test_pack_4bit_round_trip_odd_length():
+    codes = torch.tensor([1, 15, 0, 7, 9], dtype=torch.uint8)
+    assert torch.equal(unpack_4bit(pack_4bit(codes), len(codes)), codes)
+
+def test_topk_keeps_largest_magnitudes_and_zeroes_the_rest():
+    t = torch.tensor([0.1, -5.0, 0.2, 4.0, -0.3, 0.0])
+    groups, _ = decode_update(encode_update({'grads': [t]}, bits={'grads': 8}, topk_ratio={'grads': 1 / 3}))
+    decoded = groups['grads']['0']
+    assert torch.equal(decoded.nonzero().flatten(), torch.tensor([1, 3]))
+    assert torch.allclose(decoded[[1, 3]], t[[1, 3]], atol=9 / 255)
+
+def test_buffers_are_aligned():
+    data = encode_update({'weights': {'a': torch.ones(3), 'b': torch.ones(5)}})
+    assert is_update(data)
+    assert len(data) % 64 == 0
+
+def test_rejects_foreign_data_and_bad_settings():
+    with pytest.raises(ValueError):
+        decode_update(b'PK\x03\x04 not an update')
+    with pytest.raises(ValueError):
+        encode_update({'grads': [torch.ones(2)]}, bits={'grads': 6})
@@ -0,0 +1,174 @@
+"""
+Binary wire format for OBLIVION worker updates.
+
+A worker uploads one update file holding its trained weights and gradients:
+
+    b'OBLU' | u8 version | u32 header length | JSON header | buffers (64-byte aligned)
+
+The header lists each tensor's group, name, original dtype, shape, encoding
+and byte offset. Float tensors can be quantized per tensor to 8 or 4 bits
+(asymmetric: value = (q - zero_point) * scale, two 4-bit values per byte)
+and optionally sparsified to their top-k largest magnitudes, stored as
+int32 indices followed by the quantized values. Non-float tensors are always
+stored raw. The update hash is the Merkle root of the encoded bytes (see merkle.py).
+"""
+import json
+import os
+import struct
+
+import torch
+
+UPDATE_GRAD_BITS = int(os.environ.get("UPDATE_GRAD_BITS", "8"))  # 8 or 4 bits per gradient value (32 = raw)
+UPDATE_WEIGHT_BITS = int(os.environ.get("UPDATE_WEIGHT_BITS", "32"))  # Weights are what gets aggregated, raw by default
+UPDATE_TOPK_RATIO = float(os.environ.get("UPDATE_TOPK_RATIO", "0"))  # Fraction of gradient values kept (0 = dense)
+
+MAGIC = b'OBLU'
+VERSION = 1
+ALIGN = 64
+_PREAMBLE = len(MAGIC) + 1 + 4
+
+def _align(n: int) -> int:
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+def _named_tensors(tensors):
+    """Accept a state dict, a module, or a list of tensors (named by index)."""
+    if hasattr(tensors, 'state_dict'):
+        tensors = tensors.state_dict()
+    items = tensors.items() if isinstance(tensors, dict) else enumerate(tensors)
+    for name, t in items:
+        if t is None:
+            continue
+        if not isinstance(t, torch.Tensor):
+            t = torch.as_tensor(t, dtype=torch.float32)
+        yield str(name), t.detach().cpu().contiguous()
+
+def _raw_bytes(t: torch.Tensor) -> bytes:
+    return t.reshape(-1).view(torch.uint8).numpy().tobytes() if t.numel() else b''
+
+def quantize(values: torch.Tensor, bits: int):
+    """Asymmetric per-tensor quantization. Returns (uint8 codes, scale, zero_point)."""
+    qmax = (1 << bits) - 1
+    lo, hi = float(values.min()), float(values.max())
+    lo, hi = min(lo, 0.0), max(hi, 0.0)  # Keep 0 exactly representable (sparse gaps, ReLU outputs)
+    scale = (hi - lo) / qmax or 1.0
+    zero_point = min(max(round(-lo / scale), 0), qmax)
+    codes = torch.clamp(torch.round(values / scale) + zero_point, 0, qmax).to(torch.uint8)
+    return codes, scale, zero_point
+
+def dequantize(codes: torch.Tensor, scale: float, zero_point: int) -> torch.Tensor:
+    return (codes.float() - zero_point) * scale
+
+def pack_4bit(codes: torch.Tensor) -> torch.Tensor:
+    if codes.numel() % 2:
+        codes = torch.cat([codes, codes.new_zeros(1)])
+    return codes[0::2] | (codes[1::2] << 4)
+
+def unpack_4bit(packed: torch.Tensor, count: int) -> torch.Tensor:
+    codes = torch.stack([packed & 0x0F, packed >> 4], dim=1).reshape(-1)
+    return codes[:count]
+
+def _encode_tensor(t: torch.Tensor, bits: int, topk_ratio: float):
+    """Returns (header entry without offset, payload bytes)."""
+    entry = {
+        'dtype': str(t.dtype).replace('torch.', ''),
+        'shape': list(t.shape),
+        'encoding': 'raw',
+    }
+    if not t.is_floating_point() or bits >= 32 or t.numel() == 0:
+        return entry, _raw_bytes(t)
+
+    flat = t.reshape(-1).float()
+    payload = b''
+    if 0 < topk_ratio < 1:
+        k = max(1, int(flat.numel() * topk_ratio))
+        indices = flat.abs().topk(k, sorted=False).indices.sort().values
+        flat = flat[indices]
+        entry['topk'] = k
+        payload += indices.to(torch.int32).numpy().tobytes()
+
+    codes, scale, zero_point = quantize(flat, bits)
+    if bits == 4:
+        codes = pack_4bit(codes)
+    entry.update({'encoding': f'q{bits}', 'scale': scale, 'zero_point': zero_point})
+    return entry, payload + codes.numpy().tobytes()
+
+def encode_update(groups: dict, bits: dict = None, topk_ratio: dict = None, meta: dict = None) -> bytes:
+    """
+    Encode {group: tensors} into one update buffer. `bits` and `topk_ratio`
+    map group names to settings; groups not listed are stored raw and dense.
+    Groups with a None value are skipped.
+    """
+    bits = bits or {}
+    topk_ratio = topk_ratio or {}
+    for b in bits.values():
+        if b not in (4, 8, 32):
+            raise ValueError(f"Unsupported quantization width: {b} bits (expected 4, 8 or 32)")
+
+    entries, payloads = [], []
+    offset = 0
+    for group, tensors in groups.items():
+        if tensors is None:
+            continue
+        for name, t in _named_tensors(tensors):
+            entry, payload = _encode_tensor(t, bits.get(group, 32), topk_ratio.get(group, 0))
+            entry.update({'group': group, 'name': name, 'offset': offset, 'nbytes': len(payload)})
+            entries.append(entry)
+            payloads.append(payload)
+            offset = _align(offset + len(payload))
+
+    header = json.dumps({'tensors': entries, 'meta': meta or {}}).encode()
+    data_start = _align(_PREAMBLE + len(header))
+    out = bytearray(data_start + offset)
+    out[:_PREAMBLE + len(header)] = MAGIC + struct.pack('>BI', VERSION, len(header)) + header
+    for entry, payload in zip(entries, payloads):
+        start = data_start + entry['offset']
+        out[start:start + len(payload)] = payload
+    return bytes(out)
+
+def is_update(data: bytes) -> bool:
+    return data[:len(MAGIC)] == MAGIC
+
+def decode_update(data: bytes):
+    """Decode an update buffer into ({group: {name: tensor}}, meta), dequantizing to the original dtype."""
+    if not is_update(data):
+        raise ValueError("Not an OBLIVION update buffer")
+    version, header_len = struct.unpack('>BI', data[len(MAGIC):_PREAMBLE])
+    if version != VERSION:
+        raise ValueError(f"Unsupported update format version {version}")
+    header = json.loads(bytes(data[_PREAMBLE:_PREAMBLE + header_len]).decode())
+    data_start = _align(_PREAMBLE + header_len)
+    buffer = memoryview(data)
+
+    groups = {}
+    for entry in header['tensors']:
+        dtype = getattr(torch, entry['dtype'])
+        shape = entry['shape']
+        numel = 1
+        for dim in shape:
+            numel *= dim
+        start = data_start + entry['offset']
+        payload = buffer[start:start + entry['nbytes']]
+
+        if entry['encoding'] == 'raw':
+            if numel == 0:
+                t = torch.empty(shape, dtype=dtype)
+            else:
+                t = torch.frombuffer(bytearray(payload), dtype=dtype).reshape(shape)
+        else:
+            bits = int(entry['encoding'][1:])
+            count = entry.get('topk') or numel
+            indices = None
+            if entry.get('topk'):
+                indices = torch.frombuffer(bytearray(payload[:4 * count]), dtype=torch.int32).long()
+                payload = payload[4 * count:]
+            codes = torch.frombuffer(bytearray(payload), dtype=torch.uint8)
+            if bits == 4:
+                codes = unpack_4bit(codes, count)
+            values = dequantize(codes, entry['scale'], entry['zero_point'])
+            if indices is not None:
+                dense = torch.zeros(numel, dtype=torch.float32)
+                dense[indices] = values
+                values = dense
+            t = values.reshape(shape).to(dtype)
+        groups.setdefault(entry['group'], {})[entry['name']] = t
+    return groups, header['meta']
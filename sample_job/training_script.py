@@ -3,7 +3,6 @@ import torch.nn as nn
 import torch.optim as optim
 import pandas as pd
 import io
-import requests
 
 # Define the model architecture
 class Model(nn.Module):
@@ -26,14 +25,22 @@ def train(dataset_url):
         dataset_url (str): URL or path to the dataset.
     Returns:
         tuple: (list of gradients, float loss_value)
+            Optionally also (..., model or state_dict, int num_samples); the
+            sample count weights this update in FedAvg.
     """
     print(f"Loading dataset from: {dataset_url}")
     
     # 1. Load Data
     # Handle local file or URL
     if dataset_url.startswith('http'):
-        s = requests.get(dataset_url).content
-        df = pd.read_csv(io.StringIO(s.decode('utf-8')))
+        # open_dataset() is provided by the worker sandbox: it maps the worker's
+        # cached copy of the file. Network modules like requests can't be imported there.
+        try:
+            df = pd.read_csv(open_dataset(dataset_url))
+        except NameError:
+            import requests  # Running outside the sandbox
+            s = requests.get(dataset_url).content
+            df = pd.read_csv(io.StringIO(s.decode('utf-8')))
     else:
         # For local testing
         df = pd.read_csv(dataset_url)
@@ -129,6 +129,40 @@ class BrowserNeuralNetwork {
   }
 }
 
+// Rough float32 matmul throughput of this browser in GFLOP/s
+function measureGflops(size = 96, durationMs = 100): number {
+  const a = new Float32Array(size * size).map(() => Math.random());
+  const b = new Float32Array(size * size).map(() => Math.random());
+  const c = new Float32Array(size * size);
+  let runs = 0;
+  const start = performance.now();
+  while (performance.now() - start < durationMs) {
+    for (let i = 0; i < size; i++) {
+      for (let k = 0; k < size; k++) {
+        const aik = a[i * size + k];
+        for (let j = 0; j < size; j++) {
+          c[i * size + j] += aik * b[k * size + j];
+        }
+      }
+    }
+    runs++;
+  }
+  return (2 * size ** 3 * runs) / ((performance.now() - start) / 1000) / 1e9;
+}
+
+// What this browser can run; the claim RPCs only hand it jobs that fit (job_fits_node)
+function browserCapabilities() {
+  const deviceMemoryGb = (navigator as any).deviceMemory as number | undefined;
+  return {
+    cpu_cores: navigator.hardwareConcurrency || null,
+    // Only part of the device's memory is usable from one tab
+    memory_mb: deviceMemoryGb ? Math.round(deviceMemoryGb * 1024 / 4) : 512,
+    gflops: Math.round(measureGflops() * 10) / 10,
+    has_gpu: false,
+    cached_models: []
+  };
+}
+
 export class BrowserWorker {
   private config: WorkerConfig;
   private isRunning: boolean = false;
@@ -158,14 +192,19 @@ export class BrowserWorker {
     const hardwareId = `BROWSER-${this.config.walletAddress.slice(2, 10).toUpperCase()}`;
     
     try {
-      const { error } = await supabase.from('nodes').upsert({
+      const node = {
         hardware_id: hardwareId,
         wallet_address: this.config.walletAddress,
         status: 'active',
         last_seen: new Date().toISOString(),
         worker_type: 'browser',
         current_jobs: 0
-      }, { onConflict: 'hardware_id' });
+      };
+      let { error } = await supabase.from('nodes').upsert({ ...node, ...browserCapabilities() }, { onConflict: 'hardware_id' });
+      if (error?.code === 'PGRST204') {
+        // nodes table has no capability columns yet
+        ({ error } = await supabase.from('nodes').upsert(node, { onConflict: 'hardware_id' }));
+      }
       
       if (error) {
         console.error('[BrowserWorker] Node registration error:', error);
@@ -181,6 +220,18 @@ export class BrowserWorker {
         status: 'active'
       }).eq('hardware_id', hardwareId);
       
+      // Renew the lease on the running job so the reaper doesn't requeue it
+      if (this.currentJobId) {
+        try {
+          await supabase.rpc('renew_job_leases', {
+            p_provider_address: hardwareId,
+            p_job_ids: [this.currentJobId]
+          });
+        } catch (e) {
+          // Ignore renewal errors; the next heartbeat retries
+        }
+      }
+      
       // Cleanup stale jobs periodically
       try {
         await supabase.rpc('cleanup_stale_jobs');
@@ -216,7 +267,20 @@ export class BrowserWorker {
     if (!this.isRunning || this.currentJobId) return;
 
     try {
-      // Find ANY pending job (browser workers can process their own jobs too)
+      // Lease the oldest pending job this browser can run (capability-routed)
+      const { data: leased, error: leaseError } = await supabase.rpc('claim_job_fair_batch', {
+        p_provider_address: `BROWSER-${this.config.walletAddress.slice(2, 10).toUpperCase()}`,
+        p_limit: 1
+      });
+      if (!leaseError) {
+        if (leased && leased.length > 0) {
+          console.log('[BrowserWorker] Leased job:', leased[0].id);
+          await this.processJob(leased[0]);
+        }
+        return;
+      }
+      
+      // Fallback when the batch RPC isn't deployed: find ANY pending job
       const { data: jobs, error } = await supabase
         .from('jobs')
         .select('*')